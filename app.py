@@ -1,5 +1,6 @@
 from flask import Flask, render_template, flash, redirect, request, session, g
 from flask_debugtoolbar import DebugToolbarExtension
+from werkzeug.middleware.proxy_fix import ProxyFix
 from routes.user import user_bp
 from routes.playlists import playlist_bp
 from routes.songs import songs_bp
@@ -8,38 +9,90 @@ from routes.albums import albums_bp
 from helper_functions import (
     get_token,
     generic_search,
+    SEARCH_PAGE_SIZE,
 )
 
-from models import  connect_db, User
+from models import  connect_db, LazyUser, UserNotFound
+from http_cache import set_cache_headers
+from assets import init_assets
+from similarity import similarity
+from recommender import recommender
 
 import os
 
 CURR_USER_KEY = "curr_user"
+SEARCH_TYPES = ("track", "artist", "album")
 
 app = Flask(__name__)
+# Heroku's router appends the client address to X-Forwarded-For. Trust that
+# many hops, so request.remote_addr (and the login throttle keyed by it) is
+# the client's address, not the router's.
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(os.environ.get("TRUSTED_PROXY_HOPS", 1)))
 
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
     "DATABASE_URL", "postgresql:///maestro"
 )
 
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+if app.config["SQLALCHEMY_DATABASE_URI"].startswith("postgres"):
+    # Send bulk inserts as one multi-row INSERT instead of one per row.
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"executemany_mode": "values"}
 app.config["SQLALCHEMY_ECHO"] = False
 app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "maestro2468")
 app.config["DEBUG_TB_INTERCEPT_REDIRECTS"] = False
+# Seconds before a stored audio analysis is fetched again; unset = never.
+app.config["ANALYSIS_MAX_AGE"] = (
+    int(os.environ["ANALYSIS_MAX_AGE"]) if os.environ.get("ANALYSIS_MAX_AGE") else None
+)
 
 debug = DebugToolbarExtension(app)
 
+init_assets(app)
+
 connect_db(app)
 
+@app.before_first_request
+def start_background_models():
+    """Load the similar-songs index and the recommender in the background.
+
+    Started per worker on its first request rather than at import, so
+    forked workers each get their own threads.
+    """
+    similarity.start(app)
+    recommender.start(app)
+
 # User routes
 @app.before_request
 def add_user_to_g():
-    """If we're logged in, add curr user to Flask global."""
-    if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
+    """If we're logged in, add a lazily loaded curr user to Flask global.
+
+    Only the id is read from the session here; the User row is loaded the
+    first time a route or template needs more than the id.
+    """
+    g.pop('liked_tracks', None)
+    if request.endpoint != "static" and CURR_USER_KEY in session:
+        g.user = LazyUser(session[CURR_USER_KEY])
     else:
         g.user = None
 
+@app.errorhandler(UserNotFound)
+def handle_missing_user(e):
+    """Log out a session whose user was deleted."""
+    do_logout()
+    flash("Please log in again.", "danger")
+    return redirect("/")
+
+@app.after_request
+def log_out_missing_user(response):
+    """Log out a session whose user turned out to be deleted.
+
+    Routes catch exceptions broadly, so UserNotFound often never reaches
+    the error handler; LazyUser flags the miss on g instead.
+    """
+    if g.pop('missing_user', False):
+        return set_cache_headers(handle_missing_user(None))
+    return response
+
 def do_login(user):
     """Log in user."""
     session[CURR_USER_KEY] = user.id
@@ -70,14 +123,20 @@ def search():
         try:
             search_type = request.args.get("search_type")
             search_term = request.args.get("search_term")
-            if search_term and search_type:
+            page = max(request.args.get("page", 1, type=int), 1)
+            if search_term and search_type in SEARCH_TYPES:
                 token = get_token()
-                result = generic_search(search_type, search_term, token)
+                result = generic_search(
+                    search_type, search_term, token, offset=(page - 1) * SEARCH_PAGE_SIZE)
+                user.load_likes(item['track_id'] for item in result if item['type'] == 'track')
                 return render_template(
                     "/music/search_results.html",
                     result=result,
                     user=user,
                     search_term=search_term,
+                    search_type=search_type,
+                    page=page,
+                    has_next=len(result) == SEARCH_PAGE_SIZE,
                 )
             else:
                 return render_template("/music/search.html", user=user), 200
@@ -96,9 +155,5 @@ app.register_blueprint(playlist_bp, url_prefix='/playlists')
 
 @app.after_request
 def add_header(req):
-    """Add non-caching headers on every request."""
-    req.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    req.headers["Pragma"] = "no-cache"
-    req.headers["Expires"] = "0"
-    req.headers["Cache-Control"] = "public, max-age=0"
-    return req
+    """Apply the browser caching policy (see http_cache)."""
+    return set_cache_headers(req)
@@ -0,0 +1,115 @@
+"""Fingerprinted static assets.
+
+``python3 assets.py`` minifies every .js and .css file in static/, writes
+it to static/dist/ under a content-hashed name with a gzipped copy next to
+it, and records the names in static/dist/manifest.json. Run it on each
+deploy; on Heroku bin/post_compile does it during the build.
+
+Templates link assets with ``asset_url('app.js')``, which points at the
+hashed file when the manifest lists it and at the plain file otherwise, so
+the app still works before the first build. Hashed files never change, so
+they are served with a one-year immutable Cache-Control (see http_cache),
+and the .gz copy is sent to browsers that accept gzip.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+
+from flask import request, send_from_directory, url_for
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+EXTENSIONS = ('.js', '.css')
+
+# String literals, unquoted CSS url() values and // comments are matched
+# first and kept, so a /* inside them does not start a block comment (and a
+# quote inside a // comment does not start a string).
+_BLOCK_COMMENT = re.compile(
+    r"""("(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`|url\(\s*[^'"\s)][^)]*\)|//[^\n]*)"""
+    r'|/\*.*?\*/', re.S)
+
+
+def minify(source):
+    """Drop comments, indentation and blank lines.
+
+    Deliberately conservative: block comments are only removed outside
+    string literals and url() values, only whole-line // comments are
+    removed, and nothing else inside a line is rewritten.
+    """
+    source = _BLOCK_COMMENT.sub(lambda match: match.group(1) or '', source)
+    lines = (line.strip() for line in source.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//')) + '\n'
+
+
+def build(static_dir):
+    """Build static_dir/dist and its manifest; return the manifest."""
+    out_dir = os.path.join(static_dir, DIST)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {}
+    for name in sorted(os.listdir(static_dir)):
+        base, ext = os.path.splitext(name)
+        if ext not in EXTENSIONS:
+            continue
+        with open(os.path.join(static_dir, name)) as f:
+            body = minify(f.read()).encode()
+        hashed = f'{base}.{hashlib.sha256(body).hexdigest()[:10]}{ext}'
+        with open(os.path.join(out_dir, hashed), 'wb') as f:
+            f.write(body)
+        with open(os.path.join(out_dir, hashed + '.gz'), 'wb') as f:
+            f.write(gzip.compress(body, compresslevel=9, mtime=0))
+        manifest[name] = f'{DIST}/{hashed}'
+    with open(os.path.join(out_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_dir):
+    """Return the built manifest, or {} if assets were never built."""
+    try:
+        with open(os.path.join(static_dir, DIST, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def manifest_version(manifest):
+    """Return a short digest that changes whenever an asset's name does."""
+    raw = json.dumps(manifest, sort_keys=True).encode()
+    return hashlib.sha256(raw).hexdigest()[:10]
+
+
+def init_assets(app):
+    """Add the asset_url template helper and gzip-aware static serving to app."""
+    app.config['ASSET_MANIFEST'] = load_manifest(app.static_folder)
+    app.config['ASSET_VERSION'] = manifest_version(app.config['ASSET_MANIFEST'])
+
+    def asset_url(name):
+        filename = app.config['ASSET_MANIFEST'].get(name, name)
+        return url_for('static', filename=filename)
+
+    serve_plain = app.view_functions['static']
+
+    def static(filename):
+        if not filename.startswith(DIST + '/'):
+            return serve_plain(filename=filename)
+        gz_path = os.path.join(app.static_folder, filename + '.gz')
+        if request.accept_encodings['gzip'] and os.path.isfile(gz_path):
+            response = send_from_directory(app.static_folder, filename + '.gz')
+            response.mimetype = 'text/css' if filename.endswith('.css') else 'application/javascript'
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = serve_plain(filename=filename)
+        response.vary.add('Accept-Encoding')
+        return response
+
+    app.view_functions['static'] = static
+    app.jinja_env.globals['asset_url'] = asset_url
+
+
+if __name__ == '__main__':
+    static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    for name, hashed in build(static_dir).items():
+        print(f'{name} -> {hashed}')
@@ -0,0 +1,70 @@
+"""Compare full and streaming parsing of an /audio-analysis body.
+
+Run from the project root:
+
+    python3 benchmarks/bench_audio_analysis_parse.py
+
+A synthetic body shaped like Spotify's (meta, track, then thousands of
+bars, beats, sections, segments and tatums) is parsed the old way,
+``json.loads(body)['track']``, and with ``extract_json_member`` reading
+16 KiB chunks. Peak memory is measured with tracemalloc.
+"""
+
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helper_functions import extract_json_member
+
+CHUNK_SIZE = 16384
+RUNS = 5
+
+
+def make_body(segments=12000):
+    rnd = random.Random(1)
+    interval = lambda: {'start': rnd.random() * 300, 'duration': rnd.random(), 'confidence': rnd.random()}
+    data = {
+        'meta': {'analyzer_version': '4.0.0', 'platform': 'Linux', 'status_code': 0},
+        'track': {'duration': 255.3, 'tempo': 120.1, 'tempo_confidence': 0.7, 'key': 5,
+                  'key_confidence': 0.6, 'mode': 1, 'mode_confidence': 0.5, 'loudness': -6.2,
+                  'time_signature': 4, 'time_signature_confidence': 1.0,
+                  'codestring': 'x' * 20000, 'echoprintstring': 'y' * 60000},
+        'bars': [interval() for _ in range(500)],
+        'beats': [interval() for _ in range(2000)],
+        'sections': [dict(interval(), loudness=-8.0, tempo=120.0, key=5, mode=1) for _ in range(12)],
+        'segments': [dict(interval(), loudness_start=-20.0, loudness_max=-5.0,
+                          pitches=[rnd.random() for _ in range(12)],
+                          timbre=[rnd.random() for _ in range(12)]) for _ in range(segments)],
+        'tatums': [interval() for _ in range(4000)],
+    }
+    return json.dumps(data).encode()
+
+
+def measure(parse):
+    """Return (result, best time in ms, peak MiB); timing runs without tracemalloc."""
+    times = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        result = parse()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    parse()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, min(times) * 1000, peak / 1024 / 1024
+
+
+if __name__ == '__main__':
+    body = make_body()
+    chunks = lambda: (body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE))
+    print(f'body size: {len(body) / 1024 / 1024:.1f} MiB')
+    full, full_ms, full_mb = measure(lambda: json.loads(body)['track'])
+    streamed, stream_ms, stream_mb = measure(lambda: extract_json_member(chunks(), 'track'))
+    assert full == streamed
+    print(f'json.loads(body)["track"]   {full_ms:8.2f} ms  peak {full_mb:7.2f} MiB')
+    print(f'extract_json_member(track)  {stream_ms:8.2f} ms  peak {stream_mb:7.2f} MiB')
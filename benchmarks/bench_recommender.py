@@ -0,0 +1,50 @@
+"""Time building and updating the co-occurrence recommender.
+
+Run from the project root:
+
+    python3 benchmarks/bench_recommender.py [baskets]
+
+Builds a CoOccurrence model from random baskets (20k by default, 30 songs
+each, drawn with a skew towards popular songs out of 50k), then times
+recommendations and single-like incremental updates.
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from recommender import CoOccurrence
+
+SONGS = 50_000
+BASKET_SIZE = 30
+QUERIES = 200
+
+
+def main(n_baskets):
+    rng = np.random.default_rng(0)
+    picks = np.minimum(rng.zipf(1.3, size=(n_baskets, BASKET_SIZE)), SONGS) - 1
+    baskets = {('user', i): {f'track{j}' for j in row} for i, row in enumerate(picks)}
+    start = time.perf_counter()
+    model = CoOccurrence(baskets)
+    print(f'build {n_baskets} baskets, {len(model)} songs: {time.perf_counter() - start:.2f} s')
+
+    timings = []
+    for i in rng.integers(0, n_baskets, QUERIES):
+        start = time.perf_counter()
+        model.recommend([('user', int(i))])
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1000
+    print(f'recommend: median {np.median(timings):.2f} ms, p95 {np.percentile(timings, 95):.2f} ms')
+
+    start = time.perf_counter()
+    for i in range(100):
+        model.update([(('user', i), f'new{i}', 1)])
+    print(f'incremental like: {(time.perf_counter() - start) / 100 * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
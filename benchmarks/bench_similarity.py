@@ -0,0 +1,48 @@
+"""Time similar-song queries against a large in-memory index.
+
+Run from the project root:
+
+    python3 benchmarks/bench_similarity.py [rows]
+
+Builds a SimilarityIndex of random feature vectors (1M rows by default),
+then times single queries and a batch of incremental inserts.
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from similarity import SimilarityIndex, N_FEATURES
+
+QUERIES = 200
+
+
+def main(rows):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(rows, N_FEATURES)).astype(np.float32)
+    index = SimilarityIndex()
+    start = time.perf_counter()
+    index.add_many([f'track{i}' for i in range(rows)], vectors)
+    print(f'build {rows} rows: {time.perf_counter() - start:.2f} s')
+
+    queries = rng.normal(size=(QUERIES, N_FEATURES)).astype(np.float32)
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        index.query(query, k=10)
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1000
+    print(f'query k=10: median {np.median(timings):.2f} ms, p95 {np.percentile(timings, 95):.2f} ms')
+
+    start = time.perf_counter()
+    for i in range(1000):
+        index.add(f'new{i}', queries[i % QUERIES])
+    print(f'incremental add: {(time.perf_counter() - start) / 1000 * 1e6:.1f} us/song')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,75 @@
+"""Compare eager and lazy loading of the logged-in user per request.
+
+Run from the project root against a scratch database:
+
+    DATABASE_URL=postgresql:///maestro-test python3 benchmarks/bench_user_loading.py
+
+It times requests that only need the user id (a static asset and the
+unlike endpoint for a stored song) with the old ``User.query.get`` hook and
+with the current lazy hook, plus a page that needs the full row as a
+control.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'postgresql:///maestro-test')
+
+from sqlalchemy import event
+from flask import g, session
+
+from app import app, CURR_USER_KEY, add_user_to_g
+from models import db, User, Song
+
+REQUESTS = 500
+
+
+def eager_add_user_to_g():
+    """The previous hook: load the User row on every request."""
+    if CURR_USER_KEY in session:
+        g.user = User.query.get(session[CURR_USER_KEY])
+    else:
+        g.user = None
+
+
+def run(hook, path, method='get'):
+    app.before_request_funcs[None] = [hook]
+    queries = []
+    listener = lambda *args: queries.append(1)
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess[CURR_USER_KEY] = user_id
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        getattr(client, method)(path)
+    elapsed = time.perf_counter() - start
+    event.remove(db.engine, 'before_cursor_execute', listener)
+    return elapsed / REQUESTS * 1000, len(queries) / REQUESTS
+
+
+if __name__ == '__main__':
+    app.config['TESTING'] = True
+    app.config['DEBUG_TB_ENABLED'] = False
+    db.create_all()
+    user = User.query.filter_by(username='bench').first()
+    if user is None:
+        user = User(username='bench', password='x', email='bench@example.com')
+        db.session.add(user)
+        db.session.commit()
+    user_id = user.id
+    if Song.get_song('bench-track') is None:
+        db.session.add(Song(track_id='bench-track', track_name='bench', track_uri='bench-uri',
+                            artist_name='bench', artist_id='bench'))
+        db.session.commit()
+
+    for label, path, method in (('static asset', '/static/app.js', 'get'),
+                                ('unlike', '/songs/bench-track/unlike', 'post'),
+                                ('edit form (control)', '/user/edit', 'get')):
+        eager_ms, eager_q = run(eager_add_user_to_g, path, method)
+        lazy_ms, lazy_q = run(add_user_to_g, path, method)
+        print(f'{label:20} eager {eager_ms:6.3f} ms/req {eager_q:4.1f} queries | '
+              f'lazy {lazy_ms:6.3f} ms/req {lazy_q:4.1f} queries | '
+              f'saving {eager_ms - lazy_ms:6.3f} ms/req')
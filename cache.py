@@ -0,0 +1,237 @@
+"""Caches for upstream Spotify data.
+
+``LRUCache`` is a per-process cache. ``TieredCache`` puts one in front of an
+optional shared Redis tier, so every worker sees what any of them fetched
+and entries survive restarts. ``make_cache`` builds a TieredCache using the
+CACHE_BACKEND (``memory`` or ``redis``) and REDIS_URL environment variables.
+"""
+
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import redis
+
+
+class LRUCache:
+    """Bounded cache with least-recently-used eviction and a per-entry TTL.
+
+    Values are stored and handed out as-is, without copying, and are shared
+    by every request that hits them: treat them as read-only and build a
+    new dict or list when a result needs changing.
+    Keeps hit/miss/eviction counters so the size can be tuned from real
+    traffic; see ``stats()``.
+    """
+
+    def __init__(self, maxsize=256, ttl=600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default on a miss."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires_at = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        """Cache value under key for ttl seconds (the cache default if None)."""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key, loader, ttl=None):
+        """Return the cached value for key, calling loader() on a miss."""
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = loader()
+            self.set(key, value, ttl)
+        return value
+
+    def delete(self, key):
+        """Drop key from the cache."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Drop every entry and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Return hit/miss/eviction counts and the current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisTier:
+    """One namespace of cache entries in Redis, stored as zlib-compressed JSON.
+
+    Redis errors are treated as misses so a Redis outage only costs the
+    shared tier, not the request. So are values that do not decode (corrupt
+    or written in an older format), which are deleted.
+    """
+
+    def __init__(self, client, namespace, prefix='maestro:cache:'):
+        self.client = client
+        self.prefix = f'{prefix}{namespace}:'
+
+    def _key(self, key):
+        return self.prefix + json.dumps(key, separators=(',', ':'))
+
+    def get(self, key):
+        """Return (value, expires_at) for key, or None."""
+        try:
+            raw = self.client.get(self._key(key))
+        except redis.exceptions.RedisError:
+            return None
+        if raw is None:
+            return None
+        try:
+            item = json.loads(zlib.decompress(raw))
+            return item['v'], item['e']
+        except (zlib.error, ValueError, KeyError, TypeError):
+            self.delete(key)
+            return None
+
+    def set(self, key, value, ttl):
+        """Store value under key for ttl seconds."""
+        raw = zlib.compress(json.dumps({'v': value, 'e': time.time() + ttl},
+                                       separators=(',', ':')).encode())
+        try:
+            self.client.set(self._key(key), raw, px=max(1, int(ttl * 1000)))
+        except redis.exceptions.RedisError:
+            pass
+
+    def delete(self, key):
+        """Remove key if present."""
+        try:
+            self.client.delete(self._key(key))
+        except redis.exceptions.RedisError:
+            pass
+
+
+class TieredCache:
+    """A per-process LRUCache in front of an optional shared RedisTier.
+
+    Keys must be JSON serializable (tuples are fine) and so must values when
+    a Redis client is given. Entries found in Redis are copied into the
+    memory tier until the Redis entry would expire.
+    """
+
+    def __init__(self, namespace, maxsize=256, ttl=600, client=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.memory = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.remote = RedisTier(client, namespace) if client is not None else None
+        self.remote_hits = 0
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default on a miss in both tiers."""
+        missing = object()
+        value = self.memory.get(key, missing)
+        if value is not missing:
+            return value
+        if self.remote is not None:
+            item = self.remote.get(key)
+            if item is not None:
+                value, expires_at = item
+                remaining = expires_at - time.time()
+                if remaining > 0:
+                    self.remote_hits += 1
+                    self.memory.set(key, value, remaining)
+                    return value
+        return default
+
+    def set(self, key, value, ttl=None):
+        """Cache value under key in both tiers."""
+        ttl = self.ttl if ttl is None else ttl
+        self.memory.set(key, value, ttl)
+        if self.remote is not None:
+            self.remote.set(key, value, ttl)
+
+    def get_or_set(self, key, loader, ttl=None):
+        """Return the cached value for key, calling loader() on a miss."""
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = loader()
+            self.set(key, value, ttl)
+        return value
+
+    def delete(self, key):
+        """Drop key from both tiers."""
+        self.memory.delete(key)
+        if self.remote is not None:
+            self.remote.delete(key)
+
+    def clear(self):
+        """Drop this process's entries and reset the counters."""
+        self.memory.clear()
+        self.remote_hits = 0
+
+    def stats(self):
+        """Return hit/miss counts across both tiers plus memory tier details."""
+        stats = self.memory.stats()
+        hits = stats['hits'] + self.remote_hits
+        misses = stats['misses'] - self.remote_hits
+        stats.update(
+            namespace=self.namespace,
+            hits=hits,
+            misses=misses,
+            memory_hits=stats['hits'],
+            remote_hits=self.remote_hits,
+            hit_rate=round(hits / (hits + misses), 3) if hits + misses else 0.0,
+        )
+        return stats
+
+    def __len__(self):
+        return len(self.memory)
+
+
+_client = None
+
+
+def get_cache_client():
+    """Return the Redis client for the shared tier, or None for memory only."""
+    global _client
+    if _client is None and os.environ.get('CACHE_BACKEND', 'memory') == 'redis':
+        _client = redis.Redis.from_url(os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+    return _client
+
+
+def make_cache(namespace, maxsize=256, ttl=600):
+    """Return a TieredCache for namespace using the configured backend."""
+    return TieredCache(namespace, maxsize=maxsize, ttl=ttl, client=get_cache_client())
@@ -0,0 +1,161 @@
+"""Background enrichment of minimal song rows.
+
+Liking a song or adding it to a playlist only needs a songs row to point
+at, so routes store a pending row with Song.create_pending and hand the
+track id to ``enqueue``. A worker then fetches the track info and audio
+analysis from Spotify and fills the row in, retrying with backoff before
+marking it failed. A failed row is queued again by the next like or add
+once FAILED_COOLDOWN has passed, doubling with every further failure up to
+MAX_FAILED_COOLDOWN; each of those retries makes one attempt.
+
+Pick the queue with the ENRICHMENT_QUEUE environment variable:
+
+- ``thread`` (default): an in-process thread pool, fine for ``flask run``.
+- ``redis``: a Redis list at REDIS_URL, drained by ``python3 enrichment.py``
+  running next to the web workers.
+
+Both skip track ids that are already queued.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import redis
+from flask import current_app
+
+from models import db, Song, Playlist
+from helper_functions import get_token, get_audio_analysis
+
+MAX_ATTEMPTS = int(os.environ.get('ENRICHMENT_MAX_ATTEMPTS', 3))
+RETRY_DELAY = float(os.environ.get('ENRICHMENT_RETRY_DELAY', 1))
+FAILED_COOLDOWN = float(os.environ.get('ENRICHMENT_FAILED_COOLDOWN', 3600))
+MAX_FAILED_COOLDOWN = float(os.environ.get('ENRICHMENT_MAX_FAILED_COOLDOWN', 86400))
+
+
+def retry_due(song, max_attempts=MAX_ATTEMPTS, now=None):
+    """Has a failed song waited out its cooldown, so it may be fetched again?"""
+    if song.enrichment_status != Song.FAILED:
+        return False
+    if song.enrichment_failed_at is None:
+        return True
+    retries = max(song.enrichment_attempts - max_attempts, 0)
+    cooldown = min(FAILED_COOLDOWN * 2 ** retries, MAX_FAILED_COOLDOWN)
+    return ((now or datetime.utcnow()) - song.enrichment_failed_at).total_seconds() >= cooldown
+
+
+def enrich_song(track_id, max_attempts=MAX_ATTEMPTS, retry_delay=RETRY_DELAY):
+    """Fill in a pending song row; return True once it has its analysis.
+
+    Needs an app context. Failed fetches are retried with exponential
+    backoff; after max_attempts the row is marked failed and keeps its
+    minimal data. A failed row whose cooldown has passed gets one more
+    attempt.
+    """
+    song = Song.get_song(track_id)
+    if song is None:
+        return True
+    if not (song.needs_enrichment or retry_due(song, max_attempts)):
+        return song.enrichment_status != Song.FAILED
+    while True:
+        try:
+            song.update_analysis(get_audio_analysis(track_id, get_token()))
+            Playlist.touch_containing(song.id)
+            db.session.commit()
+            return True
+        except Exception:
+            db.session.rollback()
+            song.enrichment_attempts += 1
+            if song.enrichment_attempts >= max_attempts:
+                song.enrichment_status = Song.FAILED
+                song.enrichment_failed_at = datetime.utcnow()
+                db.session.commit()
+                return False
+            db.session.commit()
+            time.sleep(retry_delay * 2 ** (song.enrichment_attempts - 1))
+
+
+class ThreadPoolQueue:
+    """Enrich songs in this process's own worker threads."""
+
+    def __init__(self, max_workers=2):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._queued = {}
+        self._lock = threading.Lock()
+
+    def enqueue(self, track_id):
+        """Schedule track_id unless it is already queued."""
+        app = current_app._get_current_object()
+        with self._lock:
+            if track_id in self._queued:
+                return
+            self._queued[track_id] = self.executor.submit(self._run, app, track_id)
+
+    def _run(self, app, track_id):
+        try:
+            with app.app_context():
+                return enrich_song(track_id)
+        finally:
+            with self._lock:
+                self._queued.pop(track_id, None)
+
+    def wait(self, timeout=None):
+        """Block until every queued track has been processed."""
+        with self._lock:
+            futures = list(self._queued.values())
+        for future in futures:
+            future.result(timeout)
+
+
+class RedisQueue:
+    """Enrich songs in a separate worker process fed through Redis."""
+
+    def __init__(self, url, prefix='maestro:enrichment'):
+        self.client = redis.Redis.from_url(url)
+        self.list_key = prefix + ':queue'
+        self.set_key = prefix + ':queued'
+
+    def enqueue(self, track_id):
+        """Push track_id unless it is already queued."""
+        if self.client.sadd(self.set_key, track_id):
+            self.client.lpush(self.list_key, track_id)
+
+    def work(self, app, timeout=5):
+        """Process queued tracks forever."""
+        while True:
+            item = self.client.brpop(self.list_key, timeout=timeout)
+            if item is None:
+                continue
+            track_id = item[1].decode()
+            # Allow the track to be queued again while we work on it, so a
+            # request arriving now is not lost.
+            self.client.srem(self.set_key, track_id)
+            with app.app_context():
+                enrich_song(track_id)
+
+
+_queue = None
+
+
+def get_queue():
+    """Return the queue configured through the environment."""
+    global _queue
+    if _queue is None:
+        if os.environ.get('ENRICHMENT_QUEUE', 'thread') == 'redis':
+            _queue = RedisQueue(os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+        else:
+            _queue = ThreadPoolQueue(int(os.environ.get('ENRICHMENT_WORKERS', 2)))
+    return _queue
+
+
+def enqueue(song):
+    """Queue song for enrichment if it is pending or due a retry. Call after committing."""
+    if song.needs_enrichment or retry_due(song):
+        get_queue().enqueue(song.track_id)
+
+
+if __name__ == '__main__':
+    from app import app
+    get_queue().work(app)
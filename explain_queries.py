@@ -0,0 +1,65 @@
+"""Print EXPLAIN plans for the app's main queries.
+
+Run with ``python3 explain_queries.py [--analyze] [--no-seqscan]``.
+
+On a small database Postgres prefers sequential scans whatever indexes
+exist, so ``--no-seqscan`` disables them for the session to show which
+index each query would use once the tables grow.
+"""
+
+import argparse
+
+from sqlalchemy import tuple_
+from sqlalchemy.dialects import postgresql
+
+from models import db, User, Playlist, PlaylistSong, Song, Like
+from app import app
+
+
+def main_queries(user_id, playlist_id, song_id, track_id):
+    """Return (label, query) pairs for the app's hot access paths."""
+    return [
+        ('is_liked', Like.query.filter_by(user_id=user_id, song_id=track_id)),
+        ('load_likes', db.session.query(Like.song_id).filter(
+            Like.user_id == user_id, Like.song_id.in_([track_id, 'other']))),
+        ('playlists by user', Playlist.query.filter(Playlist.user_id == user_id)),
+        ('playlists page', Playlist.query.filter(
+            Playlist.user_id == user_id, Playlist.id > 100).order_by(Playlist.id).limit(51)),
+        ('playlist songs', PlaylistSong.query.filter(PlaylistSong.playlist_id == playlist_id)),
+        ('playlist songs page', PlaylistSong.query.filter(
+            PlaylistSong.playlist_id == playlist_id,
+            tuple_(PlaylistSong.position, PlaylistSong.id) > tuple_(102400, 100),
+        ).order_by(PlaylistSong.position, PlaylistSong.id).limit(101)),
+        ('liked songs page', Like.query.filter(
+            Like.user_id == user_id,
+            tuple_(Like.timestamp, Like.id) < tuple_(db.text("'2024-01-01'::timestamp"), 100),
+        ).order_by(Like.timestamp.desc(), Like.id.desc()).limit(51)),
+        ('playlist entry', PlaylistSong.query.filter(
+            PlaylistSong.playlist_id == playlist_id, PlaylistSong.song_id == song_id)),
+        ('playlists containing song', PlaylistSong.query.filter(PlaylistSong.song_id == song_id)),
+        ('song by track_id', Song.query.filter(Song.track_id == track_id)),
+        ('user by username', User.query.filter_by(username='maestro')),
+    ]
+
+
+def explain(query, analyze=False):
+    """Return the EXPLAIN output lines for a SQLAlchemy query."""
+    sql = str(query.statement.compile(
+        dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN ANALYZE ' if analyze else 'EXPLAIN '
+    return [row[0] for row in db.session.execute(prefix + sql)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--analyze', action='store_true', help='run the queries (EXPLAIN ANALYZE)')
+    parser.add_argument('--no-seqscan', action='store_true', help='disable sequential scans')
+    args = parser.parse_args()
+
+    if args.no_seqscan:
+        db.session.execute('SET enable_seqscan = off')
+    for label, query in main_queries(user_id=1, playlist_id=1, song_id=1, track_id='track'):
+        print(f'== {label}')
+        for line in explain(query, args.analyze):
+            print(f'   {line}')
+    db.session.rollback()
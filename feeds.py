@@ -0,0 +1,93 @@
+"""Upstream data shared by every user and refreshed in the background."""
+
+import os
+import threading
+import time
+
+from shared_store import get_store
+from helper_functions import get_token, get_pop_recommendations
+
+
+class SharedFeed:
+    """A value fetched once and shared by all users and workers.
+
+    The value lives in a shared store (see shared_store). Readers never wait
+    on the upstream call: ``get()`` returns whatever is stored, even if it is
+    older than ``refresh_interval``, and leaves refreshing to a background
+    thread (stale-while-revalidate). The first ``get()`` in a worker starts a
+    scheduler thread that refreshes the feed every ``refresh_interval``
+    seconds; the store lock and a freshness re-check mean only one worker
+    calls upstream per interval.
+    """
+
+    def __init__(self, name, fetch, store, refresh_interval=3600, max_stale=86400, default=None):
+        self.key = f'feed:{name}'
+        self.fetch = fetch
+        self.store = store
+        self.refresh_interval = refresh_interval
+        self.max_stale = max_stale
+        self.default = default
+        self._scheduler = None
+        self._refreshing = threading.Lock()
+        self._start_lock = threading.Lock()
+
+    def get(self):
+        """Return the stored value (possibly stale) without calling upstream."""
+        self.start()
+        item = self.store.get(self.key)
+        if item is None or self._is_stale(item):
+            self.refresh_async()
+        return item['value'] if item else self.default
+
+    def refresh(self):
+        """Fetch a new value unless another caller is doing it or it is fresh."""
+        with self.store.lock(self.key, blocking=False) as acquired:
+            if not acquired:
+                return
+            item = self.store.get(self.key)
+            if item is not None and not self._is_stale(item):
+                return
+            value = self.fetch()
+            self.store.set(self.key, {'value': value, 'fetched_at': time.time()}, ttl=self.max_stale)
+
+    def refresh_async(self):
+        """Refresh in a background thread, at most one at a time per worker."""
+        if not self._refreshing.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self.refresh()
+            except Exception:
+                # Keep serving the stale value; the scheduler tries again.
+                pass
+            finally:
+                self._refreshing.release()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def start(self):
+        """Start the periodic refresh thread for this worker, once."""
+        if self._scheduler is not None:
+            return
+        with self._start_lock:
+            if self._scheduler is None:
+                self._scheduler = threading.Thread(target=self._schedule, daemon=True)
+                self._scheduler.start()
+
+    def _schedule(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            self.refresh_async()
+
+    def _is_stale(self, item):
+        return time.time() - item['fetched_at'] >= self.refresh_interval
+
+
+pop_recommendations = SharedFeed(
+    'pop_recommendations',
+    lambda: get_pop_recommendations(get_token()),
+    get_store(),
+    refresh_interval=int(os.environ.get('RECOMMENDATIONS_REFRESH', 3600)),
+    default=[],
+)
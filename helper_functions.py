@@ -1,8 +1,21 @@
 from dotenv import load_dotenv
 import os
 import base64
-from requests import post, get
+import codecs
+import json
+import re
+import threading
+import time
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import dotenv
+from cache import make_cache
+from rate_limit import TokenBucket
+from shared_store import MemoryStore, get_store
+from token_manager import TokenManager
 
 dotenv.load_dotenv('.env')
 
@@ -13,37 +26,280 @@ mode = ['Minor', 'Major']
 client_id = os.environ.get('CLIENT_ID', os.getenv('CLIENT_ID'))
 client_secret = os.environ.get('CLIENT_SECRET', os.getenv('CLIENT_SECRET'))
 
-def get_token():
-    auth_string = f'{client_id}:{client_secret}'
-    auth_bytes = auth_string.encode('utf-8')
-    auth_base64 = str(base64.b64encode(auth_bytes), 'utf-8')
-    url = 'https://accounts.spotify.com/api/token'
-    headers = {
-        'Authorization': f'Basic {auth_base64}',
-        'Content-Type': 'application/x-www-form-urlencoded'
-    }
-    data = {'grant_type': 'client_credentials'}
-    result = post(url, headers=headers, data=data)
-    token = result.json()['access_token']
-    return token
+API_URL = 'https://api.spotify.com/v1'
+TOKEN_URL = 'https://accounts.spotify.com/api/token'
+SEARCH_PAGE_SIZE = 10
+ALBUMS_PAGE_SIZE = 50
+ALBUM_TRACKS_PAGE_SIZE = 50
+
+def normalize_search_term(search_term):
+    """Lower-case a search term and collapse its whitespace."""
+    return ' '.join(search_term.lower().split())
 
 def get_auth_header(token):
     return {'Authorization' : f'Bearer {token}'}
 
-def get_albums(artist_id, token):
-    url = f'https://api.spotify.com/v1/artists/{artist_id}/albums?market=US'
-    headers = get_auth_header(token)
-    result = get(url, headers=headers)
-    json_result = result.json()['items']
-    album_set = set()
-    album_list = []
-    for item in json_result:
-        id = item['id']
-        release = item['release_date']
-        name = item['name']
-        album_key = f'{id}_{release}_{name}'
-        if album_key not in album_set:
-            album_set.add(album_key)
+def retry_after(response, default=1):
+    """Return the seconds a 429 response asks us to wait."""
+    try:
+        return max(0, float(response.headers.get('Retry-After', default)))
+    except (TypeError, ValueError):
+        return default
+
+def chunked(items, size):
+    """Split a list into lists of at most size items."""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+_fanout = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('SPOTIFY_FANOUT_WORKERS', 8)), thread_name_prefix='spotify')
+_in_fanout = threading.local()
+
+def _run_in_fanout(call):
+    _in_fanout.active = True
+    try:
+        return call()
+    finally:
+        _in_fanout.active = False
+
+def run_parallel(*calls):
+    """Run independent zero-argument callables concurrently.
+
+    Returns their results in the order given. If any call raises, calls that
+    have not started are cancelled and the first error is re-raised. Calls
+    made from inside the pool run inline so nested fan-outs cannot exhaust
+    the bounded pool and deadlock.
+    """
+    if len(calls) < 2 or getattr(_in_fanout, 'active', False):
+        return [call() for call in calls]
+    futures = [_fanout.submit(_run_in_fanout, call) for call in calls]
+    done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+    for future in futures:
+        if future in done and future.exception() is not None:
+            for other in pending:
+                other.cancel()
+            raise future.exception()
+    return [future.result() for future in futures]
+
+_JSON_STRUCTURE = re.compile(r'["{}\[\]:]')
+_JSON_STRING_END = re.compile(r'["\\]')
+
+def extract_json_member(chunks, member):
+    """Return one top-level member of a JSON object streamed as byte chunks.
+
+    Only the text up to the end of the member's value is read and parsed;
+    the rest of the stream is never consumed. Scanned text before the
+    current position is dropped, so memory stays bounded by the size of the
+    member plus one chunk. Raises KeyError if the object has no such member.
+    """
+    chunks = iter(chunks)
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    json_decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    depth = 0
+    in_string = False
+    string_start = None
+    last_key = None
+    while True:
+        while pos < len(buf):
+            if in_string:
+                match = _JSON_STRING_END.search(buf, pos)
+                if match is None:
+                    pos = len(buf)
+                    break
+                if match.group() == '\\':
+                    if match.end() >= len(buf):
+                        pos = match.start()
+                        break
+                    pos = match.end() + 1
+                    continue
+                in_string = False
+                pos = match.end()
+                if depth == 1:
+                    last_key = buf[string_start:pos]
+                continue
+            match = _JSON_STRUCTURE.search(buf, pos)
+            if match is None:
+                pos = len(buf)
+                break
+            char = match.group()
+            pos = match.end()
+            if char == '"':
+                in_string = True
+                string_start = match.start()
+            elif char in '{[':
+                depth += 1
+            elif char in '}]':
+                depth -= 1
+            elif depth == 1 and last_key is not None and json.loads(last_key) == member:
+                while True:
+                    start = pos
+                    while start < len(buf) and buf[start] in ' \t\r\n':
+                        start += 1
+                    try:
+                        value, end = json_decoder.raw_decode(buf, start)
+                        # A number is only complete once a delimiter follows it.
+                        if isinstance(value, (dict, list, str)) or (
+                                end < len(buf) and buf[end] in ' \t\r\n,}]'):
+                            return value
+                    except json.JSONDecodeError:
+                        pass
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        return json_decoder.raw_decode(buf, start)[0]
+                    buf += text_decoder.decode(chunk)
+        chunk = next(chunks, None)
+        if chunk is None:
+            raise KeyError(member)
+        keep = string_start if in_string else pos
+        buf = buf[keep:] + text_decoder.decode(chunk)
+        pos -= keep
+        if in_string:
+            string_start = 0
+
+class SpotifyClient:
+    """Spotify Web API client that keeps its connections alive.
+
+    One instance holds a pooled requests.Session, so every route in a worker
+    reuses the same TCP+TLS connections. Each call has a connect/read
+    timeout and idempotent calls are retried a bounded number of times with
+    exponential backoff on connection errors and 5xx responses.
+
+    Every call first takes a token from rate_limiter (a rate_limit.TokenBucket,
+    shared between workers when its store is), waiting up to queue_timeout
+    seconds for one. A 429 pauses the shared bucket for the Retry-After
+    period and the call is retried, at most rate_limit_retries times. A 401
+    means the access token was revoked or expired early: if renew_token (a
+    callable taking the rejected token and returning a fresh one) is set,
+    the call is retried once with the fresh token.
+
+    Album bodies are kept parsed in a cache keyed by album id, so the album
+    summary, track list and art all come from one fetch. Search pages are
+    cached the same way, keyed by (type, normalized term, offset, limit),
+    complete artist discographies by (artist, include_groups), and track
+    info and audio analyses by track id. Each is a cache.TieredCache in its
+    own namespace, shared between workers through Redis when CACHE_BACKEND
+    is set to redis.
+    """
+
+    def __init__(self, pool_connections=4, pool_maxsize=16, connect_timeout=3.05,
+                 read_timeout=10, retries=3, backoff_factor=0.3,
+                 album_cache_size=256, album_cache_ttl=3600,
+                 search_cache_size=512, search_cache_ttl=600,
+                 discography_cache_size=256, discography_cache_ttl=3600,
+                 track_cache_size=2048, track_cache_ttl=86400,
+                 analysis_cache_size=512, analysis_cache_ttl=86400,
+                 discography_concurrency=4, rate_limiter=None, queue_timeout=10,
+                 rate_limit_retries=2):
+        self.album_cache = make_cache('album', album_cache_size, album_cache_ttl)
+        self.search_cache = make_cache('search', search_cache_size, search_cache_ttl)
+        self.discography_cache = make_cache('discography', discography_cache_size, discography_cache_ttl)
+        self.track_cache = make_cache('track', track_cache_size, track_cache_ttl)
+        self.analysis_cache = make_cache('analysis', analysis_cache_size, analysis_cache_ttl)
+        self.discography_concurrency = discography_concurrency
+        self.timeout = (connect_timeout, read_timeout)
+        self.rate_limiter = rate_limiter or TokenBucket(MemoryStore())
+        self.queue_timeout = queue_timeout
+        self.rate_limit_retries = rate_limit_retries
+        self.renew_token = None
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'POST']),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+
+    def _get(self, path, token, params=None, stream=False):
+        def send(token):
+            return lambda: self.session.get(
+                f'{API_URL}/{path}', headers=get_auth_header(token), params=params,
+                timeout=self.timeout, stream=stream)
+        try:
+            return self._send(send(token))
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 401 or self.renew_token is None:
+                raise
+            e.response.close()
+            return self._send(send(self.renew_token(token)))
+
+    def _send(self, send):
+        """Call send() through the rate limiter, waiting out 429 responses."""
+        deadline = time.time() + self.queue_timeout
+        for attempt in range(self.rate_limit_retries + 1):
+            self.rate_limiter.acquire(deadline)
+            result = send()
+            if result.status_code != 429 or attempt == self.rate_limit_retries:
+                break
+            result.close()
+            self.rate_limiter.pause(retry_after(result))
+        result.raise_for_status()
+        return result
+
+    def get_audio_analysis_track(self, track_id, token):
+        """Return the "track" section of /audio-analysis without parsing the rest.
+
+        The body (often megabytes of bars, beats and segments) is streamed
+        and the connection is closed as soon as the section has been read.
+        """
+        with closing(self._get(f'audio-analysis/{track_id}', token, stream=True)) as result:
+            return extract_json_member(result.iter_content(chunk_size=16384), 'track')
+
+    def request_token(self):
+        """Request a new client-credentials token; return (token, expires_in)."""
+        auth_string = f'{client_id}:{client_secret}'
+        auth_bytes = auth_string.encode('utf-8')
+        auth_base64 = str(base64.b64encode(auth_bytes), 'utf-8')
+        headers = {
+            'Authorization': f'Basic {auth_base64}',
+            'Content-Type': 'application/x-www-form-urlencoded'
+        }
+        data = {'grant_type': 'client_credentials'}
+        result = self._send(lambda: self.session.post(
+            TOKEN_URL, headers=headers, data=data, timeout=self.timeout))
+        json_result = result.json()
+        return json_result['access_token'], json_result.get('expires_in', 3600)
+
+    def get_albums(self, artist_id, token, include_groups=None):
+        """Return the artist's complete discography, deduplicated by album id.
+
+        The first page tells us the total; the remaining pages are fetched
+        in parallel, at most discography_concurrency at a time. Results are
+        cached per (artist, include_groups).
+        """
+        key = (artist_id, include_groups)
+        return self.discography_cache.get_or_set(
+            key, lambda: self._get_discography(artist_id, token, include_groups))
+
+    def _get_albums_page(self, artist_id, token, include_groups, offset):
+        params = {'market': 'US', 'limit': ALBUMS_PAGE_SIZE, 'offset': offset}
+        if include_groups:
+            params['include_groups'] = include_groups
+        return self._get(f'artists/{artist_id}/albums', token, params=params).json()
+
+    def _get_discography(self, artist_id, token, include_groups):
+        first = self._get_albums_page(artist_id, token, include_groups, 0)
+        items = list(first['items'])
+        offsets = list(range(ALBUMS_PAGE_SIZE, first['total'], ALBUMS_PAGE_SIZE))
+        for wave in chunked(offsets, self.discography_concurrency):
+            pages = run_parallel(*[
+                lambda offset=offset: self._get_albums_page(artist_id, token, include_groups, offset)
+                for offset in wave
+            ])
+            for page in pages:
+                items.extend(page['items'])
+
+        album_list = []
+        seen = set()
+        for item in items:
+            if item['id'] in seen:
+                continue
+            seen.add(item['id'])
             album_art = item['images'][0]['url'] if len(item['images']) > 0 and item['images'][0]['url'] else 'https://example.com/default_album_art.jpg'
             album_list.append({
                 'album_id': item['id'],
@@ -54,163 +310,307 @@ def get_albums(artist_id, token):
                 'release_date': item['release_date'],
                 'total_tracks': item['total_tracks'],
             })
-    return album_list
+        return album_list
+
+    def get_pop_recommendations(self, token):
+        result = self._get('recommendations', token, params={'limit': 10, 'seed_genres': 'pop'})
+        json_result = result.json()['tracks']
+        tracks = []
+        for item in json_result:
+            tracks.append({
+                'track_id': item['id'],
+                'track_name': item['name'],
+                'track_uri': item['uri'],
+                'artist_name': item['artists'][0]['name'],
+                'artist_id': item['artists'][0]['id'],
+                'album': item['album']['name'],
+                'album_id': item['album']['id'],
+                'album_art': item['album']['images'][0]['url']
+            })
+        return tracks
+
+    def get_album_payload(self, album_id, token):
+        """Return the parsed /albums/{id} body, served from the album cache.
+
+        /albums/{id} only embeds the first page of tracks; the rest are
+        fetched in parallel like discography pages, so tracks.items is
+        always the complete track list.
+        """
+        return self.album_cache.get_or_set(album_id, lambda: self._get_album(album_id, token))
+
+    def _get_album(self, album_id, token):
+        album = self._get(f'albums/{album_id}', token).json()
+        tracks = album['tracks']
+        if tracks.get('next'):
+            offsets = list(range(len(tracks['items']), tracks['total'], ALBUM_TRACKS_PAGE_SIZE))
+            for wave in chunked(offsets, self.discography_concurrency):
+                pages = run_parallel(*[
+                    lambda offset=offset: self._get(f'albums/{album_id}/tracks', token, params={
+                        'limit': ALBUM_TRACKS_PAGE_SIZE, 'offset': offset}).json()
+                    for offset in wave
+                ])
+                for page in pages:
+                    tracks['items'].extend(page['items'])
+            tracks['next'] = None
+        return album
+
+    def get_album(self, album_id, token):
+        json_result = self.get_album_payload(album_id, token)
+        album = {
+            'album_id': json_result['id'],
+            'album_name': json_result['name'],
+            'album_art': json_result['images'][0]['url'],
+            'artist_name': json_result['artists'][0]['name'],
+            'artist_id': json_result['artists'][0]['id'],
+            'release_date': json_result['release_date'],
+            'total_tracks': json_result['total_tracks'],
+            'popularity': json_result['popularity']
+        }
+        return album
+
+    def get_album_tracks(self, album_id, token):
+        album = self.get_album_payload(album_id, token)
+        json_result = album['tracks']['items']
+        release_date = album['release_date']
+        popularity = album['popularity']
+        album_art = album['images'][0]['url']
+        tracks = []
+        for item in json_result:
+            tracks.append({
+                'album_id': album_id,
+                'album_name': item['name'],
+                'album_art': album_art,
+                'track_id': item['id'],
+                'release_date': release_date,
+                'track_name': item['name'],
+                'track_uri': item['uri'],
+                'artist_name': item['artists'][0]['name'],
+                'artist_id': item['artists'][0]['id'],
+                'duration': round(item['duration_ms'] / 60000, 2),
+                'explicit': item['explicit'],
+                'track_number': item['track_number'],
+                'popularity': popularity
+            })
+        return tracks
+
+    def get_album_art(self, album_id, token):
+        return self.get_album_payload(album_id, token)['images'][0]['url']
+
+    def get_track_info(self, track_id, token):
+        return self.track_cache.get_or_set(
+            track_id, lambda: self._track_info(self._get(f'tracks/{track_id}', token).json()))
+
+    @staticmethod
+    def _track_info(json_result):
+        track_info = {
+            'track_id': json_result['id'],
+            'track_name': json_result['name'],
+            'track_uri': json_result['uri'],
+            'artist_name': json_result['artists'][0]['name'],
+            'artist_id': json_result['artists'][0]['id'],
+            'album': json_result['album']['name'],
+            'album_id': json_result['album']['id'],
+            'album_art': json_result['album']['images'][0]['url']
+        }
+
+        return track_info
+
+    def get_tracks(self, track_ids, token):
+        """Return {track_id: track info} using /tracks?ids=, 50 ids per call.
+
+        Cached tracks are not fetched again; the rest are fetched in
+        parallel chunks. Ids Spotify doesn't know are left out.
+        """
+        tracks = {}
+        for track_id in track_ids:
+            info = self.track_cache.get(track_id)
+            if info is not None:
+                tracks[track_id] = info
+        missing = [track_id for track_id in track_ids if track_id not in tracks]
+        pages = run_parallel(*[
+            lambda chunk=chunk: self._get('tracks', token, params={'ids': ','.join(chunk)}).json()['tracks']
+            for chunk in chunked(missing, 50)
+        ])
+        for page in pages:
+            for item in page:
+                if item:
+                    info = self._track_info(item)
+                    self.track_cache.set(item['id'], info)
+                    tracks[item['id']] = info
+        return tracks
+
+    def get_audio_features(self, track_ids, token):
+        """Return {track_id: analysis fields} using /audio-features?ids=, 100 ids per call.
+
+        Audio features carry no confidence values, so those are None; the
+        full analysis can fill them in later.
+        """
+        pages = run_parallel(*[
+            lambda chunk=chunk: self._get('audio-features', token, params={'ids': ','.join(chunk)}).json()['audio_features']
+            for chunk in chunked(track_ids, 100)
+        ])
+        features = {}
+        for page in pages:
+            for item in page:
+                if not item:
+                    continue
+                features[item['id']] = {
+                    'duration': round(item['duration_ms'] / 60000, 2),
+                    'key': keys[item['key']] if item['key'] >= 0 else None,
+                    'key_confidence': None,
+                    'mode': mode[item['mode']],
+                    'mode_confidence': None,
+                    'time_signature': item['time_signature'],
+                    'time_signature_confidence': None,
+                    'tempo': round(item['tempo']),
+                    'tempo_confidence': None,
+                    'loudness': item['loudness'],
+                }
+        return features
+
+    def get_audio_analysis(self, track_id, token):
+        """Return track info plus the audio analysis, served from the analysis cache."""
+        return self.analysis_cache.get_or_set(
+            track_id, lambda: self._get_audio_analysis(track_id, token))
+
+    def _get_audio_analysis(self, track_id, token):
+        # The analysis and the track info don't depend on each other.
+        data, track_info = run_parallel(
+            lambda: self.get_audio_analysis_track(track_id, token),
+            lambda: self.get_track_info(track_id, token),
+        )
+        analysis = {
+                'duration': round(data['duration'] / 60, 2),
+                'key': keys[data['key']],
+                'key_confidence': round(data['key_confidence'] * 100),
+                'mode': mode[data['mode']],
+                'mode_confidence': round(data['mode_confidence'] * 100),
+                'time_signature': data['time_signature'],
+                'time_signature_confidence': round(data['time_signature_confidence'] * 100),
+                'tempo': round(data['tempo']),
+                'tempo_confidence': round(data['tempo_confidence'] * 100),
+                'loudness': data['loudness'],
+            }
+        analysis.update(track_info)
+        return analysis
+
+    def generic_search(self, search_type, search_term, token, offset=0, limit=SEARCH_PAGE_SIZE):
+        """Search Spotify, serving repeated (type, term, offset, limit) lookups from cache."""
+        key = (search_type, normalize_search_term(search_term), offset, limit)
+        return self.search_cache.get_or_set(
+            key, lambda: self._search(search_type, key[1], token, offset, limit))
+
+    def _search(self, search_type, search_term, token, offset, limit):
+        default_image = 'https://images.unsplash.com/photo-1601066525716-3cca33c6d4c6?ixlib=rb-4.0.3&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=1050&q=80'
+        params = {'q': search_term, 'type': search_type, 'limit': limit, 'offset': offset}
+        search_result = self._get('search', token, params=params)
+        items = search_result.json()[search_type + 's']['items']
+        result = []
+
+        for item in items:
+            if search_type == 'track':
+                image_field = item['album']['images']
+                attributes = {
+                    'name': item['name'],
+                    'artist': item['artists'][0]['name'],
+                    'artist_id': item['artists'][0]['id'],
+                    'track_id': item['id'],
+                    'album': item['album']['name'],
+                    'album_id': item['album']['id'],
+                    'id': item['id'],
+                    'type': 'track',
+                }
+            elif search_type == 'artist':
+                image_field = item['images']
+                attributes = {
+                    'name': item['name'],
+                    'id': item['id'],
+                    'type': 'artist',
+                    'artist_id': item['id'],
+                }
+            elif search_type == 'album':
+                image_field = item['images']
+                attributes = {
+                    'image': item['images'][0]['url'],
+                    'name': item['name'],
+                    'artist': item['artists'][0]['name'],
+                    'artist_id': item['artists'][0]['id'],
+                    'id': item['id'],
+                    'type': 'album',
+                    'album_id': item['id'],
+                }
+
+            if not image_field:
+                image_field.append({'url': default_image})
+
+            attributes['image'] = image_field[0]['url']
+            result.append(attributes)
+
+        return result
+
+spotify = SpotifyClient(
+    pool_maxsize=int(os.environ.get('SPOTIFY_POOL_SIZE', 16)),
+    connect_timeout=float(os.environ.get('SPOTIFY_CONNECT_TIMEOUT', 3.05)),
+    read_timeout=float(os.environ.get('SPOTIFY_READ_TIMEOUT', 10)),
+    retries=int(os.environ.get('SPOTIFY_RETRIES', 3)),
+    album_cache_size=int(os.environ.get('ALBUM_CACHE_SIZE', 256)),
+    album_cache_ttl=int(os.environ.get('ALBUM_CACHE_TTL', 3600)),
+    search_cache_size=int(os.environ.get('SEARCH_CACHE_SIZE', 512)),
+    search_cache_ttl=int(os.environ.get('SEARCH_CACHE_TTL', 600)),
+    track_cache_size=int(os.environ.get('TRACK_CACHE_SIZE', 2048)),
+    track_cache_ttl=int(os.environ.get('TRACK_CACHE_TTL', 86400)),
+    analysis_cache_size=int(os.environ.get('ANALYSIS_CACHE_SIZE', 512)),
+    analysis_cache_ttl=int(os.environ.get('ANALYSIS_CACHE_TTL', 86400)),
+    discography_concurrency=int(os.environ.get('DISCOGRAPHY_CONCURRENCY', 4)),
+    rate_limiter=TokenBucket(
+        get_store(),
+        rate=float(os.environ.get('SPOTIFY_RATE', 10)),
+        capacity=int(os.environ.get('SPOTIFY_BURST', 20)),
+    ),
+    queue_timeout=float(os.environ.get('SPOTIFY_QUEUE_TIMEOUT', 10)),
+)
+
+token_manager = TokenManager(
+    spotify.request_token,
+    get_store(),
+    refresh_margin=int(os.environ.get('TOKEN_REFRESH_MARGIN', 300)),
+)
+
+spotify.renew_token = token_manager.replace
+
+def get_token():
+    """Return the cached access token, refreshing it when it is about to expire."""
+    return token_manager.get_token()
+
+def get_albums(artist_id, token, include_groups=None):
+    return spotify.get_albums(artist_id, token, include_groups)
 
 def get_pop_recommendations(token):
-    url = 'https://api.spotify.com/v1/recommendations?limit=10&seed_genres=pop'
-    headers = get_auth_header(token)
-    result = get(url, headers=headers)
-    json_result = result.json()['tracks']
-    tracks = []
-    for item in json_result:
-        tracks.append({
-            'track_id': item['id'],
-            'track_name': item['name'],
-            'track_uri': item['uri'],
-            'artist_name': item['artists'][0]['name'],
-            'artist_id': item['artists'][0]['id'],
-            'album': item['album']['name'],
-            'album_id': item['album']['id'],
-            'album_art': item['album']['images'][0]['url']
-        })
-    return tracks
+    return spotify.get_pop_recommendations(token)
+
+def get_album_payload(album_id, token):
+    return spotify.get_album_payload(album_id, token)
 
 def get_album(album_id, token):
-    url = f'https://api.spotify.com/v1/albums/{album_id}'
-    headers = get_auth_header(token)
-    result = get(url, headers=headers)
-    json_result = result.json()
-    album = {
-        'album_id': json_result['id'],
-        'album_name': json_result['name'],
-        'album_art': json_result['images'][0]['url'],
-        'artist_name': json_result['artists'][0]['name'],
-        'artist_id': json_result['artists'][0]['id'],
-        'release_date': json_result['release_date'],
-        'total_tracks': json_result['total_tracks'],
-        'popularity': json_result['popularity']
-    }
-    return album
+    return spotify.get_album(album_id, token)
 
 def get_album_tracks(album_id, token):
-    url = f'https://api.spotify.com/v1/albums/{album_id}'
-    headers = get_auth_header(token)
-    result = get(url, headers=headers)
-    json_result = result.json()['tracks']['items']
-    release_date = result.json()['release_date']
-    popularity = result.json()['popularity']
-    album_art = result.json()['images'][0]['url']
-    tracks = []
-    for item in json_result:
-        tracks.append({
-            'album_id': album_id,
-            'album_name': item['name'],
-            'album_art': album_art,
-            'track_id': item['id'],
-            'release_date': release_date,
-            'track_name': item['name'],
-            'track_uri': item['uri'],
-            'artist_name': item['artists'][0]['name'],
-            'artist_id': item['artists'][0]['id'],
-            'duration': round(item['duration_ms'] / 60000, 2),
-            'explicit': item['explicit'],
-            'track_number': item['track_number'],
-            'popularity': popularity
-        })
-    return tracks
+    return spotify.get_album_tracks(album_id, token)
 
 def get_album_art(album_id, token):
-    url = f'https://api.spotify.com/v1/albums/{album_id}'
-    headers = get_auth_header(token)
-    result = get(url, headers=headers)
-    json_result = result.json()['images'][0]['url']
-    return json_result
+    return spotify.get_album_art(album_id, token)
 
 def get_track_info(track_id, token):
-    url = f'https://api.spotify.com/v1/tracks/{track_id}'
-    headers = get_auth_header(token)
-    result = get(url, headers=headers)
-    json_result = result.json()
-    track_info = {
-        'track_id': json_result['id'],
-        'track_name': json_result['name'],
-        'track_uri': json_result['uri'],
-        'artist_name': json_result['artists'][0]['name'],
-        'artist_id': json_result['artists'][0]['id'],
-        'album': json_result['album']['name'],
-        'album_id': json_result['album']['id'],
-        'album_art': json_result['album']['images'][0]['url']
-    }
-
-    return track_info
-    
+    return spotify.get_track_info(track_id, token)
+
 def get_audio_analysis(track_id, token):
-    url = f'https://api.spotify.com/v1/audio-analysis/{track_id}'
-    headers = get_auth_header(token)
-    result = get(url, headers=headers)
-    data = result.json()['track']
-    analysis = {
-            'duration': round(data['duration'] / 60, 2),
-            'key': keys[data['key']],
-            'key_confidence': round(data['key_confidence'] * 100),
-            'mode': mode[data['mode']],
-            'mode_confidence': round(data['mode_confidence'] * 100),
-            'time_signature': data['time_signature'],
-            'time_signature_confidence': round(data['time_signature_confidence'] * 100),
-            'tempo': round(data['tempo']),
-            'tempo_confidence': round(data['tempo_confidence'] * 100),
-            'loudness': data['loudness'],
-        }
-    track_info = get_track_info(track_id, token)
-    analysis.update(track_info)
-    return analysis
-    
-def generic_search(search_type, search_term, token):
-    default_image = 'https://images.unsplash.com/photo-1601066525716-3cca33c6d4c6?ixlib=rb-4.0.3&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=1050&q=80'
-    url = f'https://api.spotify.com/v1/search?q={search_term}&type={search_type}&limit=10'
-    headers = get_auth_header(token)
-    search_result = get(url, headers=headers)
-    items = search_result.json()[search_type + 's']['items']
-    result = []
-    
-    for item in items:
-        if search_type == 'track':
-            image_field = item['album']['images']
-            attributes = {
-                'name': item['name'],
-                'artist': item['artists'][0]['name'],
-                'artist_id': item['artists'][0]['id'],
-                'track_id': item['id'],
-                'album': item['album']['name'],
-                'album_id': item['album']['id'],
-                'id': item['id'],
-                'type': 'track',
-            }
-        elif search_type == 'artist':
-            image_field = item['images']
-            attributes = {
-                'name': item['name'],
-                'id': item['id'],
-                'type': 'artist',
-                'artist_id': item['id'],
-            }
-        elif search_type == 'album':
-            image_field = item['images']
-            attributes = {
-                'image': item['images'][0]['url'],
-                'name': item['name'],
-                'artist': item['artists'][0]['name'],
-                'artist_id': item['artists'][0]['id'],
-                'id': item['id'],
-                'type': 'album',
-                'album_id': item['id'],
-            }
-        
-        if not image_field:
-            image_field.append({'url': default_image})
-        
-        attributes['image'] = image_field[0]['url']
-        result.append(attributes)
+    return spotify.get_audio_analysis(track_id, token)
+
+def get_tracks(track_ids, token):
+    return spotify.get_tracks(track_ids, token)
 
-    return result
+def get_audio_features(track_ids, token):
+    return spotify.get_audio_features(track_ids, token)
 
+def generic_search(search_type, search_term, token, offset=0, limit=SEARCH_PAGE_SIZE):
+    return spotify.generic_search(search_type, search_term, token, offset, limit)
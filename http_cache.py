@@ -0,0 +1,77 @@
+"""Browser caching helpers: ETags for pages and no-store for sensitive ones.
+
+Pages are served with ``Cache-Control: private, no-cache`` by default, so
+browsers keep them but revalidate on every visit. Views that can name a
+cheap version marker for what they render answer revalidations with 304
+before rendering anything::
+
+    etag = make_etag('playlist', playlist.id, playlist.version)
+    if not_modified(etag):
+        return not_modified_response(etag)
+    return with_etag(make_response(render_template(...)), etag)
+
+Views that show credentials or one-time CSRF tokens use ``@no_store``.
+Fingerprinted static files (see assets) are cached for a year.
+"""
+
+import hashlib
+from functools import wraps
+
+from flask import current_app, g, request, session, make_response
+
+
+def make_etag(*parts):
+    """Return an ETag for the current user's view of parts.
+
+    The asset manifest's version is folded in, so pages that link renamed
+    assets after a deploy are sent again instead of answered with 304.
+    """
+    user_id = g.user.id if g.get('user') else None
+    raw = repr((user_id, current_app.config.get('ASSET_VERSION')) + parts).encode()
+    return hashlib.sha1(raw).hexdigest()
+
+
+def not_modified(etag):
+    """Does the browser's cached copy still match etag?
+
+    Never true while flash messages are waiting, because the cached page
+    would not show them.
+    """
+    return '_flashes' not in session and request.if_none_match.contains(etag)
+
+
+def not_modified_response(etag):
+    """Return an empty 304 carrying etag."""
+    return with_etag(make_response('', 304), etag)
+
+
+def with_etag(response, etag):
+    """Set etag on response and return it."""
+    response.set_etag(etag)
+    return response
+
+
+def no_store(view):
+    """Mark a view's responses as never to be stored by the browser."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        g.no_store = True
+        return view(*args, **kwargs)
+    return wrapped
+
+
+def set_cache_headers(response):
+    """Apply the caching policy to a response (used as an after_request hook)."""
+    if g.get('no_store'):
+        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+        response.headers["Pragma"] = "no-cache"
+        response.headers["Expires"] = "0"
+    elif request.endpoint == 'static':
+        if (request.view_args or {}).get('filename', '').startswith('dist/'):
+            # Content-hashed by assets.py: a new build means a new URL.
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            response.headers["Cache-Control"] = "no-cache"
+    else:
+        response.headers["Cache-Control"] = "private, no-cache"
+    return response
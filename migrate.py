@@ -0,0 +1,77 @@
+"""Bring an existing database up to date with models.py.
+
+Run with ``python3 migrate.py``. Every statement is idempotent, so it is
+safe to run on each deploy. New tables are created by db.create_all().
+"""
+
+from models import db, Playlist, PlaylistStats
+from app import app
+
+STATEMENTS = [
+    # Read-through audio analysis cache
+    "ALTER TABLE songs ADD COLUMN IF NOT EXISTS album_id TEXT",
+    "ALTER TABLE songs ADD COLUMN IF NOT EXISTS analyzed_at TIMESTAMP",
+    "ALTER TABLE songs ALTER COLUMN duration TYPE DOUBLE PRECISION",
+    # Minimal song rows filled in by the enrichment queue
+    "ALTER TABLE songs ALTER COLUMN track_name DROP NOT NULL",
+    "ALTER TABLE songs ALTER COLUMN artist_name DROP NOT NULL",
+    "ALTER TABLE songs ALTER COLUMN artist_id DROP NOT NULL",
+    "ALTER TABLE songs ADD COLUMN IF NOT EXISTS enrichment_status TEXT",
+    "ALTER TABLE songs ADD COLUMN IF NOT EXISTS enrichment_attempts INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE songs ADD COLUMN IF NOT EXISTS enrichment_failed_at TIMESTAMP",
+    # Version markers for ETags
+    "ALTER TABLE playlists ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1",
+    "ALTER TABLE playlists ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP",
+    # Similar-songs index sync
+    "CREATE INDEX IF NOT EXISTS ix_songs_analyzed_at ON songs (analyzed_at)",
+    # Indexes and uniqueness for likes, playlist_songs and playlists.
+    # Duplicates are removed first, keeping the oldest row.
+    "DELETE FROM likes a USING likes b"
+    " WHERE a.user_id = b.user_id AND a.song_id = b.song_id AND a.id > b.id",
+    "DELETE FROM playlist_songs a USING playlist_songs b"
+    " WHERE a.playlist_id = b.playlist_id AND a.song_id = b.song_id AND a.id > b.id",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_likes_user_song ON likes (user_id, song_id)",
+    "CREATE INDEX IF NOT EXISTS ix_likes_song_id ON likes (song_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_playlist_songs_playlist_song"
+    " ON playlist_songs (playlist_id, song_id)",
+    "CREATE INDEX IF NOT EXISTS ix_playlist_songs_song_id ON playlist_songs (song_id)",
+    "CREATE INDEX IF NOT EXISTS ix_playlists_user_id_id ON playlists (user_id, id)",
+    "DROP INDEX IF EXISTS ix_playlists_user_id",
+    # Gap-based song order. Existing songs keep their insertion order, and
+    # the sequence is moved past every position handed out.
+    "CREATE SEQUENCE IF NOT EXISTS playlist_songs_position_seq",
+    "ALTER TABLE playlist_songs ADD COLUMN IF NOT EXISTS position BIGINT",
+    "UPDATE playlist_songs p SET position = r.n * 1024"
+    " FROM (SELECT id, row_number() OVER (ORDER BY id) AS n FROM playlist_songs) r"
+    " WHERE p.id = r.id AND p.position IS NULL",
+    "SELECT setval('playlist_songs_position_seq', GREATEST("
+    "(SELECT COALESCE(MAX(position), 0) / 1024 + 1 FROM playlist_songs),"
+    " (SELECT last_value FROM playlist_songs_position_seq)))",
+    "ALTER TABLE playlist_songs ALTER COLUMN position"
+    " SET DEFAULT nextval('playlist_songs_position_seq') * 1024",
+    "ALTER TABLE playlist_songs ALTER COLUMN position SET NOT NULL",
+    "CREATE INDEX IF NOT EXISTS ix_playlist_songs_playlist_position_id"
+    " ON playlist_songs (playlist_id, position, id)",
+    "DROP INDEX IF EXISTS ix_playlist_songs_playlist_position",
+    # Keyset pagination of liked songs, newest first.
+    "UPDATE likes SET timestamp = now() AT TIME ZONE 'utc' WHERE timestamp IS NULL",
+    "ALTER TABLE likes ALTER COLUMN timestamp SET NOT NULL",
+    "CREATE INDEX IF NOT EXISTS ix_likes_user_timestamp ON likes (user_id, timestamp, id)",
+]
+
+
+def migrate():
+    """Create missing tables, apply STATEMENTS in order and backfill playlist stats."""
+    db.create_all()
+    for statement in STATEMENTS:
+        db.session.execute(statement)
+    db.session.commit()
+    missing = db.session.query(Playlist.id).outerjoin(Playlist.stats).filter(
+        PlaylistStats.playlist_id.is_(None))
+    for (playlist_id,) in missing.all():
+        PlaylistStats.rebuild(playlist_id)
+    db.session.commit()
+
+
+if __name__ == '__main__':
+    migrate()
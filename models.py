@@ -1,8 +1,14 @@
-from flask_bcrypt import Bcrypt
+from collections import defaultdict
+from flask import g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, func, inspect, select, tuple_
+from sqlalchemy.dialects.postgresql import JSONB, array, insert
+from sqlalchemy.orm import Session, object_session
 from datetime import datetime
 
-bcrypt = Bcrypt()
+from pagination import PAGE_SIZE, decode_cursor, paginate
+from passwords import hasher
+
 db = SQLAlchemy()
 
 class User(db.Model):
@@ -22,7 +28,7 @@ class User(db.Model):
     @classmethod
     def register(cls, username, password, email):
         """Register user w/hashed password & return user."""
-        hashed = bcrypt.generate_password_hash(password).decode('UTF-8')
+        hashed = hasher.hash(password)
         user = User(username=username, password=hashed, email=email)
         db.session.add(user)
         # return instance of user w/username and hashed password
@@ -32,27 +38,103 @@ class User(db.Model):
     def authenticate(cls, username, password):
         """Validate that user exists & password is correct.
         Return user if valid; else return False.
+
+        A hash made with an outdated bcrypt cost is replaced; the caller
+        commits.
         """
         u = User.query.filter_by(username=username).first()
-        if u and bcrypt.check_password_hash(u.password, password):
+        if u and hasher.check(u.password, password):
+            if hasher.needs_rehash(u.password):
+                u.password = hasher.hash(password)
             # return user instance
             return u
         else:
             return False
         
+    def load_likes(self, track_ids):
+        """Load which of track_ids this user likes in one query.
+
+        The answer is kept on g for the rest of the request so that is_liked
+        calls in templates don't go back to the database.
+        """
+        liked = g.setdefault('liked_tracks', {'checked': set(), 'liked': set()})
+        missing = {track_id for track_id in track_ids if track_id} - liked['checked']
+        if missing:
+            rows = db.session.query(Like.song_id).filter(
+                Like.user_id == self.id, Like.song_id.in_(missing)).all()
+            liked['liked'].update(row.song_id for row in rows)
+            liked['checked'].update(missing)
+        return liked['liked']
+
     def is_liked(self, track_id):
+        liked = g.get('liked_tracks') if has_app_context() else None
+        if liked is not None and track_id in liked['checked']:
+            return track_id in liked['liked']
         like = Like.query.filter_by(user_id=self.id, song_id=track_id).first()
         return like is not None
+class UserNotFound(LookupError):
+    """The session refers to a user that no longer exists."""
+
+
+class LazyUser:
+    """Stand-in for the logged-in User that loads the row only when needed.
+
+    ``id`` comes straight from the session, so code that only needs the id
+    (and the liked-state helpers) never touches the database. Any other
+    attribute loads the User row once and delegates to it. A proxy is true
+    whenever it has an id; if the row turns out to be gone when it is
+    loaded, UserNotFound is raised and g.missing_user is set, so the app can
+    log the session out even when a route swallows the exception.
+    """
+
+    def __init__(self, user_id):
+        object.__setattr__(self, 'id', user_id)
+        object.__setattr__(self, '_user', None)
+
+    load_likes = User.load_likes
+    is_liked = User.is_liked
+
+    def _get_current_object(self):
+        """Return the real User row, loading it on first use."""
+        if self._user is None:
+            user = User.query.get(self.id)
+            if user is None:
+                if has_app_context():
+                    g.missing_user = True
+                raise UserNotFound(self.id)
+            object.__setattr__(self, '_user', user)
+        return self._user
+
+    def __bool__(self):
+        return self.id is not None
+
+    def __getattr__(self, name):
+        return getattr(self._get_current_object(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._get_current_object(), name, value)
+
+    def __repr__(self):
+        return f'<LazyUser {self.id} loaded={self._user is not None}>'
+
 class Playlist(db.Model):
     """Playlist in the system."""
 
     __tablename__ = "playlists"
+    __table_args__ = (
+        db.Index('ix_playlists_user_id_id', 'user_id', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True,)
     name = db.Column(db.Text, nullable=False,)
     description = db.Column(db.String(140))
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'),nullable=False)
-    songs = db.relationship('Song', secondary='playlist_songs', backref='songs')
+    # Bumped by touch() whenever what the playlist page shows changes.
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    songs = db.relationship('Song', secondary='playlist_songs', backref='songs',
+                            order_by='PlaylistSong.position, PlaylistSong.id')
     playlist_songs = db.relationship('PlaylistSong', backref='playlist', cascade="all, delete" )
+    stats = db.relationship('PlaylistStats', uselist=False, passive_deletes=True)
 
     def __repr__(self):
         return f'<Playlist {self.id} {self.name} {self.description}>'
@@ -61,29 +143,106 @@ class Playlist(db.Model):
     def create_playlist(cls, name, description, user_id):
         """Create playlist and return playlist."""
         return cls(name=name, description=description, user_id=user_id)
+
+    @classmethod
+    def for_user_with_counts(cls, user_id, cursor=None, limit=PAGE_SIZE):
+        """Return a page of user's playlists with song_count set, and the next page's cursor.
+
+        One query; each count is an index lookup for that playlist only.
+        """
+        song_count = db.session.query(db.func.count(PlaylistSong.id)).filter(
+            PlaylistSong.playlist_id == cls.id).correlate(cls).as_scalar()
+        rows, next_cursor = paginate(
+            db.session.query(cls, song_count, cls.id).filter(cls.user_id == user_id),
+            (cls.id,), cursor, limit)
+        playlists = []
+        for playlist, count, _ in rows:
+            playlist.song_count = count
+            playlists.append(playlist)
+        return playlists, next_cursor
+
+    @classmethod
+    def ids_for_user(cls, user_id):
+        """Return the ids of all of user's playlists."""
+        return [playlist_id for playlist_id, in db.session.query(cls.id).filter(cls.user_id == user_id)]
+
+    def songs_page(self, cursor=None, limit=PAGE_SIZE):
+        """Return a page of the playlist's songs in order, and the next page's cursor.
+
+        The page starts after the cursor's row wherever that row is now, so
+        a rebalance between pages (new positions, same order) neither skips
+        nor repeats songs. The cursor's own position is only used if its row
+        has left the playlist.
+        """
+        query = db.session.query(Song, PlaylistSong.position, PlaylistSong.id).join(
+            PlaylistSong, PlaylistSong.song_id == Song.id).filter(PlaylistSong.playlist_id == self.id)
+        after = decode_cursor(cursor, (int, int))
+        if after is not None:
+            position, row_id = after
+            current = db.session.query(PlaylistSong.position).filter(
+                PlaylistSong.id == row_id, PlaylistSong.playlist_id == self.id).as_scalar()
+            query = query.filter(tuple_(PlaylistSong.position, PlaylistSong.id) >
+                                 tuple_(func.coalesce(current, position), row_id))
+        rows, next_cursor = paginate(query, (PlaylistSong.position, PlaylistSong.id), None, limit)
+        return [song for song, _, _ in rows], next_cursor
+
+    @classmethod
+    def touch(cls, playlist_id):
+        """Bump the version of a playlist whose songs changed."""
+        cls.query.filter(cls.id == playlist_id).update(
+            {cls.version: cls.version + 1, cls.updated_at: datetime.utcnow()},
+            synchronize_session=False)
+
+    @classmethod
+    def touch_containing(cls, song_id):
+        """Bump the version of every playlist containing song_id."""
+        playlist_ids = db.session.query(PlaylistSong.playlist_id).filter(PlaylistSong.song_id == song_id)
+        cls.query.filter(cls.id.in_(playlist_ids.subquery())).update(
+            {cls.version: cls.version + 1, cls.updated_at: datetime.utcnow()},
+            synchronize_session=False)
 class Song(db.Model):
     """Song in the system."""
 
     __tablename__ = "songs"
+    __table_args__ = (
+        db.Index('ix_songs_analyzed_at', 'analyzed_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True,)
     track_id = db.Column(db.Text, nullable=False, unique=True)
-    track_name = db.Column(db.Text, nullable=False,)
+    # Track info is filled in by enrichment for rows created with create_pending.
+    track_name = db.Column(db.Text)
     track_uri = db.Column(db.Text, nullable=False, unique=True,)
-    artist_name = db.Column(db.Text, nullable=False)
-    artist_id = db.Column(db.Text, nullable=False)
+    artist_name = db.Column(db.Text)
+    artist_id = db.Column(db.Text)
     album = db.Column(db.Text)
+    album_id = db.Column(db.Text)
     album_art = db.Column(db.Text)
-    tempo = db.Column(db.Float)
+    # active_history keeps the old value on change, for PlaylistStats.
+    tempo = db.column_property(db.Column(db.Float), active_history=True)
     tempo_confidence = db.Column(db.Integer)
     time_signature = db.Column(db.Integer)
     time_signature_confidence = db.Column(db.Integer)
-    key = db.Column(db.Text)
+    key = db.column_property(db.Column(db.Text), active_history=True)
     key_confidence = db.Column(db.Integer)
-    mode = db.Column(db.Text)
+    mode = db.column_property(db.Column(db.Text), active_history=True)
     mode_confidence = db.Column(db.Integer)
-    duration = db.Column(db.Integer)
-    loudness = db.Column(db.Float)
+    duration = db.column_property(db.Column(db.Float), active_history=True)
+    loudness = db.column_property(db.Column(db.Float), active_history=True)
+    analyzed_at = db.Column(db.DateTime)
+    # None for songs stored with their analysis; otherwise see enrichment.
+    enrichment_status = db.Column(db.Text)
+    enrichment_attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    enrichment_failed_at = db.Column(db.DateTime)
+
+    PENDING = 'pending'
+    FAILED = 'failed'
+
+    ANALYSIS_FIELDS = ('duration', 'key', 'key_confidence', 'mode', 'mode_confidence',
+                       'time_signature', 'time_signature_confidence', 'tempo',
+                       'tempo_confidence', 'loudness')
+    TRACK_FIELDS = ('track_id', 'track_name', 'track_uri', 'artist_name', 'artist_id',
+                    'album', 'album_id', 'album_art')
 
     def __repr__(self):
         return f'<Song {self.id} {self.track_name} {self.artist_name}>'
@@ -93,7 +252,51 @@ class Song(db.Model):
     def create_song(cls, song_dict):
         """Create song and return song."""
 
-        return cls(track_id=song_dict['track_id'], track_name=song_dict['track_name'], track_uri=song_dict['track_uri'], artist_name=song_dict['artist_name'], artist_id=song_dict['artist_id'], tempo=song_dict['tempo'], album=song_dict['album'], tempo_confidence=song_dict['tempo_confidence'],time_signature=song_dict['time_signature'], time_signature_confidence=song_dict['time_signature_confidence'], key=song_dict['key'], key_confidence=song_dict['key_confidence'], mode=song_dict['mode'], mode_confidence=song_dict['mode_confidence'], duration=song_dict['duration'], loudness=song_dict['loudness'], album_art=song_dict['album_art'])
+        return cls(track_id=song_dict['track_id'], track_name=song_dict['track_name'], track_uri=song_dict['track_uri'], artist_name=song_dict['artist_name'], artist_id=song_dict['artist_id'], tempo=song_dict['tempo'], album=song_dict['album'], tempo_confidence=song_dict['tempo_confidence'],time_signature=song_dict['time_signature'], time_signature_confidence=song_dict['time_signature_confidence'], key=song_dict['key'], key_confidence=song_dict['key_confidence'], mode=song_dict['mode'], mode_confidence=song_dict['mode_confidence'], duration=song_dict['duration'], loudness=song_dict['loudness'], album_art=song_dict['album_art'], album_id=song_dict.get('album_id'), analyzed_at=datetime.utcnow())
+
+    @classmethod
+    def create_pending(cls, track_id):
+        """Return the song for track_id, inserting a minimal pending row if needed.
+
+        The row only holds the track id and uri; enrichment fills in the
+        rest. Concurrent callers for one track get the same row.
+        """
+        db.session.execute(insert(cls.__table__).values(
+            track_id=track_id, track_uri=f'spotify:track:{track_id}',
+            enrichment_status=cls.PENDING, enrichment_attempts=0,
+        ).on_conflict_do_nothing())
+        return cls.query.filter_by(track_id=track_id).one()
+
+    @property
+    def version(self):
+        """A marker that changes whenever the song page would change."""
+        return (self.id, self.analyzed_at, self.enrichment_status)
+
+    @property
+    def needs_enrichment(self):
+        """Is the row still waiting for its track info and analysis?"""
+        return self.enrichment_status == self.PENDING
+
+    def has_analysis(self, max_age=None):
+        """Is the stored audio analysis complete, and younger than max_age seconds if given?"""
+        # Songs stored from /audio-features have no confidence values yet.
+        if any(getattr(self, field) is None for field in ('tempo', 'key', 'key_confidence', 'mode', 'loudness', 'album_id')):
+            return False
+        if max_age is None:
+            return True
+        return self.analyzed_at is not None and (datetime.utcnow() - self.analyzed_at).total_seconds() < max_age
+
+    def update_analysis(self, song_dict):
+        """Overwrite the stored track info and audio analysis."""
+        for field in self.TRACK_FIELDS + self.ANALYSIS_FIELDS:
+            if field in song_dict:
+                setattr(self, field, song_dict[field])
+        self.analyzed_at = datetime.utcnow()
+        self.enrichment_status = None
+
+    def to_analysis(self):
+        """Return the song in the shape returned by get_audio_analysis."""
+        return {field: getattr(self, field) for field in self.TRACK_FIELDS + self.ANALYSIS_FIELDS}
 
     @classmethod
     # methods that will query the db to see if the song already exists, and if it does, return the song instance. If it doesn't, create a song instance and return it
@@ -104,31 +307,183 @@ class Song(db.Model):
             return song
         else:
             return None
+# Hands out positions for appended playlist songs; see PlaylistSong.position.
+POSITION_SEQUENCE = db.Sequence('playlist_songs_position_seq', metadata=db.metadata)
+
+
 class PlaylistSong(db.Model):
     """PlaylistSong in the system."""
 
     __tablename__ = "playlist_songs"
+    __table_args__ = (
+        db.Index('uq_playlist_songs_playlist_song', 'playlist_id', 'song_id', unique=True),
+        db.Index('ix_playlist_songs_song_id', 'song_id'),
+        db.Index('ix_playlist_songs_playlist_position_id', 'playlist_id', 'position', 'id'),
+    )
+
+    POSITION_GAP = 1024
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     playlist_id = db.Column(db.Integer, db.ForeignKey('playlists.id'))
     song_id = db.Column(db.Integer, db.ForeignKey('songs.id'))
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # Songs are ordered by position. New rows take the next value of a global
+    # sequence times POSITION_GAP, which is past every position in use, so
+    # appending never reads the playlist; moves go between two neighbours
+    # (see playlist_order).
+    position = db.Column(db.BigInteger, nullable=False, server_default=db.text(
+        f"nextval('playlist_songs_position_seq') * {POSITION_GAP}"))
     song = db.relationship('Song', backref='playlist_songs')
 
     @classmethod
     def create_playlist_song(cls, playlist_id, song_id, user_id):
         """Create playlist_song and return playlist_song."""
         return cls(playlist_id=playlist_id, song_id=song_id, user_id=user_id)
-    
+
+    @classmethod
+    def add_to_playlist(cls, playlist_id, song_id, user_id):
+        """Add song to playlist unless it is already there; return the row."""
+        playlist_song = cls.query.filter_by(playlist_id=playlist_id, song_id=song_id).first()
+        if playlist_song is None:
+            playlist_song = cls.create_playlist_song(playlist_id, song_id, user_id)
+            db.session.add(playlist_song)
+        return playlist_song
+
+class PlaylistStats(db.Model):
+    """Running audio statistics for one playlist.
+
+    Kept up to date by the flush hooks at the bottom of this module whenever
+    a PlaylistSong is added or removed or a song's analysis changes, so
+    reading them costs the same however long the playlist is. Tempos are
+    kept as a histogram of whole BPM for percentiles. Bulk inserts bypass
+    the hooks and call add_songs instead.
+    """
+
+    __tablename__ = "playlist_stats"
+
+    playlist_id = db.Column(db.Integer, db.ForeignKey('playlists.id', ondelete='CASCADE'), primary_key=True)
+    song_count = db.Column(db.Integer, nullable=False, default=0)
+    tempo_count = db.Column(db.Integer, nullable=False, default=0)
+    tempo_sum = db.Column(db.Float, nullable=False, default=0)
+    loudness_count = db.Column(db.Integer, nullable=False, default=0)
+    loudness_sum = db.Column(db.Float, nullable=False, default=0)
+    duration_sum = db.Column(db.Float, nullable=False, default=0)
+    # {"<bpm>": count} and {"<key> <mode>": count}
+    tempo_histogram = db.Column(JSONB, nullable=False, default=dict)
+    key_modes = db.Column(JSONB, nullable=False, default=dict)
+
+    COUNTERS = ('song_count', 'tempo_count', 'tempo_sum', 'loudness_count', 'loudness_sum', 'duration_sum')
+    SONG_FIELDS = ('tempo', 'loudness', 'duration', 'key', 'mode')
+
+    @property
+    def avg_tempo(self):
+        return round(self.tempo_sum / self.tempo_count, 1) if self.tempo_count else None
+
+    @property
+    def mean_loudness(self):
+        return round(self.loudness_sum / self.loudness_count, 1) if self.loudness_count else None
+
+    @property
+    def total_duration(self):
+        """Total length in minutes of the songs with an analysis."""
+        return round(self.duration_sum, 2)
+
+    def tempo_percentile(self, percent):
+        """Return the tempo below which percent of the analyzed songs fall."""
+        if not self.tempo_count:
+            return None
+        target = percent / 100 * self.tempo_count
+        seen = 0
+        for bpm, count in sorted((int(bpm), count) for bpm, count in self.tempo_histogram.items() if count > 0):
+            seen += count
+            if seen >= target:
+                return bpm
+        return bpm
+
+    def key_mode_histogram(self):
+        """Return [(key and mode, count)], most common first."""
+        return sorted(((key_mode, count) for key_mode, count in self.key_modes.items() if count > 0),
+                      key=lambda item: (-item[1], item[0]))
+
+    @classmethod
+    def contribution(cls, song):
+        """Return what one song adds to the stats; song is a row, mapping or None."""
+        get = (lambda name: None) if song is None else (
+            song.get if isinstance(song, dict) else lambda name: getattr(song, name))
+        tempo, loudness, duration, key, mode = (get(name) for name in cls.SONG_FIELDS)
+        return {
+            'song_count': 1,
+            'tempo_count': int(tempo is not None),
+            'tempo_sum': tempo or 0,
+            'loudness_count': int(loudness is not None),
+            'loudness_sum': loudness or 0,
+            'duration_sum': duration or 0,
+            'bpm': str(int(round(tempo))) if tempo is not None else None,
+            'key_mode': f'{key} {mode}' if key and mode else None,
+        }
+
+    @classmethod
+    def apply(cls, connection, playlist_id, changes):
+        """Add (sign, contribution) changes to a playlist's row, creating it if needed.
+
+        The changes are summed here and sent as one UPDATE that adds them to
+        the stored values in SQL, so concurrent changes to one playlist
+        never overwrite each other. Histogram entries that drop to zero are
+        kept and skipped when reading.
+        """
+        table = cls.__table__
+        counters = dict.fromkeys(cls.COUNTERS, 0)
+        histograms = {'bpm': defaultdict(int), 'key_mode': defaultdict(int)}
+        for sign, change in changes:
+            for name in cls.COUNTERS:
+                counters[name] += sign * change[name]
+            for name, histogram in histograms.items():
+                if change[name] is not None:
+                    histogram[change[name]] += sign
+        values = {name: table.c[name] + delta for name, delta in counters.items()}
+        for name, column in (('bpm', table.c.tempo_histogram), ('key_mode', table.c.key_modes)):
+            expression = column
+            for key, delta in histograms[name].items():
+                if delta:
+                    count = func.coalesce(column[key].astext.cast(db.Integer), 0) + delta
+                    expression = func.jsonb_set(expression, array([key]), func.to_jsonb(count))
+            values[column.name] = expression
+        update = table.update().where(table.c.playlist_id == playlist_id).values(**values)
+        if connection.execute(update).rowcount == 0:
+            connection.execute(insert(table).values(
+                playlist_id=playlist_id, tempo_histogram={}, key_modes={},
+                **dict.fromkeys(cls.COUNTERS, 0)).on_conflict_do_nothing())
+            connection.execute(update)
+
+    @classmethod
+    def add_songs(cls, playlist_id, songs):
+        """Count songs inserted into a playlist without the ORM (bulk inserts)."""
+        if songs:
+            cls.apply(db.session.connection(), playlist_id, [(1, cls.contribution(song)) for song in songs])
+
+    @classmethod
+    def rebuild(cls, playlist_id):
+        """Recompute a playlist's row from its songs."""
+        songs = Song.query.join(PlaylistSong, PlaylistSong.song_id == Song.id).filter(
+            PlaylistSong.playlist_id == playlist_id).all()
+        cls.query.filter_by(playlist_id=playlist_id).delete()
+        cls.apply(db.session.connection(), playlist_id, [(1, cls.contribution(song)) for song in songs])
+
+
 class Like(db.Model):
     """Like in the system."""
 
     __tablename__ = "likes"
+    __table_args__ = (
+        db.Index('uq_likes_user_song', 'user_id', 'song_id', unique=True),
+        db.Index('ix_likes_song_id', 'song_id'),
+        db.Index('ix_likes_user_timestamp', 'user_id', 'timestamp', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True,)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     song_id = db.Column(db.Text, db.ForeignKey('songs.track_id'), nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
     user = db.relationship('User', backref='likes')
     song = db.relationship('Song', backref='likes')
@@ -138,9 +493,15 @@ class Like(db.Model):
 
     @classmethod
     def like_song(cls, user_id, track_id):
-        """Create like and return like."""
-        like = cls(user_id=user_id, song_id=track_id)
-        db.session.add(like)
+        """Create like and return like; return the existing like if there is one."""
+        like = cls.query.filter_by(user_id=user_id, song_id=track_id).first()
+        if like is None:
+            like = cls(user_id=user_id, song_id=track_id)
+            db.session.add(like)
+        liked = g.get('liked_tracks') if has_app_context() else None
+        if liked is not None:
+            liked['checked'].add(track_id)
+            liked['liked'].add(track_id)
         return like
 
     @classmethod
@@ -149,8 +510,97 @@ class Like(db.Model):
         like = cls.query.filter_by(user_id=user_id, song_id=track_id).first()
         if like:
             db.session.delete(like)
+        liked = g.get('liked_tracks') if has_app_context() else None
+        if liked is not None:
+            liked['liked'].discard(track_id)
+
+    @classmethod
+    def songs_for_user(cls, user_id, cursor=None, limit=PAGE_SIZE):
+        """Return a page of (song, liked at) for user's likes, newest first, and the next page's cursor."""
+        rows, next_cursor = paginate(
+            db.session.query(Song, cls.timestamp, cls.id).join(cls, cls.song_id == Song.track_id).filter(
+                cls.user_id == user_id),
+            (cls.timestamp, cls.id), cursor, limit, descending=True)
+        return [(song, liked_at) for song, liked_at, _ in rows], next_cursor
+
+
+
+# Playlist stats maintenance. Row-level events only record what changed;
+# the stats rows are updated once per playlist in after_flush.
+
+def _flush_info(target):
+    return object_session(target).info.setdefault(
+        'playlist_stats', {'changes': [], 'songs': {}, 'deleted_playlists': set()})
+
+
+@event.listens_for(PlaylistSong, 'after_insert')
+def _playlist_song_inserted(mapper, connection, target):
+    _flush_info(target)['changes'].append((target.playlist_id, target.song_id, 1))
+
+
+@event.listens_for(PlaylistSong, 'after_delete')
+def _playlist_song_deleted(mapper, connection, target):
+    _flush_info(target)['changes'].append((target.playlist_id, target.song_id, -1))
+
+
+@event.listens_for(Song, 'after_update')
+def _song_updated(mapper, connection, target):
+    state = inspect(target)
+    old = {}
+    for name in PlaylistStats.SONG_FIELDS:
+        history = state.attrs[name].history
+        old[name] = history.deleted[0] if history.deleted else getattr(target, name)
+    if PlaylistStats.contribution(old) != PlaylistStats.contribution(target):
+        _flush_info(target)['songs'].setdefault(target.id, old)
+
+
+@event.listens_for(Session, 'before_flush')
+def _note_deleted_playlists(session, flush_context, instances):
+    deleted = {obj.id for obj in session.deleted if isinstance(obj, Playlist)}
+    if deleted:
+        session.info.setdefault(
+            'playlist_stats', {'changes': [], 'songs': {}, 'deleted_playlists': set()}
+        )['deleted_playlists'].update(deleted)
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_playlist_stats(session, flush_context):
+    info = session.info.pop('playlist_stats', None)
+    if not info or not (info['changes'] or info['songs']):
+        return
+    connection = session.connection()
+    songs = Song.__table__
+    song_ids = {song_id for _, song_id, _ in info['changes']} | set(info['songs'])
+    current = {row.id: row for row in connection.execute(
+        select([songs.c.id] + [songs.c[name] for name in PlaylistStats.SONG_FIELDS]
+               ).where(songs.c.id.in_(song_ids)))}
+
+    skip = info['deleted_playlists']
+    per_playlist = defaultdict(list)
+    inserted = set()
+    for playlist_id, song_id, sign in info['changes']:
+        if playlist_id in skip:
+            continue
+        if sign > 0:
+            inserted.add((playlist_id, song_id))
+            song = current.get(song_id)
+        else:
+            # A song whose analysis changed in this flush was counted with its old values.
+            song = info['songs'].get(song_id, current.get(song_id))
+        per_playlist[playlist_id].append((sign, PlaylistStats.contribution(song)))
+
+    playlist_songs = PlaylistSong.__table__
+    for song_id, old in info['songs'].items():
+        rows = connection.execute(select([playlist_songs.c.playlist_id]).where(
+            playlist_songs.c.song_id == song_id))
+        for row in rows:
+            if row.playlist_id in skip or (row.playlist_id, song_id) in inserted:
+                continue
+            per_playlist[row.playlist_id].append((-1, PlaylistStats.contribution(old)))
+            per_playlist[row.playlist_id].append((1, PlaylistStats.contribution(current.get(song_id))))
 
-   
+    for playlist_id, changes in per_playlist.items():
+        PlaylistStats.apply(connection, playlist_id, changes)
 
 
 def connect_db(app):
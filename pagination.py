@@ -0,0 +1,74 @@
+"""Keyset (cursor) pagination for long listings.
+
+A page is read with ``WHERE (k1, k2) > (:last_k1, :last_k2) ORDER BY k1, k2
+LIMIT n + 1`` over an indexed key, so the database walks straight to the
+first row of the page: page 50 costs the same as page 1, where OFFSET would
+read and throw away every earlier row. The extra row only says whether
+there is a next page.
+
+The cursor given to the browser is the key of the last row shown, as
+URL-safe base64 JSON. A cursor that does not decode, or whose values do not
+match the key columns' types, gives the first page.
+"""
+
+import base64
+import binascii
+import json
+import os
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+PAGE_SIZE = int(os.environ.get('PAGE_SIZE', 50))
+
+
+def encode_cursor(values):
+    """Return an opaque cursor for a row key (a tuple of JSON values or datetimes)."""
+    raw = json.dumps([{'dt': value.isoformat()} if isinstance(value, datetime) else value
+                      for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, types=None):
+    """Return the row key in cursor, or None if it is missing or malformed.
+
+    With types (one Python type per key column), a key with another number
+    of values or a value of another type is malformed too.
+    """
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list):
+            return None
+        values = tuple(datetime.fromisoformat(value['dt']) if isinstance(value, dict) else value
+                       for value in values)
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        return None
+    if types is not None:
+        if len(values) != len(types):
+            return None
+        for value, type_ in zip(values, types):
+            # bool is an int to isinstance, but never a valid id or position.
+            if not isinstance(value, type_) or (isinstance(value, bool) and type_ is not bool):
+                return None
+    return values
+
+
+def paginate(query, keys, cursor=None, limit=PAGE_SIZE, descending=False):
+    """Return (rows, next_cursor) for one page of query, ordered by keys.
+
+    keys are the columns that order the listing and together identify a
+    row, e.g. (Like.timestamp, Like.id); query must select them last, so
+    each row ends with its key. next_cursor is None on the last page.
+    """
+    after = decode_cursor(cursor, tuple(column.type.python_type for column in keys))
+    if after is not None:
+        key, last = tuple_(*keys), tuple_(*after)
+        query = query.filter(key < last if descending else key > last)
+    query = query.order_by(*(column.desc() if descending else column for column in keys))
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(tuple(rows[-1])[-len(keys):])
@@ -0,0 +1,101 @@
+"""Password hashing with a configured bcrypt cost.
+
+The cost (log2 rounds) comes from BCRYPT_ROUNDS and defaults to
+DEFAULT_ROUNDS. It is pinned in config rather than measured by each
+process, so every worker hashes at the same cost. To pick a value for a
+machine type, run ``python passwords.py`` there once and set the
+BCRYPT_ROUNDS it prints. Hashes made with a lower cost are upgraded on the
+next successful login (see User.authenticate); higher ones are left alone.
+
+With PASSWORD_WORKERS > 0, hashing runs in a small process pool. The
+request still waits for its hash, so this does not free the worker; it
+only caps how many hashes run at once and so how much CPU a burst of
+logins can take from page serving.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+DEFAULT_ROUNDS = 12
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(pw_hash, password):
+    return bcrypt.checkpw(password.encode('utf-8'), pw_hash.encode('utf-8'))
+
+
+def calibrate_rounds(target_seconds=0.25, min_rounds=10, max_rounds=14, probe_rounds=8, probes=5):
+    """Return the bcrypt cost that hashes in about target_seconds here.
+
+    Each extra round doubles the work, so cheap probe hashes are timed and
+    extrapolated instead of timing the expensive costs themselves. The
+    fastest of several probes is used, so one slow run doesn't skew it.
+    """
+    probe_rounds = min(probe_rounds, min_rounds)
+    timings = []
+    for _ in range(probes):
+        start = time.perf_counter()
+        _hash('calibration', probe_rounds)
+        timings.append(time.perf_counter() - start)
+    elapsed = min(timings)
+    rounds = probe_rounds
+    while rounds < max_rounds and elapsed * 2 <= target_seconds:
+        elapsed *= 2
+        rounds += 1
+    return max(min_rounds, min(rounds, max_rounds))
+
+
+def hash_rounds(pw_hash):
+    """Return the cost a bcrypt hash was made with."""
+    return int(pw_hash.split('$')[2])
+
+
+class PasswordHasher:
+    """Hash and check passwords at a fixed cost, optionally in a process pool."""
+
+    def __init__(self, rounds, workers=0):
+        self.rounds = rounds
+        self.workers = workers
+        self._pool = None
+
+    def _run(self, func, *args):
+        # The pool bounds concurrent hashing; the caller still blocks on it.
+        if not self.workers:
+            return func(*args)
+        if self._pool is None:
+            # Created on first use so each gunicorn worker gets its own pool.
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool.submit(func, *args).result()
+
+    def hash(self, password):
+        """Return a bcrypt hash of password at the configured cost."""
+        return self._run(_hash, password, self.rounds)
+
+    def check(self, pw_hash, password):
+        """Does password match pw_hash?"""
+        return self._run(_check, pw_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        """Was pw_hash made with a lower cost than the configured one?"""
+        return hash_rounds(pw_hash) < self.rounds
+
+
+hasher = PasswordHasher(
+    int(os.environ.get('BCRYPT_ROUNDS', DEFAULT_ROUNDS)),
+    workers=int(os.environ.get('PASSWORD_WORKERS', 0)),
+)
+
+
+if __name__ == '__main__':
+    rounds = calibrate_rounds(
+        target_seconds=float(os.environ.get('BCRYPT_TARGET_SECONDS', 0.25)),
+        min_rounds=int(os.environ.get('BCRYPT_MIN_ROUNDS', 10)),
+        max_rounds=int(os.environ.get('BCRYPT_MAX_ROUNDS', 14)),
+    )
+    print(f'BCRYPT_ROUNDS={rounds}')
@@ -0,0 +1,155 @@
+"""Reordering playlist songs with gap-based positions.
+
+Positions start POSITION_GAP apart (see PlaylistSong.position), so a song
+can be moved between two neighbours by giving it the midpoint of their
+positions: a move writes one row, however long the playlist. Moving to the
+end takes a fresh position from the sequence, and moving to the top goes
+POSITION_GAP below the first song.
+
+Each move halves a gap, so after enough moves into the same spot two
+neighbours end up adjacent. The playlist is then renumbered POSITION_GAP
+apart with one UPDATE (``rebalance``). Moves that leave a gap smaller than
+REBALANCE_BELOW schedule that renumbering in a background thread once
+they commit, so it rarely has to happen during a request.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from models import db, Playlist, PlaylistSong, POSITION_SEQUENCE
+
+GAP = PlaylistSong.POSITION_GAP
+REBALANCE_BELOW = int(os.environ.get('PLAYLIST_REBALANCE_BELOW', 16))
+
+
+def _between(before, after):
+    """Return a position between two neighbours (None for an end), or None if they are adjacent."""
+    if after is None:
+        return db.session.connection().execute(POSITION_SEQUENCE) * GAP
+    if before is None:
+        return after - GAP
+    if after - before < 2:
+        return None
+    return (before + after) // 2
+
+
+def _neighbours(row, index=None, after=None, before=None):
+    """Return the positions the row should go between, or raise LookupError."""
+    others = db.session.query(PlaylistSong.position).filter(
+        PlaylistSong.playlist_id == row.playlist_id, PlaylistSong.id != row.id
+    ).order_by(PlaylistSong.position, PlaylistSong.id)
+    if index is not None:
+        if index <= 0:
+            return None, others.limit(1).scalar()
+        positions = [position for position, in others.offset(index - 1).limit(2)]
+        if not positions:
+            return None, None
+        return positions[0], positions[1] if len(positions) > 1 else None
+    if before is not None:
+        anchor = others.filter(PlaylistSong.song_id == before).scalar()
+        if anchor is None:
+            raise LookupError(before)
+        previous = others.filter(PlaylistSong.position < anchor).order_by(None).order_by(
+            PlaylistSong.position.desc(), PlaylistSong.id.desc()).limit(1).scalar()
+        return previous, anchor
+    if after is None:
+        return None, others.limit(1).scalar()
+    anchor = others.filter(PlaylistSong.song_id == after).scalar()
+    if anchor is None:
+        raise LookupError(after)
+    return anchor, others.filter(PlaylistSong.position > anchor).limit(1).scalar()
+
+
+def move_song(playlist_id, song_id, index=None, after=None, before=None):
+    """Move a song within a playlist; return False if it is not in the playlist.
+
+    Give either the new 0-based index, the id of the song it should follow
+    in after (None for the top), or the id of the song it should precede in
+    before. Moves in one playlist are applied one at a time: touching the
+    playlist locks its row until commit.
+    """
+    Playlist.touch(playlist_id)
+    row = PlaylistSong.query.filter_by(playlist_id=playlist_id, song_id=song_id).first()
+    if row is None:
+        return False
+    try:
+        previous, following = _neighbours(row, index, after, before)
+    except LookupError:
+        return False
+    position = _between(previous, following)
+    if position is None:
+        rebalance(playlist_id)
+        db.session.expire(row)
+        previous, following = _neighbours(row, index, after, before)
+        position = _between(previous, following)
+    row.position = position
+    gaps = [abs(position - other) for other in (previous, following) if other is not None]
+    if gaps and min(gaps) < REBALANCE_BELOW:
+        db.session().info.setdefault('rebalance', set()).add(playlist_id)
+    return True
+
+
+def rebalance(playlist_id):
+    """Renumber a playlist's positions POSITION_GAP apart, keeping their order."""
+    table = PlaylistSong.__table__
+    ranked = select([
+        table.c.id,
+        (func.row_number().over(order_by=(table.c.position, table.c.id)) * GAP).label('position'),
+    ]).where(table.c.playlist_id == playlist_id).alias('ranked')
+    db.session.execute(table.update().where(table.c.id == ranked.c.id).values(position=ranked.c.position))
+
+
+class RebalanceQueue:
+    """Rebalance playlists in a background thread, each playlist queued once."""
+
+    def __init__(self, max_workers=1):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._queued = {}
+        self._lock = threading.Lock()
+
+    def enqueue(self, app, playlist_id):
+        """Schedule playlist_id unless it is already queued."""
+        with self._lock:
+            if playlist_id not in self._queued:
+                self._queued[playlist_id] = self.executor.submit(self._run, app, playlist_id)
+
+    def _run(self, app, playlist_id):
+        try:
+            with app.app_context():
+                # Touch (and so lock) the playlist like move_song does, so no
+                # move reads positions that are about to be renumbered and
+                # cached pages are revalidated once they are.
+                Playlist.touch(playlist_id)
+                rebalance(playlist_id)
+                db.session.commit()
+        finally:
+            with self._lock:
+                self._queued.pop(playlist_id, None)
+
+    def wait(self, timeout=None):
+        """Block until every queued playlist has been rebalanced."""
+        with self._lock:
+            futures = list(self._queued.values())
+        for future in futures:
+            future.result(timeout)
+
+
+rebalance_queue = RebalanceQueue()
+
+
+@event.listens_for(Session, 'after_commit')
+def _schedule_rebalance(session):
+    playlist_ids = session.info.pop('rebalance', None)
+    if playlist_ids:
+        app = db.get_app()
+        for playlist_id in playlist_ids:
+            rebalance_queue.enqueue(app, playlist_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop('rebalance', None)
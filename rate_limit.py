@@ -0,0 +1,151 @@
+"""Rate limiting: a token bucket for outbound Spotify calls and login throttling."""
+
+import threading
+import time
+
+
+class RateLimited(Exception):
+    """Raised when a call could not be scheduled before its deadline."""
+
+    def __init__(self, wait):
+        super().__init__(f'rate limited, next slot in {wait:.2f}s')
+        self.wait = wait
+
+
+class TokenBucket:
+    """A token bucket kept in a shared store (see shared_store).
+
+    The bucket holds up to ``capacity`` tokens and refills at ``rate``
+    tokens per second. The bucket state lives in the store under the store
+    lock, so with the file or redis store every gunicorn worker draws from
+    the same bucket. ``pause()`` empties the bucket until a given time, which
+    is how a 429 Retry-After from Spotify holds back every worker at once.
+
+    Callers that find the bucket empty wait for the next token, but never
+    past their deadline; see ``acquire()``. Per-process counters are
+    returned by ``stats()``.
+    """
+
+    def __init__(self, store, name='spotify', rate=10, capacity=20):
+        self.store = store
+        self.key = f'ratelimit:{name}'
+        self.rate = rate
+        self.capacity = capacity
+        self._counter_lock = threading.Lock()
+        self.acquired = 0
+        self.queued = 0
+        self.throttled = 0
+        self.paused = 0
+        self.waited = 0.0
+
+    def _load(self, now):
+        state = self.store.get(self.key) or {
+            'tokens': self.capacity, 'updated': now, 'paused_until': 0}
+        elapsed = max(0, now - state['updated'])
+        state['tokens'] = min(self.capacity, state['tokens'] + elapsed * self.rate)
+        state['updated'] = now
+        return state
+
+    def _save(self, state):
+        # Expire an untouched bucket once it would have refilled anyway.
+        self.store.set(self.key, state, ttl=max(60, self.capacity / self.rate * 2))
+
+    def _try_acquire(self):
+        """Take a token if one is available; return the seconds to wait otherwise."""
+        with self.store.lock(self.key) as locked:
+            if not locked:
+                return 0.05
+            now = time.time()
+            state = self._load(now)
+            if state['paused_until'] > now:
+                wait = state['paused_until'] - now
+            elif state['tokens'] >= 1:
+                state['tokens'] -= 1
+                wait = 0
+            else:
+                wait = (1 - state['tokens']) / self.rate
+            self._save(state)
+            return wait
+
+    def acquire(self, deadline):
+        """Take a token, waiting for one until deadline (a time.time() value).
+
+        Raises RateLimited without waiting if the next token would arrive
+        after the deadline.
+        """
+        start = time.time()
+        queued = False
+        while True:
+            wait = self._try_acquire()
+            if wait == 0:
+                break
+            if time.time() + wait > deadline:
+                self._count(throttled=1)
+                raise RateLimited(wait)
+            if not queued:
+                queued = True
+                self._count(queued=1)
+            time.sleep(wait)
+        self._count(acquired=1, waited=time.time() - start)
+
+    def pause(self, seconds):
+        """Hand out no tokens for the next seconds, in every worker."""
+        with self.store.lock(self.key):
+            now = time.time()
+            state = self._load(now)
+            state['paused_until'] = max(state['paused_until'], now + seconds)
+            state['tokens'] = 0
+            self._save(state)
+        self._count(paused=1)
+
+    def _count(self, **amounts):
+        with self._counter_lock:
+            for name, amount in amounts.items():
+                setattr(self, name, getattr(self, name) + amount)
+
+    def stats(self):
+        """Return this process's counters."""
+        with self._counter_lock:
+            return {
+                'acquired': self.acquired,
+                'queued': self.queued,
+                'throttled': self.throttled,
+                'paused': self.paused,
+                'waited': self.waited,
+            }
+
+
+class AttemptThrottle:
+    """Count failed attempts per key in a shared store and block bursts.
+
+    A key is blocked once it has max_attempts failures within window
+    seconds of its first failure. Used for logins, keyed by username and
+    by client IP, so credential stuffing is turned away before any
+    password hashing is done.
+    """
+
+    def __init__(self, store, name, max_attempts=5, window=300):
+        self.store = store
+        self.prefix = f'throttle:{name}:'
+        self.max_attempts = max_attempts
+        self.window = window
+
+    def is_blocked(self, key):
+        """Has key used up its attempts for the current window?"""
+        item = self.store.get(self.prefix + key)
+        return item is not None and item['count'] >= self.max_attempts
+
+    def record_failure(self, key):
+        """Count a failed attempt for key."""
+        with self.store.lock(self.prefix + key):
+            now = time.time()
+            item = self.store.get(self.prefix + key)
+            if item is None or item['started'] + self.window <= now:
+                item = {'count': 0, 'started': now}
+            item['count'] += 1
+            self.store.set(self.prefix + key, item,
+                           ttl=max(1, item['started'] + self.window - now))
+
+    def reset(self, key):
+        """Forget key's failures, e.g. after a successful login."""
+        self.store.delete(self.prefix + key)
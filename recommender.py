@@ -0,0 +1,408 @@
+"""Personal song recommendations from likes and playlists, without Spotify.
+
+Each user's likes and each playlist is a "basket" of songs. With B the
+binary basket x song matrix, the item-item co-occurrence matrix C = B^T B
+counts the baskets every pair of songs shares; it is built with one sparse
+product. Counts become cosine scores, C_ij / sqrt(C_ii * C_jj), so popular
+songs do not neighbour everything, and each song keeps its best
+RECOMMENDER_NEIGHBOURS neighbours.
+
+A user's recommendations are the songs with the highest summed score over
+the neighbours of their liked and playlisted songs, minus those songs.
+
+Likes and playlist changes committed by this worker are applied as
+incremental updates: the changed cells of C go into a small per-row
+overlay, and only the touched songs' neighbour lists are recomputed from
+their base row plus overlay. The overlay is folded into C (one copy of the
+matrix) only once it holds RECOMMENDER_MERGE_CELLS cells, so a like does
+not copy the matrix in the request thread. Songs that merely list a
+touched song as a neighbour keep their old score for it, and changes made
+by other workers or by cascading deletes are only seen after the full
+rebuild every RECOMMENDER_REBUILD_INTERVAL seconds.
+
+Builds run in a background thread (``SongRecommender.start``, run from the
+app's first request). Requests keep using the old model until the new one
+is swapped in, and get no recommendations before the first build is done.
+Changes committed while a build loads are replayed onto the new model;
+replaying one the build already saw is a no-op.
+"""
+
+import os
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+import scipy.sparse as sp
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models import db, Song, Like, PlaylistSong
+
+
+class CoOccurrence:
+    """Item-item co-occurrence counts with the top neighbours of every item.
+
+    baskets maps a key, e.g. ('user', 1) or ('playlist', 7), to the track
+    ids in it.
+    """
+
+    def __init__(self, baskets, neighbours=20, merge_cells=100000):
+        self.neighbours = neighbours
+        self.merge_cells = merge_cells
+        self._rows = rows = {}
+        self._baskets = {}
+        self._lock = threading.Lock()
+        basket_rows, items = [], []
+        for row, (key, track_ids) in enumerate(baskets.items()):
+            # New track ids get the next row number, as in _index.
+            members = {rows.setdefault(track_id, len(rows)) for track_id in track_ids}
+            self._baskets[key] = members
+            basket_rows.extend([row] * len(members))
+            items.extend(members)
+        self._track_ids = list(rows)
+        size = len(self._track_ids)
+        incidence = sp.csr_matrix(
+            (np.ones(len(items), dtype=np.float32), (basket_rows, items)),
+            shape=(len(self._baskets), size))
+        self._counts = (incidence.T @ incidence).tocsr()
+        self._counts.sort_indices()
+        self._diagonal = self._counts.diagonal()
+        self._overlay = {}
+        self._overlay_cells = 0
+        self._top = self._top_all()
+
+    def __len__(self):
+        return len(self._track_ids)
+
+    def _index(self, track_id):
+        row = self._rows.get(track_id)
+        if row is None:
+            row = self._rows[track_id] = len(self._track_ids)
+            self._track_ids.append(track_id)
+        return row
+
+    def _row(self, item):
+        """Return (cols, counts) of an item's row in C, overlay included."""
+        counts = self._counts
+        if item + 1 < len(counts.indptr):
+            start, end = counts.indptr[item], counts.indptr[item + 1]
+            cols, shared = counts.indices[start:end], counts.data[start:end]
+        else:
+            cols, shared = np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        changes = self._overlay.get(item)
+        if changes:
+            extra = np.fromiter(changes.keys(), dtype=cols.dtype, count=len(changes))
+            deltas = np.fromiter(changes.values(), dtype=np.float32, count=len(changes))
+            found = np.zeros(len(extra), dtype=bool)
+            at = np.zeros(len(extra), dtype=np.intp)
+            if len(cols):
+                # Base rows have sorted columns, so existing cells are found by bisection.
+                at = np.minimum(np.searchsorted(cols, extra), len(cols) - 1)
+                found = cols[at] == extra
+            shared = shared.copy()
+            np.add.at(shared, at[found], deltas[found])
+            cols = np.concatenate([cols, extra[~found]])
+            shared = np.concatenate([shared, deltas[~found]])
+        return cols, shared
+
+    def _top_all(self):
+        """Return the neighbour lists of every item, computed over all of C at once."""
+        size = len(self._track_ids)
+        if size == 0:
+            return {}
+        counts = self._counts.tocoo()
+        rows, cols, shared = counts.row, counts.col, counts.data
+        keep = (rows != cols) & (shared > 0)
+        rows, cols, shared = rows[keep], cols[keep], shared[keep]
+        norms = np.sqrt(np.maximum(self._diagonal, 1))
+        scores = shared / (norms[rows] * norms[cols])
+        # Scores are at most 1, so row * 2 - score orders by row, then best
+        # first; the stable sort keeps the sorted columns in order on ties.
+        order = np.argsort(rows * 2.0 - scores, kind='stable')
+        rows, cols, scores = rows[order], cols[order], scores[order]
+        rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+        keep = rank < self.neighbours
+        rows, cols, scores = rows[keep], cols[keep], scores[keep]
+        bounds = np.searchsorted(rows, np.arange(1, size))
+        return dict(enumerate(zip(np.split(cols, bounds), np.split(scores, bounds))))
+
+    def _refresh(self, items):
+        """Recompute the neighbour lists of items (row numbers).
+
+        Lists are replaced one key at a time; readers only look keys up, so
+        they see either the old or the new list for each item.
+        """
+        for item in items:
+            cols, shared = self._row(item)
+            keep = (cols != item) & (shared > 0)
+            cols = cols[keep]
+            norms = np.sqrt(np.maximum(self._diagonal[cols], 1))
+            scores = shared[keep] / (np.sqrt(max(self._diagonal[item], 1)) * norms)
+            if len(cols) > self.neighbours:
+                # Keep everything above the n-th best score, then fill up
+                # with the lowest columns scoring exactly that, as _top_all does.
+                cutoff = np.partition(scores, len(scores) - self.neighbours)[len(scores) - self.neighbours]
+                above = np.flatnonzero(scores > cutoff)
+                tied = np.flatnonzero(scores == cutoff)
+                tied = tied[np.argsort(cols[tied], kind='stable')][:self.neighbours - len(above)]
+                best = np.concatenate([above, tied])
+                cols, scores = cols[best], scores[best]
+            order = np.lexsort((cols, -scores))
+            self._top[item] = (cols[order], scores[order])
+
+    def update(self, changes):
+        """Apply (basket key, track id, +1 or -1) changes without a rebuild."""
+        with self._lock:
+            touched = set()
+            for key, track_id, sign in changes:
+                item = self._index(track_id)
+                members = self._baskets.setdefault(key, set())
+                if (item in members) == (sign > 0):
+                    continue
+                members.discard(item)
+                self._grow(len(self._track_ids))
+                self._diagonal[item] += sign
+                self._add(item, item, sign)
+                for other in members:
+                    self._add(item, other, sign)
+                    self._add(other, item, sign)
+                touched.add(item)
+                touched.update(members)
+                if sign > 0:
+                    members.add(item)
+            if not touched:
+                return
+            self._refresh(touched)
+            if self._overlay_cells >= self.merge_cells:
+                self._merge()
+
+    def _add(self, row, col, delta):
+        changes = self._overlay.setdefault(row, {})
+        if col not in changes:
+            self._overlay_cells += 1
+        changes[col] = changes.get(col, 0) + delta
+
+    def _grow(self, size):
+        if size > len(self._diagonal):
+            diagonal = np.zeros(max(size, 2 * len(self._diagonal)), dtype=self._diagonal.dtype)
+            diagonal[:len(self._diagonal)] = self._diagonal
+            self._diagonal = diagonal
+
+    def _merge(self):
+        """Fold the overlay into the base matrix (copies the matrix once)."""
+        rows, cols, values = [], [], []
+        for row, changes in self._overlay.items():
+            rows.extend([row] * len(changes))
+            cols.extend(changes.keys())
+            values.extend(changes.values())
+        size = len(self._track_ids)
+        delta = sp.csr_matrix((np.asarray(values, dtype=np.float32), (rows, cols)), shape=(size, size))
+        self._counts.resize((size, size))
+        counts = self._counts + delta
+        counts.eliminate_zeros()
+        counts.sort_indices()
+        self._counts = counts
+        self._overlay = {}
+        self._overlay_cells = 0
+
+    def neighbours_of(self, track_id):
+        """Return [(track_id, score)] for a song's nearest neighbours, best first."""
+        row = self._rows.get(track_id)
+        if row not in self._top:
+            return []
+        cols, scores = self._top[row]
+        return [(self._track_ids[col], float(score)) for col, score in zip(cols, scores)]
+
+    def recommend(self, keys, n=10):
+        """Return up to n (track_id, score) pairs for the songs in baskets keys, best first."""
+        with self._lock:
+            seeds = set().union(*(self._baskets.get(key, ()) for key in keys))
+        top = self._top
+        lists = [top[seed] for seed in seeds if seed in top]
+        if not lists:
+            return []
+        candidates, inverse = np.unique(np.concatenate([cols for cols, _ in lists]), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate([scores for _, scores in lists]))
+        keep = ~np.isin(candidates, list(seeds))
+        candidates, totals = candidates[keep], totals[keep]
+        if len(candidates) == 0:
+            return []
+        k = min(n, len(candidates))
+        best = np.argpartition(-totals, k - 1)[:k]
+        best = best[np.lexsort((candidates[best], -totals[best]))]
+        return [(self._track_ids[candidates[i]], float(totals[i])) for i in best]
+
+
+class SongRecommender:
+    """A CoOccurrence model kept in step with the likes and playlist_songs tables."""
+
+    def __init__(self, neighbours=20, rebuild_interval=600, merge_cells=100000):
+        self.neighbours = neighbours
+        self.merge_cells = merge_cells
+        self.rebuild_interval = rebuild_interval
+        self.model = None
+        self._song_track_ids = {}
+        self._pending = []
+        self._replay = None
+        self._lock = threading.Lock()
+        self._building = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+    def _load(self):
+        baskets = defaultdict(set)
+        song_track_ids = {}
+        for user_id, track_id in db.session.query(Like.user_id, Like.song_id):
+            baskets[('user', user_id)].add(track_id)
+        rows = db.session.query(PlaylistSong.playlist_id, Song.id, Song.track_id).join(
+            Song, Song.id == PlaylistSong.song_id)
+        for playlist_id, song_id, track_id in rows:
+            baskets[('playlist', playlist_id)].add(track_id)
+            song_track_ids[song_id] = track_id
+        return CoOccurrence(baskets, self.neighbours, self.merge_cells), song_track_ids
+
+    def start(self, app):
+        """Build the model and rebuild it every rebuild_interval in a background thread, once."""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._schedule, args=(app,), daemon=True)
+                self._thread.start()
+
+    def _schedule(self, app):
+        while True:
+            try:
+                with app.app_context():
+                    self.sync(force=True)
+            except Exception:
+                # Keep serving the model we have; the next rebuild tries again.
+                pass
+            time.sleep(self.rebuild_interval)
+
+    def sync(self, force=False):
+        """Build the model if there is none (or force), then apply pending changes.
+
+        Runs in the caller's thread; requests rely on ``start`` instead.
+        Only one build runs at a time, and the current model keeps serving
+        (and taking changes) while it does.
+        """
+        if force or self.model is None:
+            with self._building:
+                self._rebuild()
+        self._apply_pending()
+
+    def _rebuild(self):
+        with self._lock:
+            self._replay = []
+        try:
+            model, song_track_ids = self._load()
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+        with self._lock:
+            replay, self._replay = self._replay, None
+            self.model, self._song_track_ids = model, song_track_ids
+        model.update(replay)
+
+    def note(self, changes):
+        """Queue (basket key, track id or ('song', Song.id), sign) changes for a built model."""
+        if self.model is None and self._replay is None:
+            return
+        with self._lock:
+            self._pending.extend(changes)
+
+    def _apply_pending(self):
+        with self._lock:
+            changes, self._pending = self._pending, []
+        if not changes:
+            return
+        # Playlist rows only know the Song primary key; look up the rest in one query.
+        unknown = {item[1] for _, item, _ in changes
+                   if isinstance(item, tuple) and item[1] not in self._song_track_ids}
+        if unknown:
+            self._song_track_ids.update(db.session.query(Song.id, Song.track_id).filter(Song.id.in_(unknown)))
+        resolved = []
+        for key, item, sign in changes:
+            if isinstance(item, tuple):
+                item = self._song_track_ids.get(item[1])
+            if item is not None:
+                resolved.append((key, item, sign))
+        with self._lock:
+            model = self.model
+            if self._replay is not None:
+                self._replay.extend(resolved)
+        if model is not None:
+            model.update(resolved)
+
+    def recommend(self, user_id, playlist_ids, n=10):
+        """Return up to n track ids for a user with the given playlists.
+
+        Returns [] until the first build is done.
+        """
+        self._apply_pending()
+        if self.model is None:
+            return []
+        keys = [('user', user_id)] + [('playlist', playlist_id) for playlist_id in playlist_ids]
+        return [track_id for track_id, _ in self.model.recommend(keys, n)]
+
+
+recommender = SongRecommender(
+    neighbours=int(os.environ.get('RECOMMENDER_NEIGHBOURS', 20)),
+    rebuild_interval=int(os.environ.get('RECOMMENDER_REBUILD_INTERVAL', 600)),
+    merge_cells=int(os.environ.get('RECOMMENDER_MERGE_CELLS', 100000)),
+)
+
+
+def recommended_songs(user_id, playlist_ids, n=10):
+    """Return up to n stored Songs recommended for a user, best first."""
+    track_ids = recommender.recommend(user_id, playlist_ids, n)
+    if not track_ids:
+        return []
+    songs = {song.track_id: song for song in Song.query.filter(Song.track_id.in_(track_ids))}
+    return [songs[track_id] for track_id in track_ids if track_id in songs]
+
+
+def note_playlist_songs(playlist_id, songs):
+    """Tell the recommender about songs added to a playlist without the ORM (bulk inserts)."""
+    session = db.session()
+    session.info.setdefault('recommender', []).extend(
+        (('playlist', playlist_id), song.track_id, 1) for song in songs)
+
+
+def _note(target, change):
+    object_session(target).info.setdefault('recommender', []).append(change)
+
+
+@event.listens_for(Like, 'after_insert')
+def _like_inserted(mapper, connection, target):
+    _note(target, (('user', target.user_id), target.song_id, 1))
+
+
+@event.listens_for(Like, 'after_delete')
+def _like_deleted(mapper, connection, target):
+    _note(target, (('user', target.user_id), target.song_id, -1))
+
+
+@event.listens_for(PlaylistSong, 'after_insert')
+def _playlist_song_inserted(mapper, connection, target):
+    _note(target, (('playlist', target.playlist_id), ('song', target.song_id), 1))
+
+
+@event.listens_for(PlaylistSong, 'after_delete')
+def _playlist_song_deleted(mapper, connection, target):
+    _note(target, (('playlist', target.playlist_id), ('song', target.song_id), -1))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_committed(session):
+    changes = session.info.pop('recommender', None)
+    if changes:
+        recommender.note(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop('recommender', None)
@@ -1,5 +1,4 @@
-from flask import Blueprint, render_template, redirect, flash, g
-from models import User
+from flask import Blueprint, render_template, redirect, flash, g, request
 from helper_functions import get_token, get_albums, get_album_tracks
 
 albums_bp = Blueprint('albums', __name__, template_folder='templates', static_folder='static')
@@ -13,7 +12,7 @@ def get_artist_albums(artist_id):
     try:
         user = g.user
         token = get_token()
-        result = get_albums(artist_id, token)
+        result = get_albums(artist_id, token, request.args.get("include_groups"))
         return render_template("/music/albums.html", result=result, user=user), 200
     except:
         flash("Something went wrong. Please try again.", "danger")
@@ -29,6 +28,7 @@ def get_songs(album_id):
         token = get_token()
         result = get_album_tracks(album_id, token)
         user = g.user
+        user.load_likes(track['track_id'] for track in result)
         playlists = [(playlist.id, playlist.name) for playlist in user.playlists]
         return render_template("/music/track_listing.html", result=result, user=user, playlists=playlists), 200
     except:
@@ -1,6 +1,16 @@
-from flask import Blueprint, render_template, redirect, flash, g, request
-from models import db, User, Playlist, PlaylistSong, Song
-from helper_functions import get_token, get_audio_analysis
+import os
+
+from flask import Blueprint, render_template, redirect, flash, g, request, jsonify, make_response
+from sqlalchemy.dialects.postgresql import insert
+from models import db, Playlist, PlaylistSong, PlaylistStats, Song
+from song_analysis import get_album_track_infos, get_or_create_songs
+from enrichment import enqueue
+from recommender import note_playlist_songs
+from playlist_order import move_song
+from http_cache import make_etag, not_modified, not_modified_response, with_etag
+
+MAX_BULK_TRACKS = 500
+SONGS_PAGE_SIZE = int(os.environ.get('PLAYLIST_PAGE_SIZE', 100))
 
 playlist_bp = Blueprint('playlists', __name__, template_folder='templates', static_folder='static')
 
@@ -11,7 +21,8 @@ def show_playlists():
         flash("Access unauthorized.", "danger")
         return redirect("/")
     user = g.user
-    playlists = Playlist.query.filter(Playlist.user_id == user.id).all()
+    cursor = request.args.get("after")
+    playlists, next_cursor = Playlist.for_user_with_counts(user.id, cursor)
     if request.method == "POST":
         try:
             data = request.get_json()
@@ -23,11 +34,14 @@ def show_playlists():
                 db.session.add(playlist)
                 db.session.commit()
                 flash("Playlist created", "success")
-                return render_template("/music/playlists.html", user=user, playlists=playlists), 200
+                return render_template("/music/playlists.html", user=user, playlists=playlists,
+                                       cursor=cursor, next_cursor=next_cursor), 200
         except:
             flash("Error occurred while creating the playlist", "danger")
-            return render_template("/music/playlists.html", user=user, playlists=playlists), 500
-    return render_template("/music/playlists.html", user=user, playlists=playlists), 200
+            return render_template("/music/playlists.html", user=user, playlists=playlists,
+                                   cursor=cursor, next_cursor=next_cursor), 500
+    return render_template("/music/playlists.html", user=user, playlists=playlists,
+                           cursor=cursor, next_cursor=next_cursor), 200
 
 @playlist_bp.route("/add", methods=["POST"])
 def add_song_to_playlist():
@@ -44,28 +58,116 @@ def add_song_to_playlist():
         name=playlist_name, description=playlist_description, user_id=user.id
     )
     db.session.add(playlist)
-    # Add the song to the newly created playlist, only if a track_id is provided
-    if track_id:
-        token = get_token()
-        result = get_audio_analysis(track_id, token)
-        song = Song.query.filter(Song.track_id == track_id).first()
-        if not song:
-            song = Song.create_song(result)
-            db.session.add(song)
-            db.session.commit()
-        playlist_song = PlaylistSong(
-            playlist_id=playlist.id, song_id=song.id, user_id=user.id
-        )
-        db.session.add(playlist_song)
-        db.session.commit()  
+    song = None
     try:
+        # Add the song to the newly created playlist, only if a track_id is provided
+        if track_id:
+            db.session.flush()
+            song = Song.create_pending(track_id)
+            playlist_song = PlaylistSong(
+                playlist_id=playlist.id, song_id=song.id, user_id=user.id
+            )
+            db.session.add(playlist_song)
         db.session.commit()
+        if song:
+            enqueue(song)
     except Exception as e:
         db.session.rollback()
         flash("Error occurred while adding the song to the playlist", "danger"), 500
 
     return redirect(f"/playlists/{playlist.id}"), 200
 
+@playlist_bp.route("/<int:playlist_id>/bulk", methods=["POST"])
+def bulk_add_to_playlist(playlist_id):
+    """Add a whole album or a list of tracks to a playlist in one transaction.
+
+    Expects JSON with either "album_id" or "track_ids" (at most
+    MAX_BULK_TRACKS, or the request is refused with 400) and returns a
+    status per track: "added", "already_in_playlist" or "not_found".
+    """
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+    playlist = Playlist.query.get_or_404(playlist_id)
+    if playlist.user_id != g.user.id:
+        return jsonify(message="Access unauthorized."), 403
+    data = request.get_json() or {}
+    if not data.get("album_id") and len(set(data.get("track_ids") or [])) > MAX_BULK_TRACKS:
+        return jsonify(message=f"At most {MAX_BULK_TRACKS} tracks can be added at once."), 400
+    try:
+        known_tracks = {}
+        if data.get("album_id"):
+            known_tracks = get_album_track_infos(data["album_id"])
+            track_ids = list(known_tracks)
+        else:
+            track_ids = list(dict.fromkeys(data.get("track_ids") or []))
+        songs = get_or_create_songs(track_ids, known_tracks)
+        in_playlist = {row.song_id for row in db.session.query(PlaylistSong.song_id).filter(
+            PlaylistSong.playlist_id == playlist_id,
+            PlaylistSong.song_id.in_([song.id for song in songs.values()]))}
+        new_rows = [{"playlist_id": playlist_id, "song_id": song.id, "user_id": g.user.id}
+                    for song in songs.values() if song.id not in in_playlist]
+        added = set()
+        if new_rows:
+            # A concurrent add of the same songs wins those rows; ours are skipped.
+            added = {row.song_id for row in db.session.execute(
+                insert(PlaylistSong.__table__).values(new_rows).on_conflict_do_nothing(
+                    index_elements=["playlist_id", "song_id"]).returning(PlaylistSong.__table__.c.song_id))}
+        results = []
+        for track_id in track_ids:
+            song = songs.get(track_id)
+            if song is None:
+                status = "not_found"
+            elif song.id in added:
+                status = "added"
+            else:
+                status = "already_in_playlist"
+            results.append({"track_id": track_id, "status": status})
+        if added:
+            added_songs = [song for song in songs.values() if song.id in added]
+            PlaylistStats.add_songs(playlist_id, added_songs)
+            note_playlist_songs(playlist_id, added_songs)
+            Playlist.touch(playlist_id)
+        db.session.commit()
+        return jsonify(results=results, added=len(added)), 200
+    except:
+        db.session.rollback()
+        return jsonify(message="Something went wrong. Please try again."), 500
+
+@playlist_bp.route("/<int:playlist_id>/songs/<int:song_id>/move", methods=["POST"])
+def move_playlist_song(playlist_id, song_id):
+    """Move a song within a playlist.
+
+    Expects JSON with either "index" (the new 0-based place), "after" (the
+    id of the song it should follow, null for the top) or "before" (the id
+    of the song it should precede), as sent when a song is dragged to a new
+    place.
+    """
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+    playlist = Playlist.query.get_or_404(playlist_id)
+    if playlist.user_id != g.user.id:
+        return jsonify(message="Access unauthorized."), 403
+    data = request.get_json() or {}
+    if not {"index", "after", "before"} & set(data):
+        return jsonify(message="Give an index or the song to move after or before."), 400
+    try:
+        if "index" in data:
+            moved = move_song(playlist_id, song_id, index=int(data["index"]))
+        elif data.get("before") is not None:
+            moved = move_song(playlist_id, song_id, before=data["before"])
+        else:
+            moved = move_song(playlist_id, song_id, after=data.get("after"))
+        if not moved:
+            db.session.rollback()
+            return jsonify(message="Song not found in this playlist."), 404
+        db.session.commit()
+        return jsonify(message="Song moved"), 200
+    except:
+        db.session.rollback()
+        return jsonify(message="Something went wrong. Please try again."), 500
+
 @playlist_bp.route("/<int:playlist_id>", methods=["GET", "POST"])
 def show_playlist(playlist_id):
     """Show playlist."""
@@ -74,9 +176,17 @@ def show_playlist(playlist_id):
         return redirect("/")
     try:
         user = g.user
-        playlist = Playlist.query.get_or_404(playlist_id)
-        songs = PlaylistSong.query.filter(PlaylistSong.playlist_id == playlist_id).all()
-        return render_template("/music/playlist.html", user=user, playlist=playlist, songs=songs), 200
+        playlist = Playlist.query.options(db.joinedload(Playlist.stats)).get_or_404(playlist_id)
+        cursor = request.args.get("after")
+        etag = make_etag("playlist", playlist.id, playlist.version, cursor)
+        if not_modified(etag):
+            return not_modified_response(etag)
+        songs, next_cursor = playlist.songs_page(cursor, SONGS_PAGE_SIZE)
+        response = make_response(render_template(
+            "/music/playlist.html", user=user, playlist=playlist, songs=songs,
+            cursor=cursor, next_cursor=next_cursor), 200)
+        response.last_modified = playlist.updated_at
+        return with_etag(response, etag)
     except:
         flash("Error occurred while showing the playlist", "danger")
         return redirect("/playlists"), 500
@@ -91,7 +201,12 @@ def track_details(playlist_id, track_id):
         user = g.user
         playlist = Playlist.query.get_or_404(playlist_id)
         song = Song.query.filter(Song.track_id == track_id).first()
-        return render_template("/music/song_details.html", user=user, playlist=playlist, song=song), 200
+        etag = make_etag("song", playlist.id, song.version if song else None)
+        if not_modified(etag):
+            return not_modified_response(etag)
+        response = make_response(render_template(
+            "/music/song_details.html", user=user, playlist=playlist, song=song), 200)
+        return with_etag(response, etag)
     except:
         flash("Error occurred while showing the track details", "danger")
         return redirect(f"/playlists/{playlist_id}"), 500
@@ -120,6 +235,7 @@ def delete_song(playlist_id, song_id):
     try:
         playlist_song = PlaylistSong.query.filter(PlaylistSong.playlist_id == playlist_id, PlaylistSong.song_id == song_id).first()
         db.session.delete(playlist_song)
+        Playlist.touch(playlist_id)
         db.session.commit()
         return redirect(f"/playlists/{playlist_id}"), 200
     except:
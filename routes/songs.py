@@ -1,6 +1,8 @@
 from flask import Blueprint, jsonify, request, redirect, flash, g, render_template
-from models import db, Song, User, Like, PlaylistSong
-from helper_functions import get_token, get_audio_analysis
+from models import db, Song, Like, Playlist, PlaylistSong
+from song_analysis import get_song_analysis
+from enrichment import enqueue
+from similarity import similar_songs
 songs_bp = Blueprint('songs', __name__, template_folder='templates', static_folder='static')
 
 @songs_bp.route("/<track_id>", methods=["GET", "POST"])
@@ -11,33 +13,28 @@ def song_details(track_id):
         return redirect("/")
 
     user = g.user
-    playlists = [(playlist.id, playlist.name) for playlist in user.playlists]
-
-    token = get_token()
-    result = get_audio_analysis(track_id, token)
 
     if request.method == "POST":
         try:
             data = request.get_json()
             playlist_id = data.get("playlist_id")
-            song = Song.query.filter(Song.track_id == track_id).first()
-            if not song:
-                song = Song.create_song(result)
-                db.session.add(song)
-                db.session.commit()
-            playlist_song = PlaylistSong(
-                playlist_id=playlist_id, song_id=song.id, user_id=user.id
-            )
-            db.session.add(playlist_song)
+            song = Song.create_pending(track_id)
+            PlaylistSong.add_to_playlist(playlist_id, song.id, user.id)
+            Playlist.touch(playlist_id)
             db.session.commit()
+            enqueue(song)
             flash("Song added to playlist", "success")
             return redirect(f"user/playlists/{playlist_id}"), 200
         except:
             flash("Something went wrong. Please try again.", "danger")
             return redirect("/")
     else:
+        playlists = [(playlist.id, playlist.name) for playlist in user.playlists]
+        result = get_song_analysis(track_id)
+        similar = similar_songs(result)
+        user.load_likes([track_id])
         return render_template("/music/audio_analysis.html",result=result,user=user,
-        track_id=track_id,playlists=playlists,)
+        track_id=track_id,playlists=playlists,similar=similar,)
 
 @songs_bp.route("/<track_id>/like", methods=["POST"])
 def like_song(track_id):
@@ -47,17 +44,11 @@ def like_song(track_id):
         return redirect("/")
     
     user = g.user
-    song = Song.query.filter_by(track_id=track_id).first()
     try:
-        if not song:
-            token = get_token()
-            result = get_audio_analysis(track_id, token)
-            song = Song.create_song(result)
-            db.session.add(song)
-            db.session.commit()
-
+        song = Song.create_pending(track_id)
         like = Like.like_song(user.id, song.track_id)
         db.session.commit()
+        enqueue(song)
 
         return jsonify(message="Song liked!"), 200
     except:
@@ -72,16 +63,8 @@ def unlike_song(track_id):
         return redirect("/")
     try:
         user = g.user
-        song = Song.query.filter_by(track_id=track_id).first()
-
-        if not song:
-            token = get_token()
-            result = get_audio_analysis(track_id, token)
-            song = Song.create_song(result)
-            db.session.add(song)
-            db.session.commit()
-
-        Like.unlike_song(user.id, song.track_id)
+        # A song that was never stored cannot have been liked.
+        Like.unlike_song(user.id, track_id)
         db.session.commit()
         return jsonify(message="Song unliked!"), 200
     except:
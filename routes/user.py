@@ -1,13 +1,26 @@
+import os
+
 from flask import Blueprint, render_template, redirect, flash, session, g, request
 from sqlalchemy.exc import IntegrityError
-from models import db, User, Playlist
+from models import db, User, Playlist, Like
 from forms import SignUpForm, LoginForm, EditUserForm
-from helper_functions import get_token, get_pop_recommendations
+from feeds import pop_recommendations
+from recommender import recommended_songs
+from http_cache import no_store
+from rate_limit import AttemptThrottle
+from shared_store import get_store
 
 CURR_USER_KEY = "curr_user"
 
 user_bp = Blueprint('user', __name__, template_folder='templates', static_folder='static')
 
+# Failed logins allowed per username and per client IP within the window.
+LOGIN_THROTTLE_WINDOW = int(os.environ.get('LOGIN_THROTTLE_WINDOW', 300))
+username_throttle = AttemptThrottle(
+    get_store(), 'login-user', int(os.environ.get('LOGIN_MAX_ATTEMPTS', 5)), LOGIN_THROTTLE_WINDOW)
+ip_throttle = AttemptThrottle(
+    get_store(), 'login-ip', int(os.environ.get('LOGIN_MAX_ATTEMPTS_PER_IP', 20)), LOGIN_THROTTLE_WINDOW)
+
 def do_login(user):
     """Log in user."""
     session[CURR_USER_KEY] = user.id
@@ -18,6 +31,7 @@ def do_logout():
         del session[CURR_USER_KEY]
 
 @user_bp.route("/register", methods=["GET", "POST"])
+@no_store
 def signup():
     """Handle user signup."""
     form = SignUpForm()
@@ -44,15 +58,26 @@ def signup():
         return render_template("register.html", form=form)
 
 @user_bp.route("/login", methods=["GET", "POST"])
+@no_store
 def login():
     """Handle user login."""
     form = LoginForm()
     try:
         if form.validate_on_submit():
-            user = User.authenticate(form.username.data, form.password.data)
+            username = form.username.data
+            ip = request.remote_addr or "unknown"
+            if username_throttle.is_blocked(username) or ip_throttle.is_blocked(ip):
+                flash("Too many login attempts. Please try again later.", "danger")
+                return render_template("/user/login.html", form=form), 429
+            user = User.authenticate(username, form.password.data)
             if user:
+                # Saves the password hash if authenticate upgraded it.
+                db.session.commit()
+                username_throttle.reset(username)
                 do_login(user)
                 return redirect(f"/user")
+            username_throttle.record_failure(username)
+            ip_throttle.record_failure(ip)
             flash("Invalid credentials.", "danger")
         return render_template("/user/login.html", form=form), 200
     except:
@@ -60,6 +85,7 @@ def login():
         return redirect("/")
 
 @user_bp.route("/logout")
+@no_store
 def logout():
     """Handle logout of user."""
     do_logout()
@@ -74,15 +100,35 @@ def user_profile():
         return redirect("/")
     try:
         user = g.user
-        playlists = Playlist.query.filter(Playlist.user_id == user.id).all()
-        token = get_token()
-        result = get_pop_recommendations(token)
+        cursor = request.args.get("after")
+        playlists, next_cursor = Playlist.for_user_with_counts(user.id, cursor)
+        recommended = recommended_songs(user.id, Playlist.ids_for_user(user.id))
+        result = pop_recommendations.get()
+        user.load_likes([song.track_id for song in recommended] + [track['track_id'] for track in result])
         return render_template(
-            "/user/user.html", user=user, playlists=playlists, result=result), 200
+            "/user/user.html", user=user, playlists=playlists, result=result, recommended=recommended,
+            cursor=cursor, next_cursor=next_cursor), 200
     except:
         flash("Something went wrong. Please try again.", "danger")
         return redirect("/")
 
+@user_bp.route("/likes")
+def liked_songs():
+    """Show the songs the user liked, newest first, a page at a time."""
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+    try:
+        user = g.user
+        cursor = request.args.get("after")
+        likes, next_cursor = Like.songs_for_user(user.id, cursor)
+        user.load_likes(song.track_id for song, _ in likes)
+        return render_template(
+            "/user/likes.html", user=user, likes=likes, cursor=cursor, next_cursor=next_cursor), 200
+    except:
+        flash("Something went wrong. Please try again.", "danger")
+        return redirect("/user")
+
 @user_bp.route("/delete", methods=["POST"])
 def delete_user():
     """Delete user."""
@@ -90,7 +136,7 @@ def delete_user():
         flash("Access unauthorized.", "danger")
         return redirect("/")
     try:
-        user = g.user
+        user = g.user._get_current_object()
         db.session.delete(user)
         db.session.commit()
         do_logout()
@@ -101,6 +147,7 @@ def delete_user():
         return redirect("/")
 
 @user_bp.route("/edit", methods=["GET", "POST"])
+@no_store
 def edit_user():
     """Edit user profile."""
     if not g.user:
@@ -0,0 +1,178 @@
+"""Small key/value stores for state shared between gunicorn workers.
+
+Pick one with the SHARED_STORE environment variable:
+
+- ``memory`` (default): process-local, fine for ``flask run`` and tests.
+- ``file``: JSON files plus ``fcntl`` locks in SHARED_STORE_DIR, shared by
+  every worker on one machine.
+- ``redis``: shared by every worker that can reach REDIS_URL.
+
+Values must be JSON serializable.
+"""
+
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import redis
+
+
+class MemoryStore:
+    """Process-local store backed by a dict."""
+
+    def __init__(self):
+        self._data = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def get(self, key):
+        """Return the value stored under key, or None if missing or expired."""
+        with self._guard:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store value under key, expiring after ttl seconds if given."""
+        expires_at = time.time() + ttl if ttl else None
+        with self._guard:
+            self._data[key] = (value, expires_at)
+
+    def delete(self, key):
+        """Remove key if present."""
+        with self._guard:
+            self._data.pop(key, None)
+
+    @contextmanager
+    def lock(self, key, blocking=True, timeout=10):
+        """Hold a named lock. Yields False if it could not be acquired."""
+        with self._guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+        acquired = lock.acquire(blocking, timeout if blocking else -1)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                lock.release()
+
+
+class FileStore:
+    """Store backed by one JSON file per key, locked with fcntl.flock."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, suffix='.json'):
+        safe = ''.join(c if c.isalnum() or c in '-_' else '_' for c in key)
+        return os.path.join(self.directory, safe + suffix)
+
+    def get(self, key):
+        """Return the value stored under key, or None if missing or expired."""
+        try:
+            with open(self._path(key)) as f:
+                item = json.load(f)
+        except (OSError, ValueError):
+            return None
+        expires_at = item.get('expires_at')
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return item.get('value')
+
+    def set(self, key, value, ttl=None):
+        """Atomically replace the file for key."""
+        item = {'value': value, 'expires_at': time.time() + ttl if ttl else None}
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(item, f)
+        os.replace(tmp_path, self._path(key))
+
+    def delete(self, key):
+        """Remove key if present."""
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def lock(self, key, blocking=True, timeout=10):
+        """Hold an exclusive flock on the key's lock file."""
+        with open(self._path(key, '.lock'), 'a') as f:
+            deadline = time.time() + timeout
+            acquired = False
+            while True:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    acquired = True
+                    break
+                except BlockingIOError:
+                    if not blocking or time.time() >= deadline:
+                        break
+                    time.sleep(0.05)
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class RedisStore:
+    """Store backed by Redis, shared by every worker that can reach it."""
+
+    def __init__(self, url, prefix='maestro:'):
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        """Return the value stored under key, or None if missing or expired."""
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        """Store value under key, expiring after ttl seconds if given."""
+        self.client.set(self.prefix + key, json.dumps(value), ex=int(ttl) if ttl else None)
+
+    def delete(self, key):
+        """Remove key if present."""
+        self.client.delete(self.prefix + key)
+
+    @contextmanager
+    def lock(self, key, blocking=True, timeout=10):
+        """Hold a Redis lock that expires on its own if the holder dies."""
+        lock = self.client.lock(self.prefix + key + ':lock', timeout=timeout * 3)
+        acquired = lock.acquire(blocking=blocking, blocking_timeout=timeout)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                try:
+                    lock.release()
+                except redis.exceptions.LockError:
+                    pass
+
+
+_store = None
+
+
+def get_store():
+    """Return the store configured through the environment."""
+    global _store
+    if _store is None:
+        kind = os.environ.get('SHARED_STORE', 'memory')
+        if kind == 'redis':
+            _store = RedisStore(os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+        elif kind == 'file':
+            _store = FileStore(os.environ.get(
+                'SHARED_STORE_DIR', os.path.join(tempfile.gettempdir(), 'maestro-store')))
+        else:
+            _store = MemoryStore()
+    return _store
@@ -0,0 +1,107 @@
+"""Read-through audio analysis cache backed by the songs table."""
+
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Song, Playlist
+from similarity import note_songs
+from helper_functions import (
+    get_token,
+    get_audio_analysis,
+    get_album_payload,
+    get_tracks,
+    get_audio_features,
+    run_parallel,
+)
+
+
+def get_song_analysis(track_id):
+    """Return the audio analysis for track_id.
+
+    Served from the Song row when it holds a complete analysis that is not
+    older than the ANALYSIS_MAX_AGE config value (seconds, None = never
+    stale). Otherwise the analysis is fetched from Spotify and written back
+    to the Song row, creating it if needed.
+    """
+    max_age = current_app.config.get('ANALYSIS_MAX_AGE')
+    song = Song.get_song(track_id)
+    if song and song.has_analysis(max_age):
+        return song.to_analysis()
+
+    result = get_audio_analysis(track_id, get_token())
+    if song:
+        song.update_analysis(result)
+        Playlist.touch_containing(song.id)
+    else:
+        db.session.add(Song.create_song(result))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another request stored the same track first; its row is as good.
+        db.session.rollback()
+    return result
+
+
+def get_album_track_infos(album_id):
+    """Return {track_id: track info} for an album's tracks, in album order.
+
+    Built from the cached album body, so no per-track call is needed.
+    """
+    album = get_album_payload(album_id, get_token())
+    album_art = album['images'][0]['url'] if album['images'] else None
+    return {item['id']: {
+        'track_id': item['id'],
+        'track_name': item['name'],
+        'track_uri': item['uri'],
+        'artist_name': item['artists'][0]['name'],
+        'artist_id': item['artists'][0]['id'],
+        'album': album['name'],
+        'album_id': album['id'],
+        'album_art': album_art,
+    } for item in album['tracks']['items']}
+
+
+def get_or_create_songs(track_ids, known_tracks=None):
+    """Return {track_id: Song} for track_ids, storing the missing ones.
+
+    Tracks already in the songs table are not fetched again. Missing tracks
+    get their metadata from known_tracks or /tracks?ids= and their analysis
+    fields from /audio-features?ids=, both in parallel, and are inserted
+    with a single multi-row INSERT; rows another request inserted first are
+    kept. Ids Spotify doesn't know are left out. Nothing is committed.
+    """
+    songs = {song.track_id: song for song in Song.query.filter(Song.track_id.in_(track_ids))}
+    missing = [track_id for track_id in track_ids if track_id not in songs]
+    if not missing:
+        return songs
+
+    token = get_token()
+    known_tracks = known_tracks or {}
+    unknown = [track_id for track_id in missing if track_id not in known_tracks]
+    fetched, features = run_parallel(
+        lambda: get_tracks(unknown, token) if unknown else {},
+        lambda: get_audio_features(missing, token),
+    )
+    now = datetime.utcnow()
+    rows = []
+    for track_id in missing:
+        info = known_tracks.get(track_id) or fetched.get(track_id)
+        if info is None:
+            continue
+        row = dict.fromkeys(Song.ANALYSIS_FIELDS)
+        row.update(features.get(track_id, {}))
+        row.update(info)
+        row['analyzed_at'] = now
+        rows.append(row)
+    if rows:
+        columns = Song.__table__.columns.keys()
+        db.session.execute(insert(Song.__table__).values(
+            [{key: value for key, value in row.items() if key in columns} for row in rows]
+        ).on_conflict_do_nothing(index_elements=['track_id']))
+        note_songs(rows)
+        new_ids = [row['track_id'] for row in rows]
+        songs.update((song.track_id, song) for song in Song.query.filter(Song.track_id.in_(new_ids)))
+    return songs
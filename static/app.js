@@ -5,6 +5,7 @@ $(document).ready(function () {
 	const createPlaylistForm = $('#create-add-playlist');
 
 	let currentTrackId = null;
+	let currentAlbumId = null;
 
 	$('[id^="like-icon-"]').on('click', async function (e) {
 		e.preventDefault();
@@ -32,13 +33,19 @@ $(document).ready(function () {
 
 	myModalElement.on('shown.bs.modal', function (e) {
 		const button = $(e.relatedTarget);
-		currentTrackId = button.data('track-id');
+		currentTrackId = button.data('track-id') || null;
+		currentAlbumId = button.data('album-id') || null;
 	});
 
 	playlistForm.on('submit', async function (e) {
 		e.preventDefault();
 		const playlist_id = $('#playlist').val();
 
+		if (currentAlbumId) {
+			await axios.post(`/playlists/${playlist_id}/bulk`, { album_id: currentAlbumId });
+			return;
+		}
+
 		if (!currentTrackId) {
 			console.error('No track ID found');
 			return;
@@ -129,6 +136,58 @@ $(document).ready(function () {
 		}
 	}
 
+	// Drag a playlist song to a new place; the server stores the move
+	// relative to the song it now follows, or precedes when it is dropped at
+	// the top of a later page.
+	const playlistSongs = $('#playlist-songs');
+	let draggedSong = null;
+
+	playlistSongs.on('dragstart', '.playlist-song', function (e) {
+		draggedSong = $(this);
+		e.originalEvent.dataTransfer.effectAllowed = 'move';
+	});
+
+	playlistSongs.on('dragover', '.playlist-song', function (e) {
+		e.preventDefault();
+		const target = $(this);
+		if (!draggedSong || target.is(draggedSong)) {
+			return;
+		}
+		const box = this.getBoundingClientRect();
+		if (e.originalEvent.clientY < box.top + box.height / 2) {
+			target.before(draggedSong);
+		} else {
+			target.after(draggedSong);
+		}
+	});
+
+	playlistSongs.on('drop', function (e) {
+		e.preventDefault();
+	});
+
+	playlistSongs.on('dragend', '.playlist-song', async function () {
+		if (!draggedSong) {
+			return;
+		}
+		const playlistId = playlistSongs.data('playlist-id');
+		const songId = draggedSong.data('song-id');
+		const previous = draggedSong.prev('.playlist-song');
+		const next = draggedSong.next('.playlist-song');
+		draggedSong = null;
+		let move = { after: null };
+		if (previous.length) {
+			move = { after: previous.data('song-id') };
+		} else if (next.length) {
+			move = { before: next.data('song-id') };
+		}
+		try {
+			await axios.post(`/playlists/${playlistId}/songs/${songId}/move`, move);
+		} catch (error) {
+			console.error('An error occurred while moving the song:', error);
+			window.location.reload();
+		}
+	});
+
 	$('.card-img-left').click(async function (e) {
 		e.preventDefault();
 		let albumId = $(this).closest('.card').find('.card-link').attr('href');
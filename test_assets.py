@@ -0,0 +1,93 @@
+import gzip
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from assets import build, minify, load_manifest, manifest_version
+
+os.environ['DATABASE_URL'] = "postgresql:///maestro-test"
+
+from app import app
+from http_cache import make_etag
+
+app.config['TESTING'] = True
+
+SOURCE = """// handlers
+$(function () {
+	/* the like button */
+	const url = 'http://example.com/a//b';
+	console.log(url);
+});
+"""
+
+
+class AssetsTestCase(TestCase):
+    """Test the fingerprinted static asset build."""
+
+    def setUp(self):
+        self.static_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.static_dir, 'app.js'), 'w') as f:
+            f.write(SOURCE)
+        self.old_static = app.static_folder
+        self.old_manifest = app.config['ASSET_MANIFEST']
+        self.old_version = app.config['ASSET_VERSION']
+
+    def tearDown(self):
+        app.static_folder = self.old_static
+        app.config['ASSET_MANIFEST'] = self.old_manifest
+        app.config['ASSET_VERSION'] = self.old_version
+        shutil.rmtree(self.static_dir)
+
+    def test_minify_keeps_strings(self):
+        """Are comments and indentation dropped but strings untouched?"""
+        self.assertEqual(minify(SOURCE),
+                         "$(function () {\nconst url = 'http://example.com/a//b';\nconsole.log(url);\n});\n")
+
+    def test_minify_keeps_comment_markers_in_strings(self):
+        """Is a /* inside a string or url() left alone?"""
+        source = ('a { content: "/*"; background: url(a/*b); } /* gone */\n'
+                  "const s = '/* kept */'; // it's fine\n")
+        self.assertEqual(minify(source),
+                         'a { content: "/*"; background: url(a/*b); }\n'
+                         "const s = '/* kept */'; // it's fine\n")
+
+    def test_build_hashes_names(self):
+        """Does a change in content give the file a new name?"""
+        first = build(self.static_dir)['app.js']
+        self.assertRegex(first, r'^dist/app\.[0-9a-f]{10}\.js$')
+        self.assertEqual(load_manifest(self.static_dir), {'app.js': first})
+        with open(os.path.join(self.static_dir, 'app.js'), 'a') as f:
+            f.write('console.log(2);\n')
+        self.assertNotEqual(build(self.static_dir)['app.js'], first)
+
+    def test_serve_immutable_gzip(self):
+        """Are built files served gzipped with a long immutable lifetime?"""
+        app.static_folder = self.static_dir
+        app.config['ASSET_MANIFEST'] = build(self.static_dir)
+        with app.test_request_context():
+            url = app.jinja_env.globals['asset_url']('app.js')
+        client = app.test_client()
+        resp = client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', resp.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', resp.headers['Cache-Control'])
+        self.assertIn(b'console.log(url)', gzip.decompress(resp.data))
+
+        resp = client.get(url)
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertIn(b'console.log(url)', resp.data)
+        resp.close()
+
+        resp = client.get('/static/app.js')
+        self.assertEqual(resp.headers['Cache-Control'], 'no-cache')
+        resp.close()
+
+    def test_etag_changes_with_assets(self):
+        """Does a new asset build change page ETags?"""
+        with app.test_request_context():
+            app.config['ASSET_VERSION'] = manifest_version({'app.js': 'dist/app.1.js'})
+            before = make_etag('playlist', 1, 1)
+            app.config['ASSET_VERSION'] = manifest_version({'app.js': 'dist/app.2.js'})
+            self.assertNotEqual(make_etag('playlist', 1, 1), before)
@@ -0,0 +1,105 @@
+import time
+import zlib
+from unittest import TestCase
+
+from cache import LRUCache, TieredCache
+
+
+class LRUCacheTestCase(TestCase):
+    """Test the LRU+TTL cache."""
+
+    def test_lru_eviction(self):
+        """Is the least recently used entry evicted first?"""
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_ttl_expiry(self):
+        """Do entries expire after their TTL?"""
+        cache = LRUCache(maxsize=2, ttl=0.01)
+        cache.set('a', 1)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_get_or_set(self):
+        """Is the loader only called on a miss?"""
+        cache = LRUCache()
+        calls = []
+        loader = lambda: calls.append(1) or 'value'
+        self.assertEqual(cache.get_or_set('k', loader), 'value')
+        self.assertEqual(cache.get_or_set('k', loader), 'value')
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.stats()['hit_rate'], 0.5)
+
+
+class FakeRedis:
+    """Just enough of redis.Redis for the shared tier."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, px=None):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+class TieredCacheTestCase(TestCase):
+    """Test the memory + Redis cache."""
+
+    def test_shared_between_workers(self):
+        """Does a second worker get a value the first one cached?"""
+        client = FakeRedis()
+        first = TieredCache('album', client=client)
+        second = TieredCache('album', client=client)
+        first.set(('album1', 'US'), {'name': 'Album' * 100})
+        self.assertEqual(second.get(('album1', 'US')), {'name': 'Album' * 100})
+        self.assertEqual(second.get(('album1', 'US')), {'name': 'Album' * 100})
+        stats = second.stats()
+        self.assertEqual((stats['remote_hits'], stats['memory_hits'], stats['misses']), (1, 1, 0))
+        raw, = client.data.values()
+        self.assertLess(len(raw), 100)
+
+    def test_namespaces_and_expiry(self):
+        """Are namespaces separate and expired Redis entries ignored?"""
+        client = FakeRedis()
+        TieredCache('album', client=client).set('k', 1, ttl=0.01)
+        self.assertIsNone(TieredCache('search', client=client).get('k'))
+        time.sleep(0.02)
+        self.assertIsNone(TieredCache('album', client=client).get('k'))
+
+    def test_memory_only(self):
+        """Does the cache work without a Redis tier?"""
+        cache = TieredCache('album', maxsize=1)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 2)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_values_are_not_copied(self):
+        """Are large payloads handed out without being copied on every get?"""
+        cache = TieredCache('album')
+        value = {'tracks': [1, 2]}
+        cache.set('a', value)
+        self.assertIs(cache.get('a'), value)
+        self.assertIs(cache.get_or_set('a', dict), value)
+
+    def test_undecodable_redis_value_is_a_miss(self):
+        """Is a corrupt or old-format Redis value treated as a miss and deleted?"""
+        client = FakeRedis()
+        cache = TieredCache('album', client=client)
+        for raw in (b'not zlib', zlib.compress(b'not json'), zlib.compress(b'[1, 2]')):
+            client.data[cache.remote._key('k')] = raw
+            self.assertIsNone(cache.get('k'))
+            self.assertEqual(client.data, {})
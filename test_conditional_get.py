@@ -0,0 +1,88 @@
+import os
+from unittest import TestCase
+
+from models import db, User, Song, Like, Playlist, PlaylistSong
+
+os.environ['DATABASE_URL'] = "postgresql:///maestro-test"
+
+from app import app, CURR_USER_KEY
+from testing import QueryCounter
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+app.config['TESTING'] = True
+app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
+
+db.drop_all()
+db.create_all()
+
+
+class ConditionalGetTestCase(TestCase):
+    """Test ETags and cache headers on pages."""
+
+    def setUp(self):
+        Like.query.delete()
+        PlaylistSong.query.delete()
+        Song.query.delete()
+        Playlist.query.delete()
+        User.query.delete()
+
+        u = User.register(username="testuser", password="testpassword", email="none@none.com")
+        db.session.commit()
+        playlist = Playlist(name="practice", user_id=u.id)
+        song = Song(track_id='track1', track_name='song1', track_uri='uri1',
+                    artist_name='artist', artist_id='artist1')
+        db.session.add_all([playlist, song])
+        db.session.commit()
+        db.session.add(PlaylistSong(playlist_id=playlist.id, song_id=song.id, user_id=u.id))
+        db.session.commit()
+
+        self.playlist_id = playlist.id
+        self.song_id = song.id
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = u.id
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_playlist_not_modified(self):
+        """Is an unchanged playlist answered with 304 in one query?"""
+        resp = self.client.get(f'/playlists/{self.playlist_id}')
+        etag = resp.headers['ETag']
+        self.assertEqual(resp.headers['Cache-Control'], 'private, no-cache')
+
+        db.session.remove()
+        with QueryCounter() as queries:
+            resp = self.client.get(f'/playlists/{self.playlist_id}', headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.data, b'')
+        self.assertEqual(queries.count, 1)
+
+    def test_changed_playlist_is_sent_again(self):
+        """Does removing a song change the playlist's ETag?"""
+        etag = self.client.get(f'/playlists/{self.playlist_id}').headers['ETag']
+        Playlist.touch(self.playlist_id)
+        db.session.commit()
+        resp = self.client.get(f'/playlists/{self.playlist_id}', headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp.headers['ETag'], etag)
+
+    def test_enrichment_changes_playlist_and_song(self):
+        """Does a song's new analysis invalidate its pages?"""
+        playlist_etag = self.client.get(f'/playlists/{self.playlist_id}').headers['ETag']
+        song_etag = self.client.get(f'/playlists/{self.playlist_id}/track1').headers['ETag']
+        song = Song.query.get(self.song_id)
+        song.update_analysis({'track_name': 'renamed'})
+        Playlist.touch_containing(song.id)
+        db.session.commit()
+        resp = self.client.get(f'/playlists/{self.playlist_id}', headers={'If-None-Match': playlist_etag})
+        self.assertEqual(resp.status_code, 200)
+        resp = self.client.get(f'/playlists/{self.playlist_id}/track1', headers={'If-None-Match': song_etag})
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b'renamed', resp.data)
+
+    def test_login_is_not_stored(self):
+        """Is no-store kept for the login page?"""
+        resp = self.client.get('/user/login')
+        self.assertIn('no-store', resp.headers['Cache-Control'])
@@ -0,0 +1,149 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User, Song, Like, Playlist, PlaylistSong
+
+os.environ['DATABASE_URL'] = "postgresql:///maestro-test"
+
+from app import app, CURR_USER_KEY
+from enrichment import ThreadPoolQueue, enrich_song, retry_due, FAILED_COOLDOWN
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+app.config['TESTING'] = True
+app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
+
+db.drop_all()
+db.create_all()
+
+ANALYSIS = {
+    'track_id': 'track1', 'track_name': 'Song', 'track_uri': 'spotify:track:track1',
+    'artist_name': 'Artist', 'artist_id': 'artist1', 'album': 'Album', 'album_id': 'album1',
+    'album_art': 'http://img', 'duration': 3.0, 'key': 'C', 'key_confidence': 50,
+    'mode': 'Major', 'mode_confidence': 50, 'time_signature': 4,
+    'time_signature_confidence': 100, 'tempo': 120, 'tempo_confidence': 50, 'loudness': -5.0,
+}
+
+
+@patch('enrichment.get_token', return_value='token')
+class EnrichmentTestCase(TestCase):
+    """Test minimal song rows and background enrichment."""
+
+    def setUp(self):
+        Like.query.delete()
+        PlaylistSong.query.delete()
+        Song.query.delete()
+        Playlist.query.delete()
+        User.query.delete()
+        u = User.register(username="testuser", password="testpassword", email="none@none.com")
+        db.session.commit()
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = u.id
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_like_does_not_wait_for_spotify(self, get_token):
+        """Does a like store a pending song and enrich it in the background?"""
+        queue = ThreadPoolQueue()
+        fetched = threading.Event()
+
+        def analysis(track_id, token):
+            fetched.wait(1)
+            return ANALYSIS
+
+        with patch('enrichment.get_queue', return_value=queue), \
+                patch('enrichment.get_audio_analysis', side_effect=analysis):
+            resp = self.client.post('/songs/track1/like')
+            self.assertEqual(resp.status_code, 200)
+            song = Song.get_song('track1')
+            self.assertTrue(song.needs_enrichment)
+            self.assertEqual(Like.query.filter_by(song_id='track1').count(), 1)
+            fetched.set()
+            queue.wait(1)
+        db.session.remove()
+        song = Song.get_song('track1')
+        self.assertFalse(song.needs_enrichment)
+        self.assertEqual(song.track_name, 'Song')
+        self.assertTrue(song.has_analysis())
+
+    def test_retries_then_fails(self, get_token):
+        """Is a song marked failed after max_attempts failed fetches?"""
+        Song.create_pending('track1')
+        db.session.commit()
+        with patch('enrichment.get_audio_analysis', side_effect=RuntimeError) as fetch:
+            self.assertFalse(enrich_song('track1', max_attempts=2, retry_delay=0))
+        self.assertEqual(fetch.call_count, 2)
+        song = Song.get_song('track1')
+        self.assertEqual((song.enrichment_status, song.enrichment_attempts), (Song.FAILED, 2))
+        self.assertIsNotNone(song.enrichment_failed_at)
+
+    def test_failed_song_is_retried_after_cooldown(self, get_token):
+        """Is a failed song fetched again once its cooldown has passed, and not before?"""
+        song = Song.create_pending('track1')
+        song.enrichment_status = Song.FAILED
+        song.enrichment_attempts = 3
+        song.enrichment_failed_at = datetime.utcnow()
+        db.session.commit()
+        self.assertFalse(retry_due(song, max_attempts=3))
+        with patch('enrichment.get_audio_analysis', return_value=ANALYSIS) as fetch:
+            self.assertFalse(enrich_song('track1', max_attempts=3, retry_delay=0))
+        self.assertEqual(fetch.call_count, 0)
+
+        cooldown = timedelta(seconds=FAILED_COOLDOWN)
+        self.assertTrue(retry_due(song, max_attempts=3, now=song.enrichment_failed_at + cooldown))
+        with patch('enrichment.get_audio_analysis', side_effect=RuntimeError) as fetch:
+            failed_at = song.enrichment_failed_at = datetime.utcnow() - cooldown
+            db.session.commit()
+            self.assertFalse(enrich_song('track1', max_attempts=3, retry_delay=0))
+        self.assertEqual(fetch.call_count, 1)
+        song = Song.get_song('track1')
+        self.assertEqual(song.enrichment_attempts, 4)
+        # The next cooldown is twice as long.
+        self.assertFalse(retry_due(song, max_attempts=3, now=song.enrichment_failed_at + cooldown))
+        self.assertTrue(retry_due(song, max_attempts=3, now=song.enrichment_failed_at + 2 * cooldown))
+
+        song.enrichment_failed_at = failed_at - 2 * cooldown
+        db.session.commit()
+        with patch('enrichment.get_audio_analysis', return_value=ANALYSIS):
+            self.assertTrue(enrich_song('track1', max_attempts=3, retry_delay=0))
+        song = Song.get_song('track1')
+        self.assertIsNone(song.enrichment_status)
+        self.assertTrue(song.has_analysis())
+
+    def test_like_requeues_failed_song(self, get_token):
+        """Does liking a failed song past its cooldown queue it again?"""
+        song = Song.create_pending('track1')
+        song.enrichment_status = Song.FAILED
+        song.enrichment_failed_at = datetime.utcnow() - timedelta(seconds=FAILED_COOLDOWN * 100)
+        db.session.commit()
+        queue = ThreadPoolQueue()
+        with patch('enrichment.get_queue', return_value=queue), \
+                patch('enrichment.get_audio_analysis', return_value=ANALYSIS):
+            self.client.post('/songs/track1/like')
+            queue.wait(1)
+        db.session.remove()
+        self.assertIsNone(Song.get_song('track1').enrichment_status)
+
+    def test_queue_dedup(self, get_token):
+        """Is a track queued twice only fetched once?"""
+        Song.create_pending('track1')
+        db.session.commit()
+        queue = ThreadPoolQueue()
+        release = threading.Event()
+
+        def analysis(track_id, token):
+            release.wait(1)
+            return ANALYSIS
+
+        with patch('enrichment.get_audio_analysis', side_effect=analysis) as fetch, \
+                app.test_request_context():
+            queue.enqueue('track1')
+            queue.enqueue('track1')
+            release.set()
+            queue.wait(1)
+        self.assertEqual(fetch.call_count, 1)
@@ -0,0 +1,56 @@
+import time
+import threading
+from unittest import TestCase
+
+from shared_store import MemoryStore
+from feeds import SharedFeed
+
+
+def wait_for(condition, timeout=1):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+
+
+class SharedFeedTestCase(TestCase):
+    """Test the background-refreshed shared feed."""
+
+    def setUp(self):
+        self.calls = 0
+
+    def fetch(self):
+        self.calls += 1
+        return [f'track{self.calls}']
+
+    def test_cold_feed_does_not_block(self):
+        """Does a cold feed return the default and fill in the background?"""
+        feed = SharedFeed('test', self.fetch, MemoryStore(), default=[])
+        self.assertEqual(feed.get(), [])
+        wait_for(lambda: feed.get() == ['track1'])
+        self.assertEqual(feed.get(), ['track1'])
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_value_served_while_revalidating(self):
+        """Is a stale value returned while a refresh runs?"""
+        release = threading.Event()
+
+        def slow_fetch():
+            release.wait(1)
+            return self.fetch()
+
+        store = MemoryStore()
+        store.set('feed:test', {'value': ['old'], 'fetched_at': time.time() - 7200})
+        feed = SharedFeed('test', slow_fetch, store, refresh_interval=3600)
+        self.assertEqual(feed.get(), ['old'])
+        release.set()
+        wait_for(lambda: feed.get() == ['track1'])
+        self.assertEqual(feed.get(), ['track1'])
+
+    def test_shared_between_workers(self):
+        """Do two feeds (workers) on one store share the fetched value?"""
+        store = MemoryStore()
+        first = SharedFeed('test', self.fetch, store)
+        first.refresh()
+        second = SharedFeed('test', self.fetch, store)
+        self.assertEqual(second.get(), ['track1'])
+        self.assertEqual(self.calls, 1)
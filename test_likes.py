@@ -0,0 +1,95 @@
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User, Song, Like, Playlist, PlaylistSong
+
+os.environ['DATABASE_URL'] = "postgresql:///maestro-test"
+
+from app import app, CURR_USER_KEY
+from testing import QueryCounter
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+app.config['TESTING'] = True
+app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
+
+db.drop_all()
+db.create_all()
+
+
+
+def make_tracks(count):
+    return [{
+        'album_id': 'album1',
+        'album_name': f'name{i}',
+        'album_art': 'art',
+        'track_id': f'track{i}',
+        'release_date': '2020',
+        'track_name': f'name{i}',
+        'track_uri': f'uri{i}',
+        'artist_name': 'artist',
+        'artist_id': 'artist1',
+        'duration': 3.0,
+        'explicit': False,
+        'track_number': i,
+        'popularity': 1,
+    } for i in range(count)]
+
+
+class LikedStateTestCase(TestCase):
+    """Test batched liked-state lookups."""
+
+    def setUp(self):
+        Like.query.delete()
+        PlaylistSong.query.delete()
+        Song.query.delete()
+        Playlist.query.delete()
+        User.query.delete()
+
+        u = User.register(username="testuser", password="testpassword", email="none@none.com")
+        db.session.commit()
+        for track in make_tracks(50):
+            db.session.add(Song(track_id=track['track_id'], track_name=track['track_name'],
+                                track_uri=track['track_uri'], artist_name='artist', artist_id='artist1'))
+        db.session.commit()
+        for i in range(0, 50, 2):
+            Like.like_song(u.id, f'track{i}')
+        db.session.commit()
+        self.u = u
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_load_likes(self):
+        """Does load_likes answer is_liked from memory?"""
+        track_ids = [f'track{i}' for i in range(10)]
+        with app.test_request_context():
+            self.u.id
+            with QueryCounter() as counter:
+                self.u.load_likes(track_ids)
+                liked = [self.u.is_liked(track_id) for track_id in track_ids]
+            self.assertEqual(counter.count, 1)
+            self.assertEqual(liked, [True, False] * 5)
+
+    def test_query_count_constant(self):
+        """Does the album page make the same number of queries for 5 or 50 tracks?"""
+        counts = []
+        for size in (5, 50):
+            with patch('routes.albums.get_token', return_value='token'), \
+                    patch('routes.albums.get_album_tracks', return_value=make_tracks(size)):
+                with self.client.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = self.u.id
+                with QueryCounter() as counter:
+                    resp = self.client.get('/albums/songs/album1')
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.data.count(b'fas fa-heart'), (size + 1) // 2)
+            counts.append(counter.count)
+        self.assertEqual(counts[0], counts[1])
+
+    def test_like_twice_keeps_one_row(self):
+        """Does liking a liked song leave a single row?"""
+        Like.like_song(self.u.id, 'track0')
+        db.session.commit()
+        self.assertEqual(Like.query.filter_by(user_id=self.u.id, song_id='track0').count(), 1)
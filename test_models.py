@@ -2,7 +2,8 @@ import os
 from unittest import TestCase
 from flask_bcrypt import Bcrypt
 
-from models import db, User, Playlist, Song, PlaylistSong
+from models import db, User, Playlist, Song, PlaylistSong, LazyUser, UserNotFound
+from passwords import hasher, hash_rounds, _hash
 bcrypt = Bcrypt()
 
 os.environ['DATABASE_URL'] = "postgresql:///maestro-test"
@@ -70,6 +71,27 @@ class UserModelTestCase(TestCase):
         self.assertFalse(User.authenticate(username="wronguser", password="testpassword"))
         db.session.rollback()
 
+    def test_rehash_on_login(self):
+        """Is a hash with an outdated cost upgraded on login?"""
+        self.u.password = _hash("testpassword", 4)
+        db.session.commit()
+        u = User.authenticate(username="testuser", password="testpassword")
+        db.session.commit()
+        self.assertEqual(hash_rounds(u.password), hasher.rounds)
+        self.assertTrue(User.authenticate(username="testuser", password="testpassword"))
+
+    def test_lazy_user(self):
+        """Does LazyUser only load the row when needed?"""
+        lazy = LazyUser(self.u.id)
+        self.assertEqual(lazy.id, self.u.id)
+        self.assertIsNone(lazy._user)
+        self.assertEqual(lazy.username, "testuser")
+        self.assertIsNotNone(lazy._user)
+        self.assertRaises(UserNotFound, lambda: LazyUser(-1).username)
+        # Truth only needs the id, so it costs no query.
+        self.assertTrue(LazyUser(-1))
+        self.assertIsNone(LazyUser(-1)._user)
+
     def test_playlist_model(self):
             """Does basic model work?"""
     
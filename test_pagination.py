@@ -0,0 +1,154 @@
+import os
+from datetime import datetime, timedelta
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User, Song, Like, Playlist, PlaylistSong, PlaylistStats
+
+os.environ['DATABASE_URL'] = "postgresql:///maestro-test"
+
+from app import app, CURR_USER_KEY
+from pagination import encode_cursor, decode_cursor
+from testing import QueryCounter
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['TESTING'] = True
+
+db.drop_all()
+db.create_all()
+
+
+class CursorTestCase(TestCase):
+    """Test cursor encoding."""
+
+    def test_round_trip(self):
+        key = (datetime(2024, 5, 1, 12, 30), 42, 'x')
+        self.assertEqual(decode_cursor(encode_cursor(key)), key)
+
+    def test_malformed(self):
+        """Does a cursor that does not decode mean the first page?"""
+        for cursor in (None, '', 'not base64!', encode_cursor([{'no': 'dt'}])[:-2], 'e30'):
+            self.assertIsNone(decode_cursor(cursor), cursor)
+
+    def test_wrong_types(self):
+        """Does a well-formed cursor with the wrong number or types of values mean the first page?"""
+        types = (datetime, int)
+        self.assertEqual(decode_cursor(encode_cursor((datetime(2024, 1, 1), 3)), types), (datetime(2024, 1, 1), 3))
+        for key in ((datetime(2024, 1, 1),), (datetime(2024, 1, 1), '3'), (datetime(2024, 1, 1), 3.5),
+                    (datetime(2024, 1, 1), True), ('2024-01-01', 3), (datetime(2024, 1, 1), 3, 4)):
+            self.assertIsNone(decode_cursor(encode_cursor(key), types), key)
+
+
+class PaginationTestCase(TestCase):
+    """Test the keyset-paginated listings."""
+
+    def setUp(self):
+        Like.query.delete()
+        PlaylistStats.query.delete()
+        PlaylistSong.query.delete()
+        Song.query.delete()
+        Playlist.query.delete()
+        User.query.delete()
+
+        u = User.register(username="testuser", password="testpassword", email="none@none.com")
+        db.session.commit()
+        playlists = [Playlist(name=f'playlist{i}', user_id=u.id) for i in range(7)]
+        songs = [Song(track_id=f'track{i}', track_name=f'song{i}', track_uri=f'uri{i}') for i in range(25)]
+        db.session.add_all(playlists + songs)
+        db.session.commit()
+        db.session.add_all([PlaylistSong(playlist_id=playlists[0].id, song_id=song.id, user_id=u.id)
+                            for song in songs])
+        # Two likes share a timestamp, so the id has to break the tie.
+        start = datetime(2024, 1, 1)
+        db.session.add_all([Like(user_id=u.id, song_id=song.track_id, timestamp=start + timedelta(minutes=i // 2 * 2))
+                            for i, song in enumerate(songs)])
+        db.session.commit()
+
+        self.user_id = u.id
+        self.playlist = playlists[0]
+        self.playlist_ids = [playlist.id for playlist in playlists]
+        self.track_ids = [song.track_id for song in songs]
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = u.id
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def walk(self, fetch):
+        """Follow cursors to the end; return all items and each page's size."""
+        items, sizes, cursor = [], [], None
+        while True:
+            page, cursor = fetch(cursor)
+            items.extend(page)
+            sizes.append(len(page))
+            if cursor is None:
+                return items, sizes
+
+    def test_playlists(self):
+        playlists, sizes = self.walk(lambda cursor: Playlist.for_user_with_counts(self.user_id, cursor, limit=3))
+        self.assertEqual([playlist.id for playlist in playlists], self.playlist_ids)
+        self.assertEqual(sizes, [3, 3, 1])
+        self.assertEqual([playlist.song_count for playlist in playlists[:2]], [25, 0])
+
+    def test_playlist_songs(self):
+        songs, sizes = self.walk(lambda cursor: self.playlist.songs_page(cursor, limit=10))
+        self.assertEqual([song.track_id for song in songs], self.track_ids)
+        self.assertEqual(sizes, [10, 10, 5])
+
+    def test_liked_songs(self):
+        """Are likes listed newest first, with ties split by id, across pages?"""
+        likes, sizes = self.walk(lambda cursor: Like.songs_for_user(self.user_id, cursor, limit=4))
+        self.assertEqual(sizes, [4] * 6 + [1])
+        expected = [like.song_id for like in Like.query.order_by(Like.timestamp.desc(), Like.id.desc())]
+        self.assertEqual([song.track_id for song, _ in likes], expected)
+        self.assertEqual(likes[0][1], datetime(2024, 1, 1, 0, 24))
+
+    def test_cursor_of_wrong_type_gives_first_page(self):
+        """Does a well-formed cursor with a string position show the first page instead of failing?"""
+        first, _ = self.playlist.songs_page(limit=10)
+        songs, _ = self.playlist.songs_page(encode_cursor(('1024', 1)), limit=10)
+        self.assertEqual(songs, first)
+        likes, _ = Like.songs_for_user(self.user_id, encode_cursor((5, 1)), limit=4)
+        self.assertEqual(likes[0][1], datetime(2024, 1, 1, 0, 24))
+
+    def test_exact_last_page(self):
+        """Is there no empty page after one that ends exactly at the last row?"""
+        _, sizes = self.walk(lambda cursor: self.playlist.songs_page(cursor, limit=5))
+        self.assertEqual(sizes, [5] * 5)
+
+    @patch('routes.playlists.SONGS_PAGE_SIZE', 10)
+    def test_later_pages_cost_the_same(self):
+        """Does the last page of a playlist take as many queries as the first?"""
+        _, cursor = self.playlist.songs_page(limit=20)
+        db.session.remove()
+        with QueryCounter() as first:
+            resp = self.client.get(f'/playlists/{self.playlist.id}')
+        self.assertEqual(resp.data.count(b'Delete Song'), 10)
+        self.assertIn(b'Next page', resp.data)
+        with QueryCounter() as last:
+            resp = self.client.get(f'/playlists/{self.playlist.id}?after={cursor}')
+        self.assertEqual(resp.data.count(b'Delete Song'), 5)
+        self.assertNotIn(b'Next page', resp.data)
+        self.assertEqual(first.count, last.count)
+
+    def test_liked_songs_view(self):
+        """Does the liked songs page list the newest like first?"""
+        resp = self.client.get('/user/likes')
+        self.assertEqual(resp.status_code, 200)
+        self.assertLess(resp.data.index(b'>song24<'), resp.data.index(b'>song0<'))
+        self.assertNotIn(b'Next page', resp.data)
+        _, cursor = Like.songs_for_user(self.user_id, limit=10)
+        resp = self.client.get(f'/user/likes?after={cursor}')
+        self.assertNotIn(b'>song24<', resp.data)
+        self.assertIn(b'First page', resp.data)
+
+    def test_move_before_first_song_of_page(self):
+        """Can a song dragged to the top of a later page be placed before that page's first song?"""
+        song_ids = [song.id for song in self.playlist.songs_page(limit=25)[0]]
+        resp = self.client.post(f'/playlists/{self.playlist.id}/songs/{song_ids[0]}/move',
+                                json={'before': song_ids[20]})
+        self.assertEqual(resp.status_code, 200)
+        playlist = Playlist.query.get(self.playlist.id)
+        moved = [song.id for song in playlist.songs_page(limit=25)[0]]
+        self.assertEqual(moved, song_ids[1:20] + [song_ids[0]] + song_ids[20:])
@@ -0,0 +1,51 @@
+from unittest import TestCase
+
+from passwords import PasswordHasher, calibrate_rounds, hash_rounds
+from rate_limit import AttemptThrottle
+from shared_store import MemoryStore
+
+
+class PasswordHasherTestCase(TestCase):
+    """Test bcrypt cost calibration and hashing."""
+
+    def test_calibrate_within_bounds(self):
+        """Is the calibrated cost clamped to the configured range?"""
+        self.assertEqual(calibrate_rounds(target_seconds=0, min_rounds=5, max_rounds=7), 5)
+        self.assertEqual(calibrate_rounds(target_seconds=100, min_rounds=5, max_rounds=7), 7)
+
+    def test_needs_rehash(self):
+        """Are hashes with a lower cost flagged for rehashing?"""
+        old = PasswordHasher(4).hash('secret')
+        hasher = PasswordHasher(5)
+        self.assertTrue(hasher.check(old, 'secret'))
+        self.assertTrue(hasher.needs_rehash(old))
+        self.assertFalse(hasher.needs_rehash(hasher.hash('secret')))
+        self.assertEqual(hash_rounds(hasher.hash('secret')), 5)
+
+    def test_no_rehash_downgrade(self):
+        """Is a hash with a higher cost left alone instead of downgraded?"""
+        stronger = PasswordHasher(6).hash('secret')
+        self.assertFalse(PasswordHasher(5).needs_rehash(stronger))
+
+    def test_process_pool(self):
+        """Does hashing in a process pool give usable hashes?"""
+        hasher = PasswordHasher(4, workers=1)
+        pw_hash = hasher.hash('secret')
+        self.assertTrue(hasher.check(pw_hash, 'secret'))
+        self.assertFalse(hasher.check(pw_hash, 'wrong'))
+        hasher._pool.shutdown()
+
+
+class AttemptThrottleTestCase(TestCase):
+    """Test failed-attempt throttling."""
+
+    def test_blocks_after_max_attempts(self):
+        """Is a key blocked after max_attempts failures and freed by reset?"""
+        throttle = AttemptThrottle(MemoryStore(), 'login', max_attempts=2, window=60)
+        throttle.record_failure('testuser')
+        self.assertFalse(throttle.is_blocked('testuser'))
+        throttle.record_failure('testuser')
+        self.assertTrue(throttle.is_blocked('testuser'))
+        self.assertFalse(throttle.is_blocked('other'))
+        throttle.reset('testuser')
+        self.assertFalse(throttle.is_blocked('testuser'))
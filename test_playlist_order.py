@@ -0,0 +1,168 @@
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User, Song, Like, Playlist, PlaylistSong, PlaylistStats
+
+os.environ['DATABASE_URL'] = "postgresql:///maestro-test"
+
+from app import app, CURR_USER_KEY
+from testing import QueryCounter
+from playlist_order import move_song, rebalance, rebalance_queue
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['TESTING'] = True
+
+db.drop_all()
+db.create_all()
+
+
+class PlaylistOrderTestCase(TestCase):
+    """Test gap-based playlist ordering."""
+
+    def setUp(self):
+        Like.query.delete()
+        PlaylistStats.query.delete()
+        PlaylistSong.query.delete()
+        Song.query.delete()
+        Playlist.query.delete()
+        User.query.delete()
+
+        u = User.register(username="testuser", password="testpassword", email="none@none.com")
+        db.session.commit()
+        playlist = Playlist(name="ordered", user_id=u.id)
+        db.session.add(playlist)
+        db.session.commit()
+        songs = [Song(track_id=f'track{i}', track_name=f'song{i}', track_uri=f'uri{i}')
+                 for i in range(5)]
+        db.session.add_all(songs)
+        db.session.commit()
+        db.session.add_all([PlaylistSong(playlist_id=playlist.id, song_id=song.id, user_id=u.id)
+                            for song in songs])
+        db.session.commit()
+
+        self.user_id = u.id
+        self.playlist_id = playlist.id
+        self.ids = [song.id for song in songs]
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = u.id
+
+    def tearDown(self):
+        rebalance_queue.wait()
+        db.session.rollback()
+
+    def order(self):
+        db.session.expire_all()
+        return [song.id for song in Playlist.query.get(self.playlist_id).songs]
+
+    def test_appends_keep_insertion_order(self):
+        """Do new rows, ORM and bulk, go to the end POSITION_GAP apart?"""
+        song = Song(track_id='late', track_uri='urilate')
+        db.session.add(song)
+        db.session.commit()
+        db.session.bulk_insert_mappings(PlaylistSong, [
+            {'playlist_id': self.playlist_id, 'song_id': song.id, 'user_id': self.user_id}])
+        db.session.commit()
+        self.assertEqual(self.order(), self.ids + [song.id])
+        positions = [row.position for row in PlaylistSong.query.order_by(PlaylistSong.position)]
+        self.assertEqual({b - a for a, b in zip(positions, positions[1:])}, {PlaylistSong.POSITION_GAP})
+
+    def test_move_to_index(self):
+        """Does a song land at the requested index?"""
+        a, b, c, d, e = self.ids
+        self.assertTrue(move_song(self.playlist_id, d, index=1))
+        db.session.commit()
+        self.assertEqual(self.order(), [a, d, b, c, e])
+        move_song(self.playlist_id, a, index=0)
+        move_song(self.playlist_id, b, index=0)
+        move_song(self.playlist_id, c, index=99)
+        db.session.commit()
+        self.assertEqual(self.order(), [b, a, d, e, c])
+
+    def test_move_after(self):
+        """Does a dragged song follow the song it was dropped after?"""
+        a, b, c, d, e = self.ids
+        move_song(self.playlist_id, a, after=c)
+        move_song(self.playlist_id, e, after=None)
+        db.session.commit()
+        self.assertEqual(self.order(), [e, b, c, a, d])
+        self.assertFalse(move_song(self.playlist_id, a, after=12345))
+        self.assertFalse(move_song(self.playlist_id, 12345, index=0))
+
+    def test_move_writes_one_row(self):
+        """Is only the moved row updated, however long the playlist?"""
+        with QueryCounter() as queries:
+            move_song(self.playlist_id, self.ids[4], index=2)
+            db.session.commit()
+        statements = queries.statements
+        updates = [statement for statement in statements if statement.startswith('UPDATE playlist_songs')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('WHERE playlist_songs.id =', updates[0])
+        self.assertLessEqual(len(statements), 5)
+
+    def test_rebalance_when_gap_runs_out(self):
+        """Do repeated moves into one spot stay ordered once the gap is used up?"""
+        a, b, c, d, e = self.ids
+        with patch('playlist_order.rebalance_queue') as queue:
+            for song_id in (c, d, e) * 8:
+                move_song(self.playlist_id, song_id, after=a)
+                db.session.commit()
+            self.assertTrue(queue.enqueue.called)
+        self.assertEqual(self.order(), [a, e, d, c, b])
+        rebalance(self.playlist_id)
+        db.session.commit()
+        positions = [row.position for row in PlaylistSong.query.order_by(PlaylistSong.position)]
+        self.assertEqual(positions, [PlaylistSong.POSITION_GAP * i for i in range(1, 6)])
+        self.assertEqual(self.order(), [a, e, d, c, b])
+
+    def test_background_rebalance(self):
+        """Is a crowded playlist renumbered after the move commits?"""
+        a, b, c = self.ids[:3]
+        for song_id in (b, c) * 4:
+            move_song(self.playlist_id, song_id, after=a)
+            db.session.commit()
+        rebalance_queue.wait()
+        positions = [row.position for row in PlaylistSong.query.order_by(PlaylistSong.position)]
+        self.assertEqual(positions, [PlaylistSong.POSITION_GAP * i for i in range(1, 6)])
+        self.assertEqual(self.order()[:3], [a, c, b])
+
+    def test_pages_across_rebalance(self):
+        """Does a page fetched after a background rebalance carry on where the last one stopped?"""
+        a, b, c, d, e = self.ids
+        for position, song_id in enumerate(self.ids, 1):
+            PlaylistSong.query.filter_by(song_id=song_id).update({'position': position * 10})
+        db.session.commit()
+        playlist = Playlist.query.get(self.playlist_id)
+        version = playlist.version
+        first, cursor = playlist.songs_page(limit=2)
+
+        rebalance_queue.enqueue(app, self.playlist_id)
+        rebalance_queue.wait()
+        db.session.expire_all()
+        playlist = Playlist.query.get(self.playlist_id)
+        self.assertEqual(playlist.version, version + 1)
+        second, cursor = playlist.songs_page(cursor, limit=2)
+        third, cursor = playlist.songs_page(cursor, limit=2)
+        self.assertEqual([song.id for song in first + second + third], [a, b, c, d, e])
+        self.assertIsNone(cursor)
+
+    def test_move_route(self):
+        """Does the move endpoint reorder the playlist and check ownership?"""
+        a, b, c, d, e = self.ids
+        resp = self.client.post(f'/playlists/{self.playlist_id}/songs/{e}/move', json={'after': a})
+        self.assertEqual(resp.status_code, 200)
+        resp = self.client.post(f'/playlists/{self.playlist_id}/songs/{a}/move', json={'index': 4})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.order(), [e, b, c, d, a])
+        resp = self.client.post(f'/playlists/{self.playlist_id}/songs/99999/move', json={'index': 0})
+        self.assertEqual(resp.status_code, 404)
+        resp = self.client.post(f'/playlists/{self.playlist_id}/songs/{a}/move', json={})
+        self.assertEqual(resp.status_code, 400)
+
+        other = User.register(username="other", password="testpassword", email="other@none.com")
+        db.session.commit()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = other.id
+        resp = self.client.post(f'/playlists/{self.playlist_id}/songs/{a}/move', json={'index': 0})
+        self.assertEqual(resp.status_code, 403)
@@ -0,0 +1,197 @@
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User, Song, Like, Playlist, PlaylistSong
+
+os.environ['DATABASE_URL'] = "postgresql:///maestro-test"
+
+from app import app, CURR_USER_KEY
+from routes.playlists import MAX_BULK_TRACKS
+from testing import QueryCounter
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+app.config['TESTING'] = True
+app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
+
+db.drop_all()
+db.create_all()
+
+
+
+class PlaylistQueryCountTestCase(TestCase):
+    """Pin the number of queries made by the playlist pages."""
+
+    def setUp(self):
+        Like.query.delete()
+        PlaylistSong.query.delete()
+        Song.query.delete()
+        Playlist.query.delete()
+        User.query.delete()
+
+        u = User.register(username="testuser", password="testpassword", email="none@none.com")
+        db.session.commit()
+        big = Playlist(name="big", user_id=u.id)
+        small = Playlist(name="small", user_id=u.id)
+        db.session.add_all([big, small])
+        db.session.commit()
+        songs = [Song(track_id=f'track{i}', track_name=f'song{i}', track_uri=f'uri{i}',
+                      artist_name='artist', artist_id='artist1') for i in range(500)]
+        db.session.add_all(songs)
+        db.session.commit()
+        db.session.add_all([PlaylistSong(playlist_id=big.id, song_id=song.id, user_id=u.id)
+                            for song in songs])
+        db.session.add_all([PlaylistSong(playlist_id=small.id, song_id=song.id, user_id=u.id)
+                            for song in songs[:5]])
+        db.session.commit()
+
+        self.u_id = u.id
+        self.big_id = big.id
+        self.small_id = small.id
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.u_id
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def count_queries(self, path):
+        db.session.remove()
+        with QueryCounter() as counter:
+            resp = self.client.get(path)
+        self.assertEqual(resp.status_code, 200)
+        return counter.count, resp
+
+    def test_show_playlist(self):
+        """Does a 500-song playlist take as many queries as a 5-song one?"""
+        big, resp = self.count_queries(f'/playlists/{self.big_id}')
+        small, _ = self.count_queries(f'/playlists/{self.small_id}')
+        self.assertEqual(resp.data.count(b'Delete Song'), 100)
+        self.assertEqual(big, small)
+        self.assertLessEqual(big, 2)
+
+    def test_playlist_index_counts(self):
+        """Are song counts on the playlist index loaded in one query?"""
+        count, resp = self.count_queries('/playlists/')
+        self.assertIn(b'500 songs', resp.data)
+        self.assertIn(b'5 songs', resp.data)
+        self.assertLessEqual(count, 1)
+
+
+def make_album(count):
+    return {
+        'id': 'album1',
+        'name': 'Album',
+        'images': [{'url': 'http://img'}],
+        'tracks': {'items': [{
+            'id': f'albumtrack{i}',
+            'name': f'song{i}',
+            'uri': f'spotify:track:albumtrack{i}',
+            'artists': [{'name': 'Artist', 'id': 'artist1'}],
+        } for i in range(count)]},
+    }
+
+
+def make_features(track_ids, token):
+    return {track_id: {
+        'duration': 3.0, 'key': 'C', 'key_confidence': None, 'mode': 'Major',
+        'mode_confidence': None, 'time_signature': 4, 'time_signature_confidence': None,
+        'tempo': 120, 'tempo_confidence': None, 'loudness': -5.0,
+    } for track_id in track_ids}
+
+
+@patch('song_analysis.get_token', return_value='token')
+class BulkAddTestCase(TestCase):
+    """Test adding a whole album to a playlist."""
+
+    def setUp(self):
+        Like.query.delete()
+        PlaylistSong.query.delete()
+        Song.query.delete()
+        Playlist.query.delete()
+        User.query.delete()
+
+        u = User.register(username="testuser", password="testpassword", email="none@none.com")
+        db.session.commit()
+        playlist = Playlist(name="practice", user_id=u.id)
+        song = Song(track_id='albumtrack0', track_name='song0', track_uri='spotify:track:albumtrack0',
+                    artist_name='Artist', artist_id='artist1')
+        db.session.add_all([playlist, song])
+        db.session.commit()
+        db.session.add(PlaylistSong(playlist_id=playlist.id, song_id=song.id, user_id=u.id))
+        db.session.commit()
+
+        self.playlist_id = playlist.id
+        self.user_id = u.id
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = u.id
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_bulk_add_album(self, get_token):
+        """Is a 20-track album added with one features call and few queries?"""
+        with patch('song_analysis.get_album_payload', return_value=make_album(20)) as album, \
+                patch('song_analysis.get_audio_features', side_effect=make_features) as features, \
+                patch('song_analysis.get_tracks') as tracks:
+            db.session.remove()
+            with QueryCounter() as counter:
+                resp = self.client.post(f'/playlists/{self.playlist_id}/bulk', json={'album_id': 'album1'})
+        self.assertEqual(resp.status_code, 200)
+        results = resp.get_json()['results']
+        self.assertEqual(results[0], {'track_id': 'albumtrack0', 'status': 'already_in_playlist'})
+        self.assertEqual(resp.get_json()['added'], 19)
+        self.assertEqual((album.call_count, features.call_count, tracks.call_count), (1, 1, 0))
+        self.assertEqual(len(features.call_args.args[0]), 19)
+        self.assertEqual(PlaylistSong.query.filter_by(playlist_id=self.playlist_id).count(), 20)
+        self.assertLessEqual(counter.count, 8)
+
+    def test_bulk_add_races_other_request(self, get_token):
+        """Is a song another request stored mid-add reused instead of failing?"""
+        def features_after_race(track_ids, token):
+            db.engine.execute(Song.__table__.insert().values(
+                track_id='albumtrack1', track_name='song1', track_uri='spotify:track:albumtrack1'))
+            return make_features(track_ids, token)
+
+        with patch('song_analysis.get_album_payload', return_value=make_album(3)), \
+                patch('song_analysis.get_audio_features', side_effect=features_after_race):
+            resp = self.client.post(f'/playlists/{self.playlist_id}/bulk', json={'album_id': 'album1'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json()['added'], 2)
+        self.assertEqual(Song.query.filter_by(track_id='albumtrack1').count(), 1)
+
+    def test_bulk_add_too_many_tracks(self, get_token):
+        """Is a request over the track limit refused instead of silently cut short?"""
+        track_ids = [f'track{i}' for i in range(MAX_BULK_TRACKS + 1)]
+        resp = self.client.post(f'/playlists/{self.playlist_id}/bulk', json={'track_ids': track_ids})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_bulk_add_races_playlist_row(self, get_token):
+        """Are playlist rows another request added mid-add reported as already in the playlist?"""
+        def features_after_race(track_ids, token):
+            song = Song.query.filter_by(track_id='albumtrack1').first()
+            if song is None:
+                db.engine.execute(Song.__table__.insert().values(
+                    track_id='albumtrack1', track_name='song1', track_uri='spotify:track:albumtrack1'))
+                song = Song.query.filter_by(track_id='albumtrack1').one()
+            db.engine.execute(PlaylistSong.__table__.insert().values(
+                playlist_id=self.playlist_id, song_id=song.id, user_id=self.user_id))
+            return make_features(track_ids, token)
+
+        with patch('song_analysis.get_album_payload', return_value=make_album(3)), \
+                patch('song_analysis.get_audio_features', side_effect=features_after_race):
+            resp = self.client.post(f'/playlists/{self.playlist_id}/bulk', json={'album_id': 'album1'})
+        self.assertEqual(resp.status_code, 200)
+        statuses = {result['track_id']: result['status'] for result in resp.get_json()['results']}
+        self.assertEqual(statuses, {'albumtrack0': 'already_in_playlist', 'albumtrack1': 'already_in_playlist',
+                                    'albumtrack2': 'added'})
+        self.assertEqual(resp.get_json()['added'], 1)
+
+    def test_bulk_add_unknown_tracks(self, get_token):
+        """Are ids Spotify doesn't know reported as not found?"""
+        with patch('song_analysis.get_tracks', return_value={}), \
+                patch('song_analysis.get_audio_features', return_value={}):
+            resp = self.client.post(f'/playlists/{self.playlist_id}/bulk', json={'track_ids': ['nope']})
+        self.assertEqual(resp.get_json()['results'], [{'track_id': 'nope', 'status': 'not_found'}])
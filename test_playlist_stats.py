@@ -0,0 +1,112 @@
+import os
+from unittest import TestCase
+
+from models import db, User, Song, Like, Playlist, PlaylistSong, PlaylistStats
+
+os.environ['DATABASE_URL'] = "postgresql:///maestro-test"
+
+from app import app
+
+db.drop_all()
+db.create_all()
+
+
+class PlaylistStatsTestCase(TestCase):
+    """Running playlist stats follow adds, removals and analysis changes."""
+
+    def setUp(self):
+        Like.query.delete()
+        PlaylistStats.query.delete()
+        PlaylistSong.query.delete()
+        Song.query.delete()
+        Playlist.query.delete()
+        User.query.delete()
+
+        u = User.register(username="testuser", password="testpassword", email="none@none.com")
+        db.session.commit()
+        self.playlist = Playlist(name="stats", user_id=u.id)
+        db.session.add(self.playlist)
+        db.session.commit()
+        self.user_id = u.id
+        self.playlist_id = self.playlist.id
+
+        self.songs = [Song(track_id=f'track{i}', track_name=f'song{i}', track_uri=f'uri{i}',
+                           artist_name='artist', artist_id='artist1', tempo=tempo,
+                           loudness=-5.0, duration=3.0, key='C', mode='Major')
+                      for i, tempo in enumerate([100, 110, 120, 130])]
+        db.session.add_all(self.songs)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def add(self, songs):
+        db.session.add_all([PlaylistSong(playlist_id=self.playlist_id, song_id=song.id, user_id=self.user_id)
+                            for song in songs])
+        db.session.commit()
+
+    def stats(self):
+        db.session.expire_all()
+        return PlaylistStats.query.get(self.playlist_id)
+
+    def test_add_and_remove(self):
+        """Do the stats follow songs being added to and removed from a playlist?"""
+        self.add(self.songs)
+        stats = self.stats()
+        self.assertEqual(stats.song_count, 4)
+        self.assertEqual(stats.avg_tempo, 115)
+        self.assertEqual(stats.mean_loudness, -5)
+        self.assertEqual(stats.total_duration, 12)
+        self.assertEqual(stats.key_mode_histogram(), [('C Major', 4)])
+
+        for song in (self.songs[0], self.songs[3]):
+            db.session.delete(PlaylistSong.query.filter_by(song_id=song.id).one())
+        db.session.commit()
+        stats = self.stats()
+        self.assertEqual(stats.song_count, 2)
+        self.assertEqual(stats.avg_tempo, 115)
+        self.assertEqual(stats.tempo_histogram.get('100'), 0)
+        self.assertEqual((stats.tempo_percentile(0), stats.tempo_percentile(100)), (110, 120))
+
+    def test_analysis_change(self):
+        """Are a pending song's stats counted once its analysis arrives?"""
+        pending = Song(track_id='pending', track_uri='spotify:track:pending')
+        db.session.add(pending)
+        db.session.commit()
+        self.add([pending])
+        stats = self.stats()
+        self.assertEqual(stats.song_count, 1)
+        self.assertEqual(stats.tempo_count, 0)
+
+        pending.update_analysis({'track_name': 'late', 'tempo': 90.4, 'loudness': -7.0,
+                                 'duration': 2.5, 'key': 'A', 'mode': 'Minor'})
+        db.session.commit()
+        stats = self.stats()
+        self.assertEqual(stats.tempo_count, 1)
+        self.assertEqual(stats.avg_tempo, 90.4)
+        self.assertEqual(stats.tempo_histogram, {'90': 1})
+        self.assertEqual(stats.key_mode_histogram(), [('A Minor', 1)])
+
+    def test_matches_rebuild(self):
+        """Do the incrementally kept stats match a full rebuild?"""
+        self.add(self.songs[:2])
+        self.add(self.songs[2:])
+        self.songs[1].tempo = 150
+        db.session.commit()
+        stats = self.stats()
+        incremental = (stats.song_count, stats.tempo_sum, stats.key_mode_histogram())
+
+        PlaylistStats.rebuild(self.playlist_id)
+        db.session.commit()
+        stats = self.stats()
+        self.assertEqual((stats.song_count, stats.tempo_sum, stats.key_mode_histogram()), incremental)
+        self.assertEqual(stats.tempo_sum, 100 + 150 + 120 + 130)
+
+    def test_bulk_add(self):
+        """Are songs added in bulk counted like songs added one at a time?"""
+        PlaylistStats.add_songs(self.playlist_id, self.songs)
+        db.session.commit()
+        stats = self.stats()
+        self.assertEqual(stats.song_count, 4)
+        self.assertEqual(stats.tempo_percentile(50), 110)
+        self.assertEqual(stats.tempo_percentile(100), 130)
@@ -0,0 +1,65 @@
+import time
+from unittest import TestCase
+from unittest.mock import patch, Mock
+
+from shared_store import MemoryStore
+from rate_limit import TokenBucket, RateLimited
+from helper_functions import SpotifyClient
+
+
+class TokenBucketTestCase(TestCase):
+    """Test the shared token bucket."""
+
+    def test_burst_then_queue(self):
+        """Does a caller wait for a token once the burst is used up?"""
+        bucket = TokenBucket(MemoryStore(), rate=50, capacity=2)
+        start = time.time()
+        for _ in range(3):
+            bucket.acquire(time.time() + 1)
+        self.assertGreaterEqual(time.time() - start, 0.015)
+        stats = bucket.stats()
+        self.assertEqual((stats['acquired'], stats['queued'], stats['throttled']), (3, 1, 0))
+
+    def test_deadline(self):
+        """Is RateLimited raised when no token arrives before the deadline?"""
+        bucket = TokenBucket(MemoryStore(), rate=1, capacity=1)
+        bucket.acquire(time.time())
+        with self.assertRaises(RateLimited):
+            bucket.acquire(time.time() + 0.1)
+        self.assertEqual(bucket.stats()['throttled'], 1)
+
+    def test_pause_is_shared(self):
+        """Does a pause on one bucket hold back another on the same store?"""
+        store = MemoryStore()
+        TokenBucket(store, rate=100, capacity=10).pause(5)
+        with self.assertRaises(RateLimited):
+            TokenBucket(store, rate=100, capacity=10).acquire(time.time() + 1)
+
+
+class SpotifyClientRateLimitTestCase(TestCase):
+    """Test 429 handling in the Spotify client."""
+
+    def test_retry_after_pauses_and_retries(self):
+        """Is a 429 waited out through the bucket and the call retried?"""
+        bucket = TokenBucket(MemoryStore(), rate=100, capacity=10)
+        client = SpotifyClient(rate_limiter=bucket, queue_timeout=2)
+        limited = Mock(status_code=429, headers={'Retry-After': '0.05'})
+        ok = Mock(status_code=200)
+        ok.json.return_value = {'tracks': [None]}
+        with patch.object(client.session, 'get', side_effect=[limited, ok]) as get:
+            self.assertEqual(client.get_tracks(['track1'], 'token'), {})
+        self.assertEqual(get.call_count, 2)
+        limited.close.assert_called_once()
+        stats = bucket.stats()
+        self.assertEqual((stats['paused'], stats['acquired']), (1, 2))
+        self.assertGreaterEqual(stats['waited'], 0.04)
+
+    def test_gives_up_after_retries(self):
+        """Is the 429 raised once rate_limit_retries is used up?"""
+        client = SpotifyClient(queue_timeout=2, rate_limit_retries=1)
+        limited = Mock(status_code=429, headers={'Retry-After': '0'})
+        limited.raise_for_status.side_effect = RuntimeError('429')
+        with patch.object(client.session, 'get', return_value=limited) as get:
+            with self.assertRaises(RuntimeError):
+                client.get_tracks(['track1'], 'token')
+        self.assertEqual(get.call_count, 2)
@@ -0,0 +1,175 @@
+import os
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User, Song, Like, Playlist, PlaylistSong, PlaylistStats
+
+os.environ['DATABASE_URL'] = "postgresql:///maestro-test"
+
+from app import app
+from recommender import CoOccurrence, SongRecommender
+
+db.drop_all()
+db.create_all()
+
+
+class CoOccurrenceTestCase(TestCase):
+    """Test the item-item co-occurrence model."""
+
+    def setUp(self):
+        self.baskets = {
+            ('user', 1): {'a', 'b', 'c'},
+            ('user', 2): {'a', 'b'},
+            ('playlist', 1): {'b', 'c', 'd'},
+            ('playlist', 2): {'d', 'e'},
+        }
+
+    def test_neighbours(self):
+        """Are songs that share more baskets closer neighbours?"""
+        model = CoOccurrence(self.baskets)
+        self.assertEqual([track_id for track_id, _ in model.neighbours_of('a')], ['b', 'c'])
+        # b and a share 2 of b's 3 baskets and both of a's: 2 / sqrt(3 * 2)
+        self.assertAlmostEqual(model.neighbours_of('a')[0][1], 2 / 6 ** 0.5, places=5)
+        self.assertEqual(model.neighbours_of('missing'), [])
+
+    def test_neighbour_limit(self):
+        """Is every song's list cut to the configured number of neighbours?"""
+        model = CoOccurrence(self.baskets, neighbours=1)
+        self.assertEqual([track_id for track_id, _ in model.neighbours_of('d')], ['e'])
+
+    def test_recommend(self):
+        """Are a basket's own songs left out of its recommendations?"""
+        model = CoOccurrence(self.baskets)
+        recommended = [track_id for track_id, _ in model.recommend([('user', 2)])]
+        self.assertEqual(recommended, ['c', 'd'])
+        self.assertEqual(model.recommend([('user', 99)]), [])
+
+    def test_incremental_update_matches_rebuild(self):
+        """Do incremental adds and removals give the same lists as a rebuild?"""
+        for merge_cells in (100000, 1):
+            with self.subTest(merge_cells=merge_cells):
+                self.check_update_matches_rebuild(merge_cells)
+
+    def check_update_matches_rebuild(self, merge_cells):
+        self.setUp()
+        model = CoOccurrence(self.baskets, merge_cells=merge_cells)
+        model.update([
+            (('user', 2), 'e', 1),
+            (('user', 3), 'f', 1),
+            (('user', 3), 'a', 1),
+            (('playlist', 1), 'c', -1),
+            (('user', 1), 'a', 1),
+        ])
+        self.baskets[('user', 2)].add('e')
+        self.baskets[('user', 3)] = {'f', 'a'}
+        self.baskets[('playlist', 1)].discard('c')
+        rebuilt = CoOccurrence(self.baskets)
+        # Every song here shares a basket with a changed one, so all lists were refreshed.
+        for track_id in 'abcdef':
+            neighbours = sorted((other, round(score, 5)) for other, score in model.neighbours_of(track_id))
+            expected = sorted((other, round(score, 5)) for other, score in rebuilt.neighbours_of(track_id))
+            self.assertEqual(neighbours, expected, track_id)
+        self.assertEqual(model.recommend([('user', 3)]), rebuilt.recommend([('user', 3)]))
+        # With merge_cells=1 the overlay has been folded into the matrix.
+        self.assertEqual(model._overlay_cells == 0, merge_cells == 1)
+
+
+class SongRecommenderTestCase(TestCase):
+    """Test the model kept in step with the likes and playlist_songs tables."""
+
+    def setUp(self):
+        Like.query.delete()
+        PlaylistStats.query.delete()
+        PlaylistSong.query.delete()
+        Song.query.delete()
+        Playlist.query.delete()
+        User.query.delete()
+
+        self.users = [User.register(username=f"user{i}", password="testpassword", email=f"{i}@none.com")
+                      for i in range(3)]
+        db.session.add_all([Song(track_id=track_id, track_uri=f'uri{track_id}', track_name=track_id)
+                            for track_id in 'abcde'])
+        db.session.commit()
+        self.songs = {song.track_id: song for song in Song.query}
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def like(self, user, *track_ids):
+        for track_id in track_ids:
+            Like.like_song(user.id, track_id)
+        db.session.commit()
+
+    def test_committed_changes_are_applied(self):
+        """Are likes and playlist adds picked up without a rebuild?"""
+        first, second, third = self.users
+        self.like(first, 'a', 'b')
+        recommender = SongRecommender(rebuild_interval=3600)
+        self.assertEqual(recommender.recommend(second.id, []), [])
+        recommender.sync()
+        self.assertEqual(recommender.recommend(second.id, []), [])
+        with patch.object(recommender, '_load', side_effect=AssertionError('rebuilt')) as load:
+            with patch('recommender.recommender', recommender):
+                self.like(second, 'a')
+                self.assertEqual(recommender.recommend(second.id, []), ['b'])
+
+                playlist = Playlist(name='mix', user_id=third.id)
+                db.session.add(playlist)
+                db.session.commit()
+                db.session.add_all([PlaylistSong(playlist_id=playlist.id, song_id=self.songs[track_id].id,
+                                                 user_id=third.id) for track_id in 'ac'])
+                db.session.commit()
+                self.assertEqual(recommender.recommend(second.id, []), ['b', 'c'])
+                self.assertEqual(recommender.recommend(third.id, [playlist.id]), ['b'])
+
+                Like.unlike_song(first.id, 'b')
+                db.session.commit()
+                self.assertEqual(recommender.recommend(second.id, []), ['c'])
+        load.assert_not_called()
+
+    def test_rolled_back_changes_are_ignored(self):
+        """Are likes that were never committed left out?"""
+        first, second, _ = self.users
+        self.like(first, 'a', 'b')
+        recommender = SongRecommender(rebuild_interval=3600)
+        recommender.sync()
+        with patch('recommender.recommender', recommender):
+            Like.like_song(second.id, 'a')
+            db.session.flush()
+            db.session.rollback()
+        self.assertEqual(recommender.recommend(second.id, []), [])
+
+    def test_rebuild_does_not_block_recommend(self):
+        """Does the old model keep answering, and taking likes, while a rebuild loads?"""
+        first, second, third = self.users
+        self.like(first, 'a', 'b')
+        recommender = SongRecommender(rebuild_interval=3600)
+        recommender.sync()
+        loading, release = threading.Event(), threading.Event()
+        load = recommender._load
+
+        def slow_load():
+            result = load()
+            loading.set()
+            release.wait(5)
+            return result
+
+        with patch.object(recommender, '_load', side_effect=slow_load), \
+                patch('recommender.recommender', recommender):
+            def run():
+                with app.app_context():
+                    recommender.sync(force=True)
+
+            rebuild = threading.Thread(target=run)
+            rebuild.start()
+            self.assertTrue(loading.wait(5))
+            old_model = recommender.model
+            self.like(second, 'a')
+            self.assertEqual(recommender.recommend(second.id, []), ['b'])
+            self.assertIs(recommender.model, old_model)
+            release.set()
+            rebuild.join(5)
+        self.assertIsNot(recommender.model, old_model)
+        # The like committed after the build read the tables was replayed onto it.
+        self.assertEqual(recommender.recommend(second.id, []), ['b'])
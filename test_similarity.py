@@ -0,0 +1,129 @@
+import os
+from datetime import datetime, timedelta
+from unittest import TestCase
+import threading
+from unittest.mock import patch
+
+import numpy as np
+
+from models import db, Song, Like, PlaylistSong
+
+os.environ['DATABASE_URL'] = "postgresql:///maestro-test"
+
+from app import app
+from similarity import SimilarityIndex, SongSimilarity, features_of, N_FEATURES
+
+db.drop_all()
+db.create_all()
+
+
+def analysis(track_id, key='C', mode='Major', tempo=120, loudness=-8.0):
+    return {'track_id': track_id, 'key': key, 'mode': mode, 'tempo': tempo,
+            'loudness': loudness, 'duration': 3.5, 'time_signature': 4}
+
+
+class FeaturesTestCase(TestCase):
+    """Test the song feature vectors."""
+
+    def test_circle_of_fifths(self):
+        """Are keys a fifth apart closer than keys a tritone apart?"""
+        c = features_of(analysis('c', key='C'))
+        g = features_of(analysis('g', key='G'))
+        f = features_of(analysis('f', key='F'))
+        f_sharp = features_of(analysis('fs', key='F#/Gb'))
+        self.assertAlmostEqual(np.linalg.norm(c - g), np.linalg.norm(c - f), places=5)
+        self.assertLess(np.linalg.norm(c - g), np.linalg.norm(c - f_sharp))
+
+    def test_missing_features(self):
+        """Do pending songs without an analysis get no vector?"""
+        self.assertIsNone(features_of({'track_id': 'x', 'tempo': None}))
+        self.assertIsNotNone(features_of(analysis('x', key=None)))
+
+
+class SimilarityIndexTestCase(TestCase):
+    """Test the nearest-neighbour index."""
+
+    def test_query_matches_brute_force(self):
+        """Does the vectorized query return the true nearest rows in order?"""
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(5000, N_FEATURES)).astype(np.float32)
+        index = SimilarityIndex(capacity=16)
+        index.add_many([f't{i}' for i in range(5000)], vectors)
+        query = vectors[42]
+        expected = np.argsort(np.linalg.norm(vectors - query, axis=1))[1:6]
+        result = index.query(query, k=5, exclude=['t42'])
+        self.assertEqual([track_id for track_id, _ in result], [f't{i}' for i in expected])
+
+    def test_add_replaces_known_track(self):
+        """Is a re-added track updated in place rather than duplicated?"""
+        index = SimilarityIndex()
+        index.add('a', np.zeros(N_FEATURES))
+        index.add('b', np.ones(N_FEATURES))
+        index.add('a', np.ones(N_FEATURES) * 2)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.query(np.ones(N_FEATURES) * 2, k=1)[0][0], 'a')
+
+
+class SongSimilarityTestCase(TestCase):
+    """Test the index kept in step with the songs table."""
+
+    def setUp(self):
+        Like.query.delete()
+        PlaylistSong.query.delete()
+        Song.query.delete()
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def add_song(self, **kwargs):
+        data = analysis(**kwargs)
+        song = Song(track_name=data['track_id'], track_uri=f"uri{data['track_id']}",
+                    artist_name='artist', artist_id='artist1', **data)
+        db.session.add(song)
+        db.session.commit()
+
+    def test_new_songs_are_indexed_on_commit(self):
+        """Is a committed song found without reloading the index?"""
+        index = SongSimilarity(sync_interval=3600)
+        index.sync(force=True)
+        with patch('similarity.similarity', index):
+            self.add_song(track_id='slow', tempo=70, mode='Minor')
+            self.assertEqual(index.similar(analysis('q', tempo=125)), ['slow'])
+            self.add_song(track_id='fast', tempo=124)
+            self.assertEqual(index.similar(analysis('q', tempo=125), k=2), ['fast', 'slow'])
+        self.assertEqual(len(index.index), 2)
+
+    def test_sync_finds_rows_committed_late(self):
+        """Does a poll pick up a row committed after a newer one was seen?"""
+        def insert(track_id, analyzed_at):
+            # Written by another worker, so this one's mapper events don't see it.
+            db.engine.execute(Song.__table__.insert().values(
+                analysis(track_id), track_name=track_id, track_uri=f'uri{track_id}', analyzed_at=analyzed_at))
+
+        index = SongSimilarity(sync_interval=3600)
+        seen = datetime.utcnow()
+        insert('first', seen)
+        index.sync(force=True)
+        insert('late', seen - timedelta(seconds=1))
+        index.sync(force=True)
+        self.assertIn('late', index.index)
+
+
+    def test_load_runs_in_background(self):
+        """Does similar() answer [] at once while the index loads in the background?"""
+        self.add_song(track_id='slow', tempo=70)
+        index = SongSimilarity(sync_interval=3600)
+        release = threading.Event()
+        load = index._load
+
+        def slow_load(*args):
+            release.wait(5)
+            load(*args)
+
+        with patch.object(index, '_load', side_effect=slow_load):
+            index.start(app)
+            self.assertEqual(index.similar(analysis('q')), [])
+            release.set()
+            self.assertTrue(index.loaded.wait(5))
+        self.assertEqual(index.similar(analysis('q')), ['slow'])
@@ -0,0 +1,72 @@
+import os
+from datetime import datetime, timedelta
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, Song, Like, PlaylistSong
+
+os.environ['DATABASE_URL'] = "postgresql:///maestro-test"
+
+from app import app
+from song_analysis import get_song_analysis
+
+app.config['TESTING'] = True
+
+db.drop_all()
+db.create_all()
+
+ANALYSIS = {
+    'duration': 3.5,
+    'key': 'C',
+    'key_confidence': 80,
+    'mode': 'Major',
+    'mode_confidence': 70,
+    'time_signature': 4,
+    'time_signature_confidence': 90,
+    'tempo': 120,
+    'tempo_confidence': 60,
+    'loudness': -5.0,
+    'track_id': 'track1',
+    'track_name': 'Song',
+    'track_uri': 'spotify:track:track1',
+    'artist_name': 'Artist',
+    'artist_id': 'artist1',
+    'album': 'Album',
+    'album_id': 'album1',
+    'album_art': 'http://img',
+}
+
+
+@patch('song_analysis.get_token', return_value='token')
+class SongAnalysisTestCase(TestCase):
+    """Test the Song-backed audio analysis cache."""
+
+    def setUp(self):
+        Like.query.delete()
+        PlaylistSong.query.delete()
+        Song.query.delete()
+        db.session.commit()
+        app.config['ANALYSIS_MAX_AGE'] = None
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_miss_then_hit(self, get_token):
+        """Is Spotify only called for a track that isn't stored yet?"""
+        with app.app_context(), patch('song_analysis.get_audio_analysis', return_value=ANALYSIS) as fetch:
+            self.assertEqual(get_song_analysis('track1'), ANALYSIS)
+            self.assertEqual(get_song_analysis('track1')['tempo'], 120)
+        self.assertEqual(fetch.call_count, 1)
+        self.assertIsNotNone(Song.get_song('track1').analyzed_at)
+
+    def test_stale_row_is_refreshed(self, get_token):
+        """Is a row older than ANALYSIS_MAX_AGE fetched again?"""
+        song = Song.create_song(dict(ANALYSIS, tempo=90))
+        song.analyzed_at = datetime.utcnow() - timedelta(days=2)
+        db.session.add(song)
+        db.session.commit()
+        app.config['ANALYSIS_MAX_AGE'] = 3600
+        with app.app_context(), patch('song_analysis.get_audio_analysis', return_value=ANALYSIS) as fetch:
+            self.assertEqual(get_song_analysis('track1')['tempo'], 120)
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(Song.get_song('track1').tempo, 120)
@@ -0,0 +1,233 @@
+import copy
+import json
+import time
+from unittest import TestCase
+from unittest.mock import patch, Mock
+
+import requests
+
+from helper_functions import SpotifyClient, run_parallel, extract_json_member
+
+
+def mock_response(json_data, status_code=200):
+    response = Mock(status_code=status_code)
+    response.json.return_value = json_data
+    body = json.dumps(json_data).encode()
+    response.iter_content.side_effect = lambda chunk_size: (
+        body[i:i + chunk_size] for i in range(0, len(body), chunk_size))
+    return response
+
+
+TRACK = {
+    'id': 'track1',
+    'name': 'Song',
+    'uri': 'spotify:track:track1',
+    'artists': [{'name': 'Artist', 'id': 'artist1'}],
+    'album': {'name': 'Album', 'id': 'album1', 'images': [{'url': 'http://img'}]},
+}
+
+
+class SpotifyClientTestCase(TestCase):
+    """Test the pooled Spotify client."""
+
+    def setUp(self):
+        self.client = SpotifyClient(pool_maxsize=8, connect_timeout=1, read_timeout=2, retries=2)
+
+    def test_session_is_pooled(self):
+        """Is one adapter with the configured pool and retries mounted?"""
+        adapter = self.client.session.get_adapter('https://api.spotify.com/v1/tracks/x')
+        self.assertEqual(adapter._pool_maxsize, 8)
+        self.assertEqual(adapter.max_retries.total, 2)
+
+    def test_get_track_info_uses_session_and_timeout(self):
+        """Do calls go through the shared session with a timeout?"""
+        with patch.object(self.client.session, 'get', return_value=mock_response(TRACK)) as get:
+            info = self.client.get_track_info('track1', 'token')
+        self.assertEqual(info['track_name'], 'Song')
+        self.assertEqual(info['album_id'], 'album1')
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(get.call_args.kwargs['timeout'], (1, 2))
+        self.assertEqual(get.call_args.kwargs['headers'], {'Authorization': 'Bearer token'})
+
+    def test_album_cache(self):
+        """Do album, tracks and art share one cached /albums fetch?"""
+        album = {
+            'id': 'album1',
+            'name': 'Album',
+            'images': [{'url': 'http://img'}],
+            'artists': [{'name': 'Artist', 'id': 'artist1'}],
+            'release_date': '2020-01-01',
+            'total_tracks': 1,
+            'popularity': 50,
+            'tracks': {'items': [dict(TRACK, duration_ms=180000, explicit=False, track_number=1)]},
+        }
+        original = copy.deepcopy(album)
+        with patch.object(self.client.session, 'get', return_value=mock_response(album)) as get:
+            self.assertEqual(self.client.get_album('album1', 'token')['album_name'], 'Album')
+            self.assertEqual(len(self.client.get_album_tracks('album1', 'token')), 1)
+            self.assertEqual(self.client.get_album_art('album1', 'token'), 'http://img')
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(get.return_value.json.call_count, 1)
+        stats = self.client.album_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+        # The cached payload is shared, so readers must leave it as fetched.
+        self.assertEqual(self.client.get_album_payload('album1', 'token'), original)
+
+    def test_audio_analysis_fetches_in_parallel(self):
+        """Does get_audio_analysis combine the analysis and track info?"""
+        analysis = {'meta': {}, 'track': {
+            'duration': 180, 'key': 0, 'key_confidence': 0.5, 'mode': 1,
+            'mode_confidence': 0.5, 'time_signature': 4, 'time_signature_confidence': 1,
+            'tempo': 120.4, 'tempo_confidence': 0.5, 'loudness': -5.0,
+        }, 'segments': [{'start': 0.1}] * 1000}
+
+        def get(url, **kwargs):
+            return mock_response(analysis if 'audio-analysis' in url else TRACK)
+
+        with patch.object(self.client.session, 'get', side_effect=get):
+            result = self.client.get_audio_analysis('track1', 'token')
+        self.assertEqual(result['key'], 'C')
+        self.assertEqual(result['mode'], 'Major')
+        self.assertEqual(result['tempo'], 120)
+        self.assertEqual(result['track_name'], 'Song')
+
+
+    def test_search_cache_and_pagination(self):
+        """Are equivalent searches cached and pages fetched by offset?"""
+        body = {'tracks': {'items': [TRACK]}}
+        with patch.object(self.client.session, 'get', return_value=mock_response(body)) as get:
+            first = self.client.generic_search('track', 'Daft  Punk ', 'token')
+            self.client.generic_search('track', 'daft punk', 'token')
+            self.client.generic_search('track', 'daft punk', 'token', offset=10)
+        self.assertEqual(first[0]['track_id'], 'track1')
+        self.assertEqual(get.call_count, 2)
+        params = get.call_args.kwargs['params']
+        self.assertEqual((params['q'], params['offset'], params['limit']), ('daft punk', 10, 10))
+
+    def test_album_payload_fetches_every_track_page(self):
+        """Does a 120-track album come back with all its tracks?"""
+        def track(i):
+            return dict(TRACK, id=f'track{i}', duration_ms=180000, explicit=False, track_number=i)
+
+        def get(url, **kwargs):
+            if url.endswith('/tracks'):
+                offset = kwargs['params']['offset']
+                return mock_response({'items': [track(i) for i in range(offset, min(offset + 50, 120))]})
+            return mock_response({'id': 'album1', 'tracks': {
+                'items': [track(i) for i in range(50)], 'total': 120, 'next': 'more'}})
+
+        with patch.object(self.client.session, 'get', side_effect=get) as get_mock:
+            payload = self.client.get_album_payload('album1', 'token')
+        self.assertEqual([item['id'] for item in payload['tracks']['items']], [f'track{i}' for i in range(120)])
+        self.assertEqual(get_mock.call_count, 3)
+
+    def test_get_albums_fetches_every_page(self):
+        """Are all discography pages fetched, deduplicated and cached?"""
+        def album(i):
+            return {'id': f'album{i}', 'name': f'Album {i}', 'images': [],
+                    'artists': [{'name': 'Artist', 'id': 'artist1'}],
+                    'release_date': '2020-01-01', 'total_tracks': 10}
+
+        def get(url, **kwargs):
+            offset = kwargs['params']['offset']
+            items = [album(i) for i in range(offset, min(offset + 50, 120))]
+            if offset == 100:
+                items.append(album(0))
+            return mock_response({'items': items, 'total': 120})
+
+        with patch.object(self.client.session, 'get', side_effect=get) as get_mock:
+            albums = self.client.get_albums('artist1', 'token', 'album,single')
+            self.client.get_albums('artist1', 'token', 'album,single')
+        self.assertEqual(len(albums), 120)
+        self.assertEqual(albums[-1]['album_id'], 'album119')
+        self.assertEqual(get_mock.call_count, 3)
+        offsets = sorted(call.kwargs['params']['offset'] for call in get_mock.call_args_list)
+        self.assertEqual(offsets, [0, 50, 100])
+        self.assertEqual(get_mock.call_args.kwargs['params']['include_groups'], 'album,single')
+
+
+    def test_get_tracks_uses_track_cache(self):
+        """Are tracks fetched once and then served from the track cache?"""
+        with patch.object(self.client.session, 'get', return_value=mock_response({'tracks': [TRACK]})) as get:
+            self.client.get_tracks(['track1'], 'token')
+            tracks = self.client.get_tracks(['track1'], 'token')
+        self.assertEqual(tracks['track1']['track_name'], 'Song')
+        self.assertEqual(get.call_count, 1)
+
+    def test_401_renews_token_and_retries_once(self):
+        """Is a rejected token swapped for a fresh one and the call retried once?"""
+        rejected = mock_response({}, status_code=401)
+        rejected.raise_for_status.side_effect = requests.HTTPError(response=rejected)
+        renewed = []
+        self.client.renew_token = lambda token: renewed.append(token) or 'fresh'
+        with patch.object(self.client.session, 'get', side_effect=[rejected, mock_response(TRACK)]) as get:
+            info = self.client.get_track_info('track1', 'stale')
+        self.assertEqual(info['track_name'], 'Song')
+        self.assertEqual(renewed, ['stale'])
+        self.assertEqual(get.call_args.kwargs['headers'], {'Authorization': 'Bearer fresh'})
+
+    def test_get_track_info_uses_track_cache(self):
+        """Do single-track lookups share the track cache with get_tracks?"""
+        with patch.object(self.client.session, 'get', return_value=mock_response({'tracks': [TRACK]})) as get:
+            self.client.get_tracks(['track1'], 'token')
+            info = self.client.get_track_info('track1', 'token')
+        self.assertEqual(info['track_name'], 'Song')
+        self.assertEqual(get.call_count, 1)
+
+
+class ExtractJsonMemberTestCase(TestCase):
+    """Test the streaming JSON member extractor."""
+
+    def test_extract_across_chunk_boundaries(self):
+        """Is the member found whatever the chunk size?"""
+        data = {'meta': {'note': 'not "track": here'}, 'track': {'tempo': 120.5, 'name': 'é'},
+                'bars': [{'track': 1}] * 10}
+        body = json.dumps(data, ensure_ascii=False).encode()
+        for size in (1, 3, 64, len(body)):
+            chunks = [body[i:i + size] for i in range(0, len(body), size)]
+            self.assertEqual(extract_json_member(chunks, 'track'), data['track'])
+
+    def test_stops_reading_after_member(self):
+        """Are chunks after the member left unread?"""
+        read = []
+
+        def chunks():
+            for chunk in (b'{"track": {"a": 1}, ', b'"bars": [', b'1]}'):
+                read.append(chunk)
+                yield chunk
+
+        self.assertEqual(extract_json_member(chunks(), 'track'), {'a': 1})
+        self.assertEqual(len(read), 1)
+
+    def test_missing_member(self):
+        """Is a missing member a KeyError?"""
+        with self.assertRaises(KeyError):
+            extract_json_member([b'{"meta": {"track": 1}}'], 'track')
+
+
+class RunParallelTestCase(TestCase):
+    """Test the upstream fan-out helper."""
+
+    def test_results_in_order_and_concurrent(self):
+        """Are calls run at the same time and returned in order?"""
+        def slow(value):
+            time.sleep(0.1)
+            return value
+
+        start = time.monotonic()
+        result = run_parallel(lambda: slow(1), lambda: slow(2), lambda: slow(3))
+        self.assertEqual(result, [1, 2, 3])
+        self.assertLess(time.monotonic() - start, 0.25)
+
+    def test_error_propagates(self):
+        """Is an error from one call raised to the caller?"""
+        def fail():
+            raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            run_parallel(lambda: 1, fail)
+
+    def test_nested_calls_run_inline(self):
+        """Can a call in the pool fan out again without deadlocking?"""
+        inner = lambda: run_parallel(lambda: 1, lambda: 2)
+        self.assertEqual(run_parallel(*[inner] * 20), [[1, 2]] * 20)
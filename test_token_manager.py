@@ -0,0 +1,103 @@
+import time
+import tempfile
+import threading
+from unittest import TestCase
+
+from shared_store import MemoryStore, FileStore
+from token_manager import TokenManager, TokenUnavailable
+
+
+class TokenManagerTestCase(TestCase):
+    """Test the cached Spotify token manager."""
+
+    def setUp(self):
+        self.calls = 0
+
+    def fetch(self, expires_in=3600):
+        self.calls += 1
+        return f'token{self.calls}', expires_in
+
+    def test_token_is_cached(self):
+        """Does the token manager only fetch once while the token is fresh?"""
+        manager = TokenManager(self.fetch, MemoryStore())
+        self.assertEqual(manager.get_token(), 'token1')
+        self.assertEqual(manager.get_token(), 'token1')
+        self.assertEqual(self.calls, 1)
+
+    def test_refresh_before_expiry(self):
+        """Does a token close to expiry get refreshed without blocking?"""
+        store = MemoryStore()
+        store.set(TokenManager.KEY, {'access_token': 'old', 'expires_at': time.time() + 60})
+        manager = TokenManager(self.fetch, store, refresh_margin=300)
+        self.assertEqual(manager.get_token(), 'old')
+        for _ in range(50):
+            if store.get(TokenManager.KEY)['access_token'] == 'token1':
+                break
+            time.sleep(0.01)
+        self.assertEqual(manager.get_token(), 'token1')
+        self.assertEqual(self.calls, 1)
+
+    def test_expired_token_is_replaced(self):
+        """Does an expired token get fetched again?"""
+        store = MemoryStore()
+        store.set(TokenManager.KEY, {'access_token': 'old', 'expires_at': time.time() - 1})
+        manager = TokenManager(self.fetch, store)
+        self.assertEqual(manager.get_token(), 'token1')
+
+    def test_single_refresh_across_threads(self):
+        """Do concurrent callers share one fetch?"""
+        def slow_fetch():
+            time.sleep(0.05)
+            return self.fetch()
+
+        manager = TokenManager(slow_fetch, MemoryStore())
+        threads = [threading.Thread(target=manager.get_token) for _ in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.calls, 1)
+
+    def test_file_store_shared_between_managers(self):
+        """Do two managers (workers) on one file store share a token?"""
+        directory = tempfile.mkdtemp()
+        first = TokenManager(self.fetch, FileStore(directory))
+        second = TokenManager(self.fetch, FileStore(directory))
+        self.assertEqual(first.get_token(), 'token1')
+        self.assertEqual(second.get_token(), 'token1')
+        self.assertEqual(self.calls, 1)
+
+    def test_lock_timeout_uses_token_stored_by_other_worker(self):
+        """Does a caller that times out on the lock use the token another worker stored?"""
+        store = MemoryStore()
+        manager = TokenManager(self.fetch, store)
+
+        def locked(key, blocking=True, timeout=10):
+            store.set(TokenManager.KEY, {'access_token': 'other', 'expires_at': time.time() + 3600})
+            return lock(key, blocking=False)
+
+        lock = store.lock
+        with lock(TokenManager.KEY):
+            store.lock = locked
+            self.assertEqual(manager.get_token(), 'other')
+        self.assertEqual(self.calls, 0)
+
+    def test_lock_timeout_without_token_raises(self):
+        """Does a caller that times out on the lock with no token get a clear error?"""
+        store = MemoryStore()
+        manager = TokenManager(self.fetch, store)
+        lock = store.lock
+        with lock(TokenManager.KEY):
+            store.lock = lambda key, blocking=True, timeout=10: lock(key, blocking=False)
+            with self.assertRaises(TokenUnavailable):
+                manager.get_token()
+        self.assertEqual(self.calls, 0)
+
+    def test_replace_rejected_token(self):
+        """Does a rejected token get replaced, but a token another worker just fetched get kept?"""
+        store = MemoryStore()
+        manager = TokenManager(self.fetch, store)
+        self.assertEqual(manager.get_token(), 'token1')
+        self.assertEqual(manager.replace('token1'), 'token2')
+        self.assertEqual(manager.replace('token1'), 'token2')
+        self.assertEqual(self.calls, 2)
@@ -184,4 +184,52 @@ class UserViewTestCase(TestCase):
             resp = c.get(f"/user/logout", follow_redirects=True)
 
             self.assertEqual(resp.status_code, 200)
-            self.assertIn('Login', str(resp.data))
\ No newline at end of file
+            self.assertIn('Login', str(resp.data))
+
+    def test_deleted_user_is_logged_out(self):
+        """Is a session pointing at a deleted user cleared instead of looping?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = -1
+
+            # The profile catches every exception, UserNotFound included.
+            resp = c.get("/user/")
+
+            self.assertEqual(resp.status_code, 302)
+            self.assertTrue(resp.location.endswith("/"))
+            with c.session_transaction() as sess:
+                self.assertNotIn(CURR_USER_KEY, sess)
+            resp = c.get("/")
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("Please log in again.", str(resp.data))
+
+    def test_login_throttle(self):
+        """Are logins refused without checking the password after repeated failures?"""
+        from routes.user import username_throttle
+        username_throttle.reset("testuser")
+        try:
+            for _ in range(username_throttle.max_attempts):
+                self.client.post("/user/login", data={"username": "testuser", "password": "wrongpassword"})
+            resp = self.client.post("/user/login", data={"username": "testuser", "password": "testpassword"})
+            self.assertEqual(resp.status_code, 429)
+        finally:
+            username_throttle.reset("testuser")
+
+    def test_ip_throttle_uses_forwarded_client(self):
+        """Are failed logins throttled per client address behind the router?"""
+        from routes.user import ip_throttle
+        attacker, client = "203.0.113.1", "203.0.113.2"
+        for ip in (attacker, client):
+            ip_throttle.reset(ip)
+        try:
+            for i in range(ip_throttle.max_attempts):
+                self.client.post("/user/login", data={"username": f"nobody{i}", "password": "wrongpassword"},
+                                 headers={"X-Forwarded-For": attacker})
+            self.assertTrue(ip_throttle.is_blocked(attacker))
+            resp = self.client.post("/user/login", data={"username": "testuser", "password": "testpassword"},
+                                    headers={"X-Forwarded-For": client})
+            self.assertEqual(resp.status_code, 302)
+        finally:
+            for ip in (attacker, client):
+                ip_throttle.reset(ip)
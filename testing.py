@@ -0,0 +1,35 @@
+"""Helpers shared by the test modules."""
+
+import threading
+
+from sqlalchemy import event
+
+from models import db
+
+
+class QueryCounter:
+    """Count (and keep) the SQL statements sent to the database.
+
+    Only statements from the thread that entered the counter are kept, so
+    background loads (see SongSimilarity.start) don't skew request counts.
+    """
+
+    def __init__(self):
+        self.statements = []
+        self._thread = None
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __call__(self, conn, cursor, statement, *args):
+        if threading.get_ident() == self._thread:
+            self.statements.append(statement)
+
+    def __enter__(self):
+        self._thread = threading.get_ident()
+        event.listen(db.engine, 'before_cursor_execute', self)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(db.engine, 'before_cursor_execute', self)
@@ -0,0 +1,102 @@
+"""Cached Spotify access token shared between requests and workers."""
+
+import threading
+import time
+
+
+class TokenUnavailable(RuntimeError):
+    """No valid token: the refresh lock timed out and no other worker stored one."""
+
+
+class TokenManager:
+    """Hand out a cached client-credentials token and refresh it early.
+
+    ``fetch`` is a callable returning ``(access_token, expires_in)``. The
+    token is kept in ``store`` (see shared_store) so every worker using the
+    same store reuses it. Once the token is within ``refresh_margin`` seconds
+    of expiring, callers still get the current token while one background
+    thread fetches the next one. Only an absent or expired token makes a
+    caller wait, and the store lock makes sure only one caller fetches.
+    """
+
+    KEY = 'spotify_token'
+
+    def __init__(self, fetch, store, refresh_margin=300):
+        self.fetch = fetch
+        self.store = store
+        self.refresh_margin = refresh_margin
+        self._local = None
+        self._background = threading.Lock()
+
+    def get_token(self):
+        """Return a valid access token, fetching one only when needed."""
+        token = self._current()
+        now = time.time()
+        if token and token['expires_at'] - now > self.refresh_margin:
+            return token['access_token']
+        if token and token['expires_at'] > now:
+            self._refresh_in_background()
+            return token['access_token']
+        token = self._refresh()
+        if token is None:
+            # Another worker held the lock for the whole wait; use its token if it stored one.
+            token = self.store.get(self.KEY)
+            if not token or token['expires_at'] <= time.time():
+                raise TokenUnavailable('timed out waiting for the Spotify token refresh')
+            self._local = token
+        return token['access_token']
+
+    def invalidate(self, token=None):
+        """Forget the cached token, e.g. after Spotify answered 401.
+
+        With token, the shared copy is only dropped if it is still that
+        token, so a worker late to notice does not discard a fresh one.
+        """
+        self._local = None
+        stored = self.store.get(self.KEY)
+        if token is None or (stored and stored['access_token'] == token):
+            self.store.delete(self.KEY)
+
+    def replace(self, token):
+        """Return a fresh token in place of token, which Spotify rejected."""
+        self.invalidate(token)
+        return self.get_token()
+
+    def _current(self):
+        local = self._local
+        if local and local['expires_at'] - time.time() > self.refresh_margin:
+            return local
+        token = self.store.get(self.KEY)
+        if token:
+            self._local = token
+        return token
+
+    def _refresh(self, blocking=True):
+        with self.store.lock(self.KEY, blocking=blocking) as acquired:
+            if not acquired:
+                return None
+            # Another worker may have refreshed while we waited for the lock.
+            token = self.store.get(self.KEY)
+            if token and token['expires_at'] - time.time() > self.refresh_margin:
+                self._local = token
+                return token
+            access_token, expires_in = self.fetch()
+            token = {'access_token': access_token, 'expires_at': time.time() + expires_in}
+            self.store.set(self.KEY, token, ttl=expires_in)
+            self._local = token
+            return token
+
+    def _refresh_in_background(self):
+        if not self._background.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self._refresh(blocking=False)
+            except Exception:
+                # The current token is still valid; the next caller retries.
+                pass
+            finally:
+                self._background.release()
+
+        threading.Thread(target=run, daemon=True).start()